@@ -23,6 +23,8 @@ are typically placed in ~/.bangrc.
 from . import (  # noqa
         ansible,
         creds,
+        daemon,
+        inventory_cache,
         server,
         secgroup,
         tags,
@@ -30,6 +32,9 @@ from . import (  # noqa
         ssh_key,
         loadbalancer,
         logging,
+        playbook,
+        polling,
+        rate_limit,
         rightscale,
         )
 
@@ -52,6 +57,8 @@ PLAYBOOKS = 'playbooks'
 #: the associated resource.
 PROVIDER = 'provider'
 
+REGION = 'region_name'
+
 #: A dict containing credentials for various cloud providers in which the keys
 #: can be any valid provider.  E.g.  ``aws``, ``hpcloud``.
 DEPLOYER_CREDS = 'deployer_credentials'
@@ -109,3 +116,13 @@ KEY = 'key'
 SERVER_CLASS = 'server_class'
 
 ANNOY_ME = 'annoy_me'
+
+POLLING = 'polling'
+
+RATE_LIMITS = 'rate_limits'
+
+#: The top-level key for tuning the on-disk ``--list`` inventory cache.
+INVENTORY_CACHE = 'inventory_cache'
+
+#: The top-level key for the ``bang --daemon`` settings.
+DAEMON = 'daemon'
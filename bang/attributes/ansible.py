@@ -6,3 +6,36 @@ ASK_VAULT_PASS = 'ask_vault_pass'
 
 #: The string used to decrypt any ansible vaults referenced in playbooks
 VAULT_PASS = 'vault_pass'
+
+#: The number of parallel ansible processes.  Unset to let bang choose.
+FORKS = 'forks'
+
+#: When bang chooses the forks: the most forks to start per CPU.
+FORKS_PER_CPU = 'forks_per_cpu'
+
+#: When bang chooses the forks: the memory to budget for each fork in MB.
+MEMORY_PER_FORK_MB = 'memory_per_fork_mb'
+
+#: When bang chooses the forks: never start more than this many.
+MAX_FORKS = 'max_forks'
+
+#: A boolean controlling whether to open SSH connections to every host before
+#: running the playbooks.  Defaults to ``True``.
+PREWARM_SSH = 'prewarm_ssh'
+
+#: How many more times to try the hosts that could not be reached when
+#: pre-warming SSH connections.
+PREWARM_RETRIES = 'prewarm_retries'
+
+#: A mapping of inventory group names to lists of the groups that must be
+#: configured before them when deploying and configuring in a pipeline.
+GROUP_DEPENDENCIES = 'group_dependencies'
+
+#: A list of inventory groups whose hosts are all reconfigured by
+#: ``--configure-changed`` whenever a host joins or leaves the group.
+RECONFIGURE_GROUPS = 'reconfigure_groups'
+
+#: A boolean controlling whether to skip the hosts whose playbooks, roles,
+#: common_modules, vars files and hostvars are all unchanged since the host
+#: was last configured successfully.  Defaults to ``False``.
+MEMOIZE_RESULTS = 'memoize_results'
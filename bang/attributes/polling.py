@@ -0,0 +1,34 @@
+# Copyright 2014 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+WAKE_EVERY = 'wake_every_s'
+MAX_WAKE = 'max_wake_s'
+BACKOFF = 'backoff'
+JITTER = 'jitter'
+FAST_PHASE = 'fast_phase_s'
+FAST_WAKE = 'fast_wake_s'
+
+ALL = (WAKE_EVERY, MAX_WAKE, BACKOFF, JITTER, FAST_PHASE, FAST_WAKE)
+
+# the readiness probes (see bang.util.wait_for_tcp_port) poll far more often
+# than the provider APIs for their resource types, so they are tuned under
+# their own names.
+
+#: Waiting for new servers to accept SSH connections.
+SSH_PROBE = 'ssh'
+
+#: Waiting for new databases to accept connections.
+DB_PORT_PROBE = 'database_ports'
@@ -36,6 +36,7 @@ PROVIDER = 'provider'
 INV_NAME = 'inventory_hostname'
 INV_NAME_SHORT = 'inventory_hostname_short'
 GROUP_NAMES = 'group_names'
+SSH_PORT = 'ansible_ssh_port'
 PRIVATE_IP = 'private_ip'
 
 #: Provides the server definition from the Bang config as a fact available to
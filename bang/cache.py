@@ -0,0 +1,524 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+On-disk cache for the ``--list`` and ``--host`` inventory.
+
+Ansible runs ``bang --list`` once per ad-hoc command.  Gathering the inventory
+means querying every cloud API used by the stack, so the result is cached and
+reused until it expires.
+
+Each cache is a small sqlite database keyed by a hash of the merged config.
+The hostvars are stored one row per host, so that answering ``--host`` only
+reads and deserializes the vars for that one host.
+
+The same directory also keeps a record of the hostvars and groups each stack
+was last configured with (see :class:`ConfigureState`), so that
+``--configure-changed`` can tell which hosts need configuring, and the
+parsed config files (see :class:`ConfigCache`).
+
+"""
+import contextlib
+import errno
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import bang
+from . import attributes as A
+from .util import log
+
+
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'bang')
+
+DEFAULT_TTL_S = 300
+
+_SCHEMA = (
+        'CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)',
+        'CREATE TABLE groups (name TEXT PRIMARY KEY, hosts TEXT)',
+        'CREATE TABLE hostvars (host TEXT PRIMARY KEY, vars TEXT)',
+        )
+
+
+def config_hash(config):
+    """
+    Returns a stable hash of the merged :attr:`config` (and the bang version,
+    so that upgrading bang never serves an inventory in an old format).
+
+    """
+    digest = hashlib.sha1(bang.VERSION)
+    digest.update(json.dumps(config, sort_keys=True, default=str))
+    return digest.hexdigest()
+
+
+def hostvars_hash(hostvars):
+    """Returns a stable hash of one host's :attr:`hostvars`."""
+    return hashlib.sha1(
+            json.dumps(hostvars, sort_keys=True, default=str)
+            ).hexdigest()
+
+
+def tree_hash(*paths):
+    """
+    Returns a hash of the names and contents of every file under each of the
+    :attr:`paths`.  Missing paths hash the same as empty ones.
+
+    """
+    digest = hashlib.sha1()
+    for top in paths:
+        digest.update('\0%s\0' % top)
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update('%s\0' % os.path.relpath(path, top))
+                try:
+                    with open(path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(65536), ''):
+                            digest.update(chunk)
+                except IOError as e:
+                    log.debug('Could not hash %s: %s' % (path, e))
+    return digest.hexdigest()
+
+
+def _stack_prefix(config):
+    cfg = config.get(A.INVENTORY_CACHE, {})
+    cache_dir = os.path.expanduser(
+            cfg.get(A.inventory_cache.DIR, DEFAULT_CACHE_DIR)
+            )
+    stack = re.sub(r'[^\w.-]', '_', config.get(A.NAME, 'anonymous'))
+    return cache_dir, os.path.join(cache_dir, stack)
+
+
+def _write_private(path, data):
+    """
+    Atomically replaces the file at :attr:`path` with :attr:`data`, readable
+    only by its owner.
+
+    """
+    cache_dir = os.path.dirname(path)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, 0700)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class InventoryCache(object):
+    """
+    Stores the inventory for one stack config.
+
+    Tuned by the ``inventory_cache`` stanza in ~/.bangrc::
+
+        inventory_cache:
+          ttl_s: 300
+          dir: ~/.cache/bang
+
+    """
+    def __init__(self, config):
+        cfg = config.get(A.INVENTORY_CACHE, {})
+        self.ttl_s = cfg.get(A.inventory_cache.TTL, DEFAULT_TTL_S)
+
+        # every cache file for a stack shares a prefix so that a deploy can
+        # invalidate them all, even those written for other config versions.
+        self.cache_dir, self.prefix = _stack_prefix(config)
+        self.path = '%s-%s.sqlite' % (self.prefix, config_hash(config))
+
+    @property
+    def enabled(self):
+        return self.ttl_s > 0
+
+    @contextlib.contextmanager
+    def _fresh_db(self):
+        """
+        Yields a connection to the cache database if it exists and has not
+        expired, otherwise yields ``None``.
+
+        """
+        db = None
+        if self.enabled and os.path.exists(self.path):
+            try:
+                db = sqlite3.connect(self.path)
+                row = db.execute(
+                        "SELECT value FROM meta WHERE key = 'created'"
+                        ).fetchone()
+                age = time.time() - float(row[0]) if row else -1
+                if not 0 <= age < self.ttl_s:
+                    db.close()
+                    db = None
+            except sqlite3.Error as e:
+                log.debug('Ignoring inventory cache %s: %s' % (self.path, e))
+                if db:
+                    db.close()
+                db = None
+        try:
+            yield db
+        finally:
+            if db:
+                db.close()
+
+    def load(self):
+        """
+        Returns the cached inventory, or ``None`` if there is no fresh one.
+        """
+        with self._fresh_db() as db:
+            if not db:
+                return
+            inventory = dict(
+                    (name, json.loads(hosts))
+                    for name, hosts in db.execute(
+                        'SELECT name, hosts FROM groups'
+                        )
+                    )
+            inventory['_meta'] = {
+                    'hostvars': dict(
+                        (host, json.loads(hvars))
+                        for host, hvars in db.execute(
+                            'SELECT host, vars FROM hostvars'
+                            )
+                        ),
+                    }
+            return inventory
+
+    def load_host(self, hostname):
+        """
+        Returns the cached hostvars for :attr:`hostname`, or ``None`` if there
+        is no fresh cache.  Hosts that are not in a fresh cache have no vars,
+        so they get an empty :class:`dict`.
+
+        """
+        with self._fresh_db() as db:
+            if not db:
+                return
+            row = db.execute(
+                    'SELECT vars FROM hostvars WHERE host = ?',
+                    (hostname,),
+                    ).fetchone()
+            return json.loads(row[0]) if row else {}
+
+    def save(self, inventory):
+        """
+        Writes :attr:`inventory` to the cache.
+
+        The inventory contains hostvars derived from the config, so the file is
+        only readable by its owner.  Failures to write are logged and ignored:
+        the cache is only an optimization.
+
+        """
+        if not self.enabled:
+            return
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        groups = dict(inventory)
+        hostvars = groups.pop('_meta', {}).get('hostvars', {})
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, 0700)
+            os.close(
+                    os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                        0600)
+                    )
+            db = sqlite3.connect(tmp_path)
+            try:
+                for statement in _SCHEMA:
+                    db.execute(statement)
+                db.execute(
+                        "INSERT INTO meta VALUES ('created', ?)",
+                        (repr(time.time()),),
+                        )
+                db.executemany(
+                        'INSERT INTO groups VALUES (?, ?)',
+                        ((k, json.dumps(v)) for k, v in groups.iteritems()),
+                        )
+                db.executemany(
+                        'INSERT INTO hostvars VALUES (?, ?)',
+                        ((k, json.dumps(v)) for k, v in hostvars.iteritems()),
+                        )
+                db.commit()
+            finally:
+                db.close()
+            # atomic, so concurrent readers never see a partial cache
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError, sqlite3.Error) as e:
+            log.debug('Could not write inventory cache %s: %s' % (self.path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def invalidate(self):
+        """Removes every cached inventory for this stack."""
+        hex_hash = '[0-9a-f]' * 40
+        for path in glob.glob('%s-%s.sqlite' % (self.prefix, hex_hash)):
+            try:
+                os.remove(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+class ConfigureState(object):
+    """
+    Records the hostvars (as hashes) and group memberships that a stack's
+    hosts were last successfully configured with.  When playbook results are
+    memoized, it also records the key of each host's last successful run.
+
+    Unlike the inventory cache, this never expires and deploys do not
+    invalidate it.
+
+    """
+    def __init__(self, config):
+        _, prefix = _stack_prefix(config)
+        self.path = '%s.configured.json' % prefix
+        self.hosts = {}
+        self.groups = {}
+        self.results = {}
+
+    def load(self):
+        """Reads the last recorded state, if any."""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, ValueError) as e:
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                log.debug('Ignoring configure state %s: %s' % (self.path, e))
+            return self
+        self.hosts = state.get('hosts', {})
+        self.groups = state.get('groups', {})
+        self.results = state.get('results', {})
+        return self
+
+    def changed_hosts(self, groups, hostvars, watched_groups=()):
+        """
+        Returns the :class:`set` of hosts in :attr:`hostvars` that were never
+        configured, or whose hostvars changed since they were.
+
+        Every host in each of the :attr:`watched_groups` whose membership
+        changed is included as well.
+
+        """
+        changed = set(
+                h for h, hvars in hostvars.iteritems()
+                if self.hosts.get(h) != hostvars_hash(hvars)
+                )
+        for gname in watched_groups:
+            members = sorted(groups.get(gname, []))
+            if members != sorted(self.groups.get(gname, [])):
+                changed.update(members)
+        return changed
+
+    def record(self, hosts, groups, hostvars, result_keys=None):
+        """
+        Records that :attr:`hosts` were configured with :attr:`hostvars`, while
+        the inventory had :attr:`groups`, and writes the state to disk.
+
+        Only the membership of the groups whose members are all among the
+        :attr:`hosts` is recorded.  The other members were configured while
+        the group may have been different (e.g. in an earlier pipelined
+        batch), so the group must still count as changed.
+
+        :param dict result_keys:  The memoization key of each host's run, if
+            playbook results are memoized.  Any key recorded by an earlier run
+            of the :attr:`hosts` is forgotten either way, because it no longer
+            describes how the host was last configured.
+
+        Failures to write are logged and ignored.
+
+        """
+        result_keys = result_keys or {}
+        for h in hosts:
+            self.hosts[h] = hostvars_hash(hostvars[h])
+            if h in result_keys:
+                self.results[h] = result_keys[h]
+            else:
+                self.results.pop(h, None)
+        configured = set(hosts)
+        for gname in set(self.groups) - set(groups):
+            del self.groups[gname]
+        for gname, members in groups.iteritems():
+            if configured.issuperset(members):
+                self.groups[gname] = sorted(members)
+        try:
+            _write_private(
+                    self.path,
+                    json.dumps({
+                        'hosts': self.hosts,
+                        'groups': self.groups,
+                        'results': self.results,
+                        }),
+                    )
+        except (IOError, OSError) as e:
+            log.debug(
+                    'Could not write configure state %s: %s' % (self.path, e)
+                    )
+
+
+def file_signature(path):
+    """
+    Returns a ``(path, mtime, size, content hash)`` tuple for the file at
+    :attr:`path`, or ``None`` if it cannot be read.
+
+    """
+    try:
+        st = os.stat(path)
+        with open(path, 'rb') as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return
+    return (path, st.st_mtime, st.st_size, content_hash)
+
+
+def _str(value):
+    try:
+        return value.encode('ascii')
+    except UnicodeError:
+        return value
+
+
+def _str_list(values):
+    return [
+            _str(v) if isinstance(v, unicode)
+            else _str_list(v) if isinstance(v, list)
+            else v
+            for v in values
+            ]
+
+
+def _str_mapping(mapping):
+    """
+    A :func:`json.load` ``object_hook`` that turns the ASCII keys and strings
+    in :attr:`mapping` into :class:`str`, as :func:`yaml.load` does.  Nested
+    mappings have been through the hook already.
+
+    """
+    result = {}
+    for k, v in mapping.iteritems():
+        if isinstance(v, unicode):
+            v = _str(v)
+        elif isinstance(v, list):
+            v = _str_list(v)
+        result[_str(k)] = v
+    return result
+
+
+class ConfigCache(object):
+    """
+    Stores the parsed YAML of a config file, so that later invocations can
+    skip parsing it while it stays the same.
+
+    An entry is keyed by the bang version and the file's path, mtime, size and
+    content hash, and is stored as JSON.  Loading it back is many times faster
+    than parsing the YAML, even with libyaml.  As with the YAML loader, ASCII
+    strings load as :class:`str`.  Documents that would not survive the round
+    trip through JSON unchanged (e.g. those with dates or non-string keys) are
+    not cached.
+
+    Callers must not save documents that contain secrets (see
+    :func:`~bang.config.contains_secrets`).  ``~/.bangrc``, which holds the
+    deployer credentials, is never cached.
+
+    The cache always lives in the default cache directory, because the
+    ``inventory_cache`` settings are themselves part of the config.
+
+    """
+    def __init__(self, path):
+        self.cache_dir = os.path.join(
+                os.path.expanduser(DEFAULT_CACHE_DIR),
+                'configs',
+                )
+        self.signature = file_signature(path)
+        self.path = None
+        if self.signature:
+            key = hashlib.sha1(bang.VERSION)
+            key.update(json.dumps(self.signature))
+            self.path = os.path.join(self.cache_dir, key.hexdigest() + '.json')
+
+    def load(self):
+        """
+        Returns the cached document, or ``None`` if there is no valid one.
+
+        """
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                return json.load(f, object_hook=_str_mapping)
+        except IOError:
+            return
+        except ValueError as e:
+            log.debug('Ignoring cached config %s: %s' % (self.path, e))
+
+    def save(self, doc):
+        """
+        Caches the parsed YAML document, :attr:`doc`.  Failures to write are
+        logged and ignored.
+
+        """
+        if not self.path:
+            return
+        try:
+            data = json.dumps(doc)
+        except (TypeError, ValueError):
+            return
+        if json.loads(data, object_hook=_str_mapping) != doc:
+            return
+        try:
+            _write_private(self.path, data)
+        except (IOError, OSError) as e:
+            log.debug('Could not write cached config %s: %s' % (self.path, e))
+
+
+def get_inventory(config, refresh=False):
+    """
+    Returns the ``--list`` inventory for the stack described by
+    :attr:`config`, from the cache if possible.
+
+    :param bool refresh:  Ignore (and replace) any cached inventory.
+
+    """
+    cache = InventoryCache(config)
+    if refresh:
+        cache.invalidate()
+    inventory = cache.load()
+    if inventory is None:
+        from .stack import Stack
+        inventory = Stack(config).get_inventory()
+        cache.save(inventory)
+    return inventory
+
+
+def get_host_vars(config, hostname, refresh=False):
+    """
+    Returns the ``--host`` hostvars for :attr:`hostname`.
+
+    A fresh cache answers this without loading any other host's vars.
+    Otherwise, the whole inventory is gathered (and cached) first.
+
+    """
+    if not refresh:
+        hostvars = InventoryCache(config).load_host(hostname)
+        if hostvars is not None:
+            return hostvars
+    inventory = get_inventory(config, refresh)
+    return inventory['_meta']['hostvars'].get(hostname, {})
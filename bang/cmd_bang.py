@@ -17,13 +17,16 @@
 import bang
 import os
 import getpass
+import signal
 import sys
 from textwrap import dedent
-from bang import attributes as A
+from bang import BangError, attributes as A
 from bang.annoy import annoy
+from bang.cache import get_host_vars, get_inventory
+from bang.daemon import BangDaemon, get_socket_path, send_request
 from bang.stack import Stack
-from bang.config import Config
-from bang.util import get_argparser, initialize_logging
+from bang.config import Config, parse_bangrc
+from bang.util import dump_inventory, get_argparser, initialize_logging
 
 
 DEFAULT_SSH_USER = getpass.getuser()
@@ -132,9 +135,35 @@ def get_parser():
                             # run some command
                             ansible webservers -i /path/to/bang -m ping
 
+                        The inventory is cached on disk for ``ttl_s`` seconds
+                        (see the ``inventory_cache`` stanza in
+                        ``$HOME/.bangrc``), and the cache is cleared whenever
+                        the stack is deployed.
+
                         """),
                 'dest': 'ansible_list',
                 }),
+            ('--host', {
+                'metavar': 'HOST',
+                'help': dedent("""\
+                        Dump the hostvars for a single host in
+                        ansible-compatible JSON.
+
+                        This is the ``--host`` half of the external inventory
+                        script API.  Like ``--list``, it is answered from the
+                        inventory cache when possible.
+
+                        """),
+                'dest': 'ansible_host',
+                }),
+            ('--refresh-cache', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Ignore any cached inventory and gather a fresh one
+                        from the cloud providers.
+
+                        """),
+                }),
             ('--no-configure', {
                 'action': 'store_false',
                 'dest': 'configure',
@@ -160,6 +189,56 @@ def get_parser():
                         configuration may fail if it references infrastructure
                         resources that have not already been created.
 
+                        """),
+                }),
+            ('--configure-changed', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Only configure the servers that were created by this
+                        run, or whose hostvars changed since bang last
+                        configured them.
+
+                        Servers in the ``reconfigure_groups`` listed in the
+                        ``ansible`` config stanza are all configured whenever
+                        a server joins or leaves their group.
+
+                        """),
+                }),
+            ('--pipeline', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Start configuring servers as soon as they (and the
+                        rest of the servers in their groups) are deployed,
+                        instead of waiting for the whole stack to be
+                        deployed.
+
+                        See ``group_dependencies`` in the ``ansible`` config
+                        stanza to hold back groups whose playbooks need other
+                        groups to be configured first.
+
+                        """),
+                }),
+            ('--daemon', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Run as a daemon that keeps authenticated providers and
+                        recent inventories in memory, and answers requests
+                        from other ``bang`` commands on a Unix socket (see the
+                        ``daemon`` stanza in ``$HOME/.bangrc``).
+
+                        While it runs, ``--list`` and ``--host`` are answered
+                        by the daemon.
+
+                        """),
+                }),
+            ('--use-daemon', {
+                'action': 'store_true',
+                'help': dedent("""\
+                        Have the running ``bang --daemon`` deploy the stack.
+                        The servers are then configured by this command, as
+                        usual.  ``--user``, ``--ask-pass`` and ``--playbook``
+                        apply to both.
+
                         """),
                 }),
             ('--playbook', '-p', {
@@ -216,10 +295,41 @@ def run_bang(alt_args=None):
     parser = get_parser()
     args = parser.parse_args(alt_args)
 
+    bangrc = parse_bangrc()
+    socket_path = get_socket_path(bangrc)
+    if args.daemon:
+        initialize_logging(bangrc)
+        # exit cleanly (i.e. remove the socket) when killed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        BangDaemon(socket_path).serve_forever()
+        return
+
     source = args.config_specs or get_env_configs()
     if not source:
         return
 
+    pretty = os.isatty(sys.stdout.fileno())
+    if (args.ansible_list or args.ansible_host) and not args.dump_config:
+        # a running daemon answers without loading anything here
+        if args.ansible_host:
+            result = send_request(
+                    socket_path,
+                    'host',
+                    source,
+                    host=args.ansible_host,
+                    refresh=args.refresh_cache,
+                    )
+        else:
+            result = send_request(
+                    socket_path,
+                    'list',
+                    source,
+                    refresh=args.refresh_cache,
+                    )
+        if result is not None:
+            print dump_inventory(result, pretty)
+            return
+
     config = Config.from_config_specs(source)
 
     if args.playbooks:
@@ -241,18 +351,41 @@ def run_bang(alt_args=None):
 
     annoy(config)
 
-    stack = Stack(config)
+    if args.ansible_host:
+        hostvars = get_host_vars(config, args.ansible_host, args.refresh_cache)
+        print dump_inventory(hostvars, pretty)
+        return
 
     if args.ansible_list:
-        stack.show_inventory(
-                os.isatty(sys.stdout.fileno())
-                )
+        inventory = get_inventory(config, args.refresh_cache)
+        print dump_inventory(inventory, pretty)
         return
 
+    stack = Stack(config)
+
     initialize_logging(config)
     # TODO:  config.validate()
-    if args.deploy:
-        stack.deploy()
-    if args.configure:
-        stack.configure()
+    if args.use_daemon and args.deploy:
+        if args.pipeline:
+            parser.error('--pipeline cannot be used with --use-daemon')
+        # the daemon deploys with the same overrides as this command
+        creds = config[A.DEPLOYER_CREDS]
+        result = send_request(
+                socket_path,
+                'deploy',
+                source,
+                ssh_user=creds.get(A.creds.SSH_USER),
+                ssh_pass=creds.get(A.creds.SSH_PASS),
+                playbooks=args.playbooks,
+                )
+        if result is None:
+            raise BangError('No bang daemon is listening on %s' % socket_path)
+        args.deploy = False
+    if args.deploy and args.configure and args.pipeline:
+        stack.deploy_and_configure(args.configure_changed)
+    else:
+        if args.deploy:
+            stack.deploy()
+        if args.configure:
+            stack.configure(changed_only=args.configure_changed)
     config.autoinc()
@@ -21,8 +21,11 @@ import tempfile
 import yaml
 
 from . import resources as R, attributes as A
+from .cache import ConfigCache
 from .util import log, bump_version_tail, deep_merge_dicts
-from ansible.utils import ask_passwords
+
+# libyaml's loader is many times faster than the pure python one
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 
 DEFAULT_CONFIG_DIR = 'bang-stacks'
@@ -35,10 +38,24 @@ RC_KEYS = [
         A.LOGGING,
         A.ANSIBLE,
         A.ANNOY_ME,
+        A.POLLING,
+        A.RATE_LIMITS,
+        A.INVENTORY_CACHE,
+        A.DAEMON,
         ]
 
 ALL_RESERVED_KEYS = RC_KEYS + R.DYNAMIC_RESOURCE_KEYS
 
+# config files with any of these stanzas hold credentials
+SECRET_STANZAS = (A.DEPLOYER_CREDS, R.DATABASE_CREDS)
+
+# ... as do those with any of these attributes, anywhere in the file
+SECRET_ATTRIBUTES = (
+        A.ansible.VAULT_PASS,
+        A.creds.SSH_PASS,
+        A.database.ADMIN_PASS,
+        )
+
 
 def find_component_tarball(bucket, comp_name, comp_config):
     """
@@ -62,13 +79,69 @@ def find_component_tarball(bucket, comp_name, comp_config):
     return True
 
 
+def ask_passwords(**kwargs):
+    """
+    Prompts for passwords with :func:`ansible.utils.ask_passwords`.  Ansible is
+    imported here, and only when a prompt is needed.
+
+    """
+    from ansible.utils import ask_passwords as ansible_ask_passwords
+    return ansible_ask_passwords(**kwargs)
+
+
+def load_yaml(f):
+    """Parses the YAML document in the file object, :attr:`f`."""
+    return yaml.load(f, Loader=YamlLoader)
+
+
+def contains_secrets(doc):
+    """
+    Returns ``True`` if the parsed config file, :attr:`doc`, has any of the
+    :data:`SECRET_STANZAS`, or any of the :data:`SECRET_ATTRIBUTES` at any
+    depth.
+
+    """
+    if not isinstance(doc, dict):
+        return False
+    if any(k in doc for k in SECRET_STANZAS):
+        return True
+    stack = [doc]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if any(k in node for k in SECRET_ATTRIBUTES):
+                return True
+            stack.extend(node.itervalues())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return False
+
+
+def load_config_file(path):
+    """
+    Returns the parsed YAML of the config file at :attr:`path`, from the
+    :class:`~bang.cache.ConfigCache` if possible.
+
+    """
+    cache = ConfigCache(path)
+    doc = cache.load()
+    if doc is None:
+        with open(path) as f:
+            doc = load_yaml(f)
+        if not contains_secrets(doc):
+            cache.save(doc)
+    return doc
+
+
+def get_bangrc_path():
+    # $HOME might not exist in the current environ (e.g. init scripts)
+    return os.path.join(os.environ.get('HOME', ''), '.bangrc')
+
+
 def read_raw_bangrc():
     try:
-        # the path creation is in the try/except because $HOME might not exist
-        # in the current environ (e.g. init scripts)
-        bangrc_path = os.path.join(os.environ['HOME'], '.bangrc')
-        with open(bangrc_path) as f:
-            return yaml.safe_load(f)
+        with open(get_bangrc_path()) as f:
+            return load_yaml(f)
     except:
         return {}
 
@@ -120,6 +193,30 @@ def resolve_config_spec(config_spec, config_dir=''):
     return os.path.join(config_dir, '%s.yml' % config_spec)
 
 
+class ConfigIndex(object):
+    """
+    Lookup tables over the resource stanzas of a :class:`Config`, built in a
+    single pass so that later phases need not scan the stanzas for every
+    lookup.  The tables refer to the stanzas themselves, not copies.
+
+    """
+    def __init__(self, config):
+        #: Server stanzas by name.  A server stanza describes one class of
+        #: hosts, so this is also the table of server classes (i.e. of the
+        #: ``server_class`` hostvar).  Used for the load balancer secgroups
+        #: and for the stack's per-class vars.
+        self.servers = {}
+
+        #: Server stanza names by inventory group.  Used when pipelining.
+        self.group_members = {}
+
+        for server in config.get(R.SERVERS, []):
+            name = server[A.server.NAME]
+            self.servers[name] = server
+            for gname in server.get(A.server.GROUPS, []):
+                self.group_members.setdefault(gname, set()).add(name)
+
+
 class Config(dict):
     """
     A dict-alike that provides a convenient constructor, stashes the path
@@ -135,6 +232,18 @@ class Config(dict):
         """
         super(Config, self).__init__(*args, **kwargs)
         self.filepath = ''
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        The :class:`ConfigIndex` for this config.  It is built on first use,
+        and rebuilt by :meth:`prepare`.
+
+        """
+        if self._index is None:
+            self._index = ConfigIndex(self)
+        return self._index
 
     @classmethod
     def from_config_specs(cls, config_specs, prepare=True):
@@ -160,6 +269,10 @@ class Config(dict):
 
         :rtype:  :class:`Config`
 
+        The parsed YAML of each config file is cached (see
+        :class:`~bang.cache.ConfigCache`) until the file changes.  Files that
+        contain secrets are never cached, and neither is ``~/.bangrc``.
+
         """
         bangrc = parse_bangrc()
         config_dir = bangrc.get(A.CONFIG_DIR, DEFAULT_CONFIG_DIR)
@@ -171,8 +284,7 @@ class Config(dict):
         if config_paths:
             config.filepath = config_paths[0]
         for c in config_paths:
-            with open(c) as f:
-                deep_merge_dicts(config, yaml.safe_load(f))
+            deep_merge_dicts(config, load_config_file(c))
         if prepare:
             config.prepare()
         return config
@@ -206,11 +318,9 @@ class Config(dict):
         stack = self[A.NAME]
         # Special magic groups for lb
         load_balancer_groups = []
+        servers = self.index.servers
         for lb in self.get(R.LOAD_BALANCERS, []):
-            for_servers = lb[A.loadbalancer.SERVER_NAMES]
-            for_server = filter(
-                    lambda s: s[A.server.NAME] == for_servers,
-                    self[R.SERVERS])[0]
+            for_server = servers[lb[A.loadbalancer.SERVER_NAMES]]
             secgroup_name = '%s-secgroup' % lb[A.loadbalancer.NAME]
             sec_group = {
                 A.secgroup.NAME: secgroup_name,
@@ -332,7 +442,9 @@ class Config(dict):
                 if A.server.AZ not in server:
                     server[A.server.AZ] = server[A.server.REGION]
 
-            # distribute the config scope attributes
+            # distribute the config scope attributes.  these are shared by
+            # reference, and the stack keeps them once per server class rather
+            # than once per host.
             svars = {
                     A.STACK: stack,
                     A.SERVER_CLASS: server[A.NAME],
@@ -416,6 +528,7 @@ class Config(dict):
                 (R.BUCKETS, A.NAME),
                 (R.QUEUES, A.NAME)):
             self[stanza_key] = self._convert_to_list(stanza_key, name_key)
+        self._index = None
 
         self._prepare_ssh_keys()
         self._prepare_secgroups()
@@ -425,6 +538,9 @@ class Config(dict):
         self._prepare_load_balancers()
         self._prepare_ansible()
 
+        # the secgroup and key stanzas were added and renamed above
+        self._index = None
+
     def validate(self):
         """
         Performs all validation checks on this config.
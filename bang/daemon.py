@@ -0,0 +1,353 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A long-running ``bang`` process that answers inventory and deploy requests.
+
+Every ``bang`` run starts a fresh interpreter, authenticates with each cloud
+provider and opens new connections to their APIs.  ``bang --daemon`` does all
+of that once, then keeps the provider objects (see
+:func:`~bang.providers.get_provider`), their sessions and the most recent
+inventory of each stack in memory while it listens on a Unix socket.  While it
+runs, ``bang --list`` and ``bang --host`` (and so ansible's inventory hook) are
+answered by the daemon, as are deploys started with ``bang --use-daemon``.
+
+Each connection carries one request and its response, both JSON objects.  A
+request names its ``action``, the ``config_specs`` and the client's ``cwd``,
+against which relative config specs are resolved.
+
+Each request is handled in its own thread.  The provider objects are shared,
+so the inventory requests that talk to the providers (i.e. that are not
+cached) take turns.  Cached inventories are answered right away.
+
+Forking a process that runs several threads is unsafe (the child can inherit
+a lock that some other thread was holding), so deploys don't fork from the
+request threads.  They run in a single deploy process (see :class:`Deployer`)
+that the daemon forks once, before it starts listening.  It keeps its own
+authenticated providers between deploys, and runs one deploy at a time.
+Inventories are answered while a deploy runs.
+
+The daemon cannot prompt for passwords, so it refuses stacks whose configs
+set ``ask_vault_pass``.
+
+"""
+import errno
+import json
+import multiprocessing
+import os
+import socket
+import SocketServer
+import threading
+import time
+
+from . import BangError, attributes as A
+from .cache import InventoryCache, get_inventory
+from .config import (Config, DEFAULT_CONFIG_DIR, parse_bangrc,
+        resolve_config_spec)
+from .util import log
+
+
+DEFAULT_SOCKET_PATH = os.path.join('~', '.cache', 'bang', 'bang.sock')
+
+ACTIONS = ('ping', 'list', 'host', 'deploy')
+
+
+def get_socket_path(bangrc=None):
+    """
+    Returns the path of the daemon's socket, from the ``daemon`` stanza in
+    ``$HOME/.bangrc``.
+
+    """
+    if bangrc is None:
+        bangrc = parse_bangrc()
+    cfg = bangrc.get(A.DAEMON, {})
+    return os.path.expanduser(
+            cfg.get(A.daemon.SOCKET_PATH, DEFAULT_SOCKET_PATH)
+            )
+
+
+def send_request(socket_path, action, config_specs=(), **kwargs):
+    """
+    Sends a request to the daemon listening on :attr:`socket_path`, and
+    returns the result.
+
+    Returns ``None`` if no daemon is listening there.  Raises
+    :class:`~bang.BangError` if the daemon could not fulfill the request.
+
+    """
+    request = dict(
+            kwargs,
+            action=action,
+            config_specs=list(config_specs),
+            cwd=os.getcwd(),
+            )
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error as e:
+            if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        sock.sendall(json.dumps(request) + '\n')
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        for chunk in iter(lambda: sock.recv(65536), ''):
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    response = json.loads(''.join(chunks))
+    if 'error' in response:
+        raise BangError(response['error'])
+    return response['result']
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = {'result': self.server.daemon.handle(request)}
+        except Exception as e:
+            log.exception('Request failed')
+            response = {'error': str(e) or e.__class__.__name__}
+        self.wfile.write(json.dumps(response))
+
+
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, daemon):
+        self.daemon = daemon
+        SocketServer.UnixStreamServer.__init__(
+                self,
+                socket_path,
+                _RequestHandler,
+                )
+
+
+class Deployer(object):
+    """
+    Runs deploys in a child process, one at a time.
+
+    :meth:`start` forks the child.  Call it before starting any threads.
+    Once started, :meth:`deploy` may be called from any thread.
+
+    """
+    def __init__(self):
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+                target=self._serve,
+                args=(child_conn, ),
+                name='bang-deployer',
+                )
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        if not self.process:
+            return
+        with self.lock:
+            try:
+                self.conn.send(None)
+            except (IOError, EOFError):
+                pass
+            self.process.join(10)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.conn.close()
+            self.process = None
+
+    def deploy(self, config):
+        """
+        Deploys the stack for :attr:`config` in the child process, and waits
+        for it to finish.
+
+        """
+        with self.lock:
+            if not self.process:
+                raise BangError('The deploy process is not running')
+            try:
+                self.conn.send(config)
+                error = self.conn.recv()
+            except (IOError, EOFError):
+                raise BangError('The deploy process died')
+        if error:
+            raise BangError(error)
+
+    @staticmethod
+    def _serve(conn):
+        from .stack import Stack
+        try:
+            for config in iter(conn.recv, None):
+                try:
+                    Stack(config).deploy()
+                    conn.send(None)
+                except Exception as e:
+                    log.exception('Deploy failed')
+                    conn.send(str(e) or e.__class__.__name__)
+        except (EOFError, KeyboardInterrupt):
+            pass
+
+
+class BangDaemon(object):
+    """
+    Serves the requests sent by :func:`send_request`.
+
+    :param str socket_path:  The path of the Unix socket on which to listen.
+
+    """
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+        # the most recent inventory of each stack config, as (mtime of the
+        # inventory cache file, inventory) tuples keyed by that file's path
+        self.inventories = {}
+        self.server = None
+
+        # held while talking to the providers
+        self.provider_lock = threading.Lock()
+
+        self.deployer = Deployer()
+
+    def serve_forever(self):
+        """Listens for requests until interrupted."""
+        socket_dir = os.path.dirname(self.socket_path)
+        if socket_dir and not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir, 0700)
+        if os.path.exists(self.socket_path):
+            if send_request(self.socket_path, 'ping') is not None:
+                raise BangError(
+                        'A bang daemon is already listening on %s'
+                        % self.socket_path
+                        )
+            # left behind by a daemon that died
+            os.remove(self.socket_path)
+        # before any request threads exist
+        self.deployer.start()
+        try:
+            old_umask = os.umask(0077)
+            try:
+                self.server = _Server(self.socket_path, self)
+            finally:
+                os.umask(old_umask)
+            log.info('bang daemon listening on %s' % self.socket_path)
+            try:
+                self.server.serve_forever()
+            finally:
+                self.server.server_close()
+                os.remove(self.socket_path)
+        finally:
+            self.deployer.stop()
+
+    def stop(self):
+        """Makes :meth:`serve_forever` return.  Call it from another thread."""
+        if self.server:
+            self.server.shutdown()
+
+    def handle(self, request):
+        """Returns the result for one :attr:`request`."""
+        action = request.get('action')
+        if action not in ACTIONS:
+            raise BangError('Unknown request: %s' % action)
+        if action == 'ping':
+            return 'pong'
+        config = self._load_config(request['config_specs'], request['cwd'])
+        if action == 'list':
+            return self.get_inventory(config, request.get('refresh', False))
+        if action == 'host':
+            inventory = self.get_inventory(
+                    config,
+                    request.get('refresh', False),
+                    )
+            return inventory['_meta']['hostvars'].get(request['host'], {})
+        creds = config.setdefault(A.DEPLOYER_CREDS, {})
+        for attr in (A.creds.SSH_USER, A.creds.SSH_PASS):
+            if request.get(attr) is not None:
+                creds[attr] = request[attr]
+        if request.get(A.PLAYBOOKS):
+            config[A.PLAYBOOKS] = request[A.PLAYBOOKS]
+        return self.deploy(config)
+
+    def _load_config(self, config_specs, cwd):
+        if not config_specs:
+            raise BangError('No config specs in request')
+        # resolve the specs as the client would have.  the daemon's own
+        # working directory is shared by every request thread.
+        config_dir = parse_bangrc().get(A.CONFIG_DIR, DEFAULT_CONFIG_DIR)
+        config_paths = [
+                os.path.join(cwd, resolve_config_spec(cs, config_dir))
+                for cs in config_specs
+                ]
+        # re-read on every request, so that edits take effect.  unchanged
+        # config files are loaded from the config cache.
+        config = Config.from_config_specs(config_paths, prepare=False)
+        if config.get(A.ANSIBLE, {}).get(A.ansible.ASK_VAULT_PASS):
+            raise BangError('The bang daemon cannot prompt for passwords')
+        config.prepare()
+        return config
+
+    def get_inventory(self, config, refresh=False):
+        """
+        Returns the ``--list`` inventory for :attr:`config`.
+
+        It is kept in memory for as long as the on-disk inventory cache (see
+        :class:`~bang.cache.InventoryCache`) keeps it, i.e. until it expires,
+        or until any ``bang`` command deploys the stack or refreshes the cache.
+
+        """
+        cache = InventoryCache(config)
+        if not refresh:
+            mtime, inventory = self.inventories.get(cache.path, (None, None))
+            # the file is written just before it is renamed into place, so
+            # its mtime is (close to) its creation time
+            if mtime is not None and mtime == _mtime(cache.path) \
+                    and time.time() < mtime + cache.ttl_s:
+                return inventory
+        with self.provider_lock:
+            inventory = get_inventory(config, refresh)
+        mtime = _mtime(cache.path)
+        if mtime is None:
+            self.inventories.pop(cache.path, None)
+        else:
+            self.inventories[cache.path] = (mtime, inventory)
+        return inventory
+
+    def deploy(self, config):
+        """
+        Deploys the stack for :attr:`config` in the deploy process.  Its
+        deployer processes are forked from it, so they start out with its
+        authenticated providers.  The client takes care of the rest of the run
+        (e.g. configuring the servers, and bumping the stack version).
+
+        Deploying invalidates the stack's inventory cache, and so the
+        inventory kept in memory.
+
+        """
+        self.deployer.deploy(config)
+        return True
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
@@ -18,10 +18,54 @@
 Base classes and definitions for bang deployers (deployable components)
 """
 from . import cloud, default
-from .. import attributes as A
+from .. import BangError, attributes as A, resources as R
 from ..util import log
 
 
+def unique_resources(res_type, res_configs):
+    """
+    Returns :attr:`res_configs` without the repeated records of any shared
+    cloud resource, so that each resource is deployed exactly once.  E.g.
+    Every server stanza that shares an SSH key needs the key in its provider
+    and region, but only one deployer should look for it and create it.
+
+    Only the resource types in :data:`~bang.resources.SHARED` are
+    deduplicated.  Records of any other type are returned as they are.
+
+    Shared resources are identified by provider, region, resource type and
+    name.  Every record of the same resource must be identical, because only
+    one of them is deployed.  Records that share a key but differ in any
+    attribute raise :class:`~bang.BangError`.
+
+    """
+    if res_type not in R.SHARED:
+        return res_configs
+    unique = []
+    seen = {}
+    for res_config in res_configs:
+        if A.PROVIDER not in res_config or A.NAME not in res_config:
+            unique.append(res_config)
+            continue
+        key = (
+                res_config[A.PROVIDER],
+                res_config.get(A.REGION),
+                res_type,
+                res_config[A.NAME],
+                )
+        first = seen.get(key)
+        if first is None:
+            seen[key] = res_config
+            unique.append(res_config)
+        elif first != res_config:
+            raise BangError(
+                    'Conflicting definitions of %s %s in %s/%s'
+                    % (res_type, key[3], key[0], key[1])
+                    )
+        else:
+            log.debug('Skipping repeated %s %s' % (res_type, key[3]))
+    return unique
+
+
 def get_stage_deployers(keys, stack):
     """
     Returns a list of deployer objects that *create* cloud resources.  Each
@@ -46,7 +90,7 @@ def get_stage_deployers(keys, stack):
         if not res_configs:
             continue
         log.debug("Found config for resource type, %s" % res_type)
-        for res_config in res_configs:
+        for res_config in unique_resources(res_type, res_configs):
             if A.PROVIDER in res_config:
                 ds = cloud.get_deployers(res_config, res_type, stack, creds)
             else:
@@ -54,3 +98,30 @@ def get_stage_deployers(keys, stack):
             if ds:
                 deployers.extend(ds)
     return deployers
+
+
+def run_inventory(stack):
+    """
+    Gathers the inventory for every resource in :attr:`stack` without forking
+    any deployer processes.
+
+    Cloud servers are found with one bulk listing per provider and region
+    (see :func:`~bang.deployers.cloud.find_existing_servers`).  Every other
+    deployer runs its inventory phases in this process, in stage order.  Those
+    that look resources up by name (e.g. databases, load balancers) share
+    their stack's name indexes, so each type is still listed once per region.
+
+    """
+    for keys in R.STAGES:
+        deployers = [
+                d for d in get_stage_deployers(keys, stack)
+                if d.inventory_phases
+                ]
+        servers = [d for d in deployers if isinstance(d, cloud.ServerDeployer)]
+        if servers:
+            cloud.find_existing_servers(servers)
+            for d in servers:
+                d.add_to_inventory()
+        for d in deployers:
+            if not isinstance(d, cloud.ServerDeployer):
+                d.run('inventory')
@@ -17,7 +17,7 @@
 import time
 from .. import resources as R, attributes as A
 from ..providers import get_provider
-from ..util import log
+from ..util import log, wait_for_tcp_port
 from .deployer import Deployer
 
 
@@ -70,12 +70,14 @@ class ServerDeployer(RegionedDeployer):
         super(ServerDeployer, self).__init__(*args, **kwargs)
         self.namespace = self.stack.get_namespace(self.name)
         self.server_attrs = None
+        self.created = False
         self.provider_extras = getattr(self, self.provider, {})
         self.phases = [
                 (True, self.find_existing),
                 (lambda: self.server_attrs, self.wait_for_running),
                 (lambda: not self.server_attrs, self.create),
                 (True, self.add_to_inventory),
+                (True, self.report_ready),
                 ]
         self.inventory_phases = [
                 self.find_existing,
@@ -121,15 +123,72 @@ class ServerDeployer(RegionedDeployer):
                 security_groups=self.security_groups,
                 **self.provider_extras
                 )
-        log.debug('Post launch delay: %d s' % self.post_launch_delay_s)
-        time.sleep(self.post_launch_delay_s)
+        self.created = True
+        self.wait_for_ssh()
+
+    def wait_for_ssh(self):
+        """
+        Waits for each public address of a newly launched server to accept SSH
+        connections, for at most :attr:`post_launch_delay_s` seconds in total.
+
+        """
+        port = self.hostvars.get(A.server.SSH_PORT, 22)
+        deadline = time.time() + self.post_launch_delay_s
+        for addy in self.server_attrs[A.server.PUBLIC_IPS]:
+            log.info('Waiting for %s to accept SSH connections...' % addy)
+            if not wait_for_tcp_port(addy, port,
+                    max(0, deadline - time.time()), banner='SSH-',
+                    policy=A.polling.SSH_PROBE):
+                log.warn(
+                        '%s not accepting SSH connections after %d s'
+                        % (addy, self.post_launch_delay_s)
+                        )
 
     def add_to_inventory(self):
         """Adds host to stack inventory"""
         if not self.server_attrs:
             return
         for addy in self.server_attrs[A.server.PUBLIC_IPS]:
-            self.stack.add_host(addy, self.groups, self.hostvars)
+            self.stack.add_host(
+                    addy,
+                    self.groups,
+                    self.hostvars,
+                    created=self.created,
+                    )
+
+    def report_ready(self):
+        """Tells the stack that this server is deployed."""
+        self.stack.server_ready(self.name)
+
+
+def find_existing_servers(deployers):
+    """
+    The bulk version of :meth:`ServerDeployer.find_existing` used to gather
+    inventory.
+
+    Groups the :attr:`deployers` by provider and region, makes one
+    :meth:`~bang.providers.bases.Consul.find_servers_by_tags` call per group,
+    and hands each clone deployer of a server stanza a distinct matching
+    server, like the clones would have claimed them through their shared
+    namespace.
+
+    """
+    groups = {}
+    for d in deployers:
+        key = (d.provider, getattr(d, 'region_name', None))
+        groups.setdefault(key, []).append(d)
+    for group in groups.values():
+        # clones of the same server stanza share their name (and tags)
+        by_name = {}
+        for d in group:
+            by_name.setdefault(d.name, []).append(d)
+        names = sorted(by_name)
+        tag_sets = [by_name[name][0].tags for name in names]
+        matches = group[0].consul.find_servers_by_tags(tag_sets)
+        for name, instances in zip(names, matches):
+            for d, instance in zip(by_name[name], instances):
+                log.info('Found existing server, %s' % instance[A.server.ID])
+                d.server_attrs = instance
 
 
 class CloudManagerServerDeployer(ServerDeployer):
@@ -155,6 +214,7 @@ class CloudManagerServerDeployer(ServerDeployer):
                     self.define),
                 (lambda: not self.server_attrs, self.create),
                 (True, self.add_to_inventory),
+                (True, self.report_ready),
                 ]
 
     def create_stack(self):
@@ -194,8 +254,8 @@ class CloudManagerServerDeployer(ServerDeployer):
                 timeout_s=self.launch_timeout_s,
                 **self.provider_extras
                 )
-        log.debug('Post launch delay: %d s' % self.post_launch_delay_s)
-        time.sleep(self.post_launch_delay_s)
+        self.created = True
+        self.wait_for_ssh()
 
 
 class SecurityGroupDeployer(RegionedDeployer):
@@ -292,9 +352,16 @@ class DatabaseDeployer(BaseDeployer):
         super(DatabaseDeployer, self).__init__(*args, **kwargs)
         self.instance_name = "%s-%s" % (self.stack.name, self.name)
         self.db_attrs = None
+        self.launched = None
+        self._consul.name_index = self.stack.get_name_index((
+                self.provider,
+                getattr(self, 'region_name', None),
+                R.DATABASES,
+                ))
         self.phases = [
                 (True, self.find_existing),
-                (lambda: not self.db_attrs, self.create),
+                (lambda: not self.db_attrs, self.launch),
+                (lambda: self.launched, self.wait_until_ready),
                 (True, self.add_to_inventory),
                 ]
         self.inventory_phases = [
@@ -310,6 +377,35 @@ class DatabaseDeployer(BaseDeployer):
         """
         self.db_attrs = self.consul.find_db_instance(self.instance_name)
 
+    def launch(self):
+        """
+        Starts launching a new database without waiting for it to be ready.
+
+        Falls back to the blocking :meth:`create` for consuls that cannot
+        launch asynchronously.
+
+        """
+        if not hasattr(self.consul, 'launch_db'):
+            self.create()
+            return
+        self.launched = self.consul.launch_db(
+                self.instance_name,
+                self.instance_type,
+                self.admin_username,
+                self.admin_password,
+                db_name=self.db_name,
+                storage_size_gb=self.storage_size,
+                )
+
+    def wait_until_ready(self):
+        """Waits for the launched database to accept connections."""
+        self.db_attrs = self.consul.wait_for_db(
+                self.launched,
+                self.admin_username,
+                self.admin_password,
+                timeout_s=self.launch_timeout_s,
+                )
+
     def create(self):
         """Creates a new database"""
         self.db_attrs = self.consul.create_db(
@@ -359,6 +455,11 @@ class LoadBalancerDeployer(RegionedDeployer):
         super(LoadBalancerDeployer, self).__init__(*args, **kwargs)
         self.instance_name = "%s-%s" % (self.stack.name, self.name)
         self.lb_attrs = None
+        self._consul.name_index = self.stack.get_name_index((
+                self.provider,
+                self.region_name,
+                R.LOAD_BALANCERS,
+                ))
         self.delete_these_nodes = []
         self.add_these_nodes = []
         self.phases = [
@@ -416,11 +517,7 @@ class LoadBalancerDeployer(RegionedDeployer):
                 )
 
     def _get_required_nodes(self):
-        required_nodes = set()
-        for host, attrs in self.stack.groups_and_vars.dicts.items():
-            if attrs.get(A.SERVER_CLASS) == self.balance_server_name:
-                required_nodes.add(host)
-        return required_nodes
+        return set(self.stack.get_class_hosts(self.balance_server_name))
 
     def add_to_inventory(self):
         """Adds lb IPs to stack inventory"""
@@ -498,6 +595,13 @@ def get_deployers(res_config, res_type, stack, creds):
     if not consul:
         log.warn("%s does not provide %s" % (pname, res_type))
         return
+    region_name = res_config.get(A.REGION)
+    consul.rate_limiter = stack.get_rate_limiter(pname, region_name, consul)
+    consul.concurrency = stack.get_concurrency_limiter(
+            pname,
+            region_name,
+            consul,
+            )
     deployer = get_deployer(pname, res_type)
     count = res_config.get('instance_count', 1)
     return [deployer(stack, res_config, consul) for _ in range(count)]
@@ -39,9 +39,16 @@ class ServerDeployer(Deployer):
     """
     def __init__(self, *args, **kwargs):
         super(ServerDeployer, self).__init__(*args, **kwargs)
-        self.phases = [(True, self.add_to_inventory)]
+        self.phases = [
+                (True, self.add_to_inventory),
+                (True, self.report_ready),
+                ]
         self.inventory_phases = [self.add_to_inventory]
 
     def add_to_inventory(self):
         """Adds this server and its hostvars to the ansible inventory."""
         self.stack.add_host(self.hostname, self.groups, self.hostvars)
+
+    def report_ready(self):
+        """Tells the stack that this server is deployed."""
+        self.stack.server_ready(self.name)
@@ -0,0 +1,166 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Sizing and monitoring of ansible's fork pool during
+:meth:`bang.stack.Stack.configure`.
+"""
+import multiprocessing
+
+# work around circular import in ansible as discussed on ansible-devel:
+#
+#     https://groups.google.com/forum/#!topic/ansible-devel/wE7fNbGyWbo
+#
+import ansible.utils  # noqa
+
+from ansible import callbacks
+
+from . import attributes as A
+from .util import log
+
+
+#: Ansible's forks spend most of their time waiting on SSH, so several of them
+#: can share a CPU.
+DEFAULT_FORKS_PER_CPU = 8
+
+#: A rough upper bound on the resident memory of one ansible fork.
+DEFAULT_MEMORY_PER_FORK_MB = 100
+
+DEFAULT_MAX_FORKS = 200
+
+
+def available_memory_mb():
+    """
+    Returns the memory available for new processes in MB, or ``None`` if it
+    cannot be determined on this platform.
+
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            info = dict(
+                    (k.strip(), v.split())
+                    for k, v in (line.split(':', 1) for line in f)
+                    )
+    except (IOError, ValueError):
+        return
+    if 'MemAvailable' in info:
+        return int(info['MemAvailable'][0]) // 1024
+    try:
+        kb = sum(int(info[k][0]) for k in ('MemFree', 'Buffers', 'Cached'))
+    except KeyError:
+        return
+    return kb // 1024
+
+
+def choose_forks(host_count, ansible_cfg):
+    """
+    Returns the number of forks ansible should use to configure
+    :attr:`host_count` hosts.
+
+    An explicit ``forks`` value in the ``ansible`` config stanza always wins.
+    Otherwise the forks are the smallest of the host count, ``forks_per_cpu``
+    times the number of CPUs, the available memory divided by
+    ``memory_per_fork_mb``, and ``max_forks``.
+
+    """
+    forks = ansible_cfg.get(A.ansible.FORKS)
+    if forks:
+        log.info('Using %d forks from the ansible config' % forks)
+        return int(forks)
+
+    try:
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = 1
+    limits = {
+            'hosts': host_count,
+            'cpus': cpus * ansible_cfg.get(
+                A.ansible.FORKS_PER_CPU,
+                DEFAULT_FORKS_PER_CPU,
+                ),
+            'max_forks': ansible_cfg.get(A.ansible.MAX_FORKS, DEFAULT_MAX_FORKS),
+            }
+    memory_mb = available_memory_mb()
+    if memory_mb is not None:
+        limits['memory'] = memory_mb // ansible_cfg.get(
+                A.ansible.MEMORY_PER_FORK_MB,
+                DEFAULT_MEMORY_PER_FORK_MB,
+                )
+    bound = min(limits, key=lambda k: limits[k])
+    forks = max(1, int(limits[bound]))
+    log.info('Using %d forks (limited by %s)' % (forks, bound))
+    return forks
+
+
+class ForkUsage(object):
+    """
+    Tracks how many hosts each ansible task ran on, compared to the number of
+    forks available to run them.
+
+    """
+    def __init__(self, forks):
+        self.forks = forks
+        self.task_hosts = []
+
+    def task_done(self, host_count):
+        if host_count:
+            self.task_hosts.append(host_count)
+
+    def report(self):
+        """Logs a summary of the fork pool saturation."""
+        tasks = len(self.task_hosts)
+        if not tasks:
+            return
+        busy = sum(min(h, self.forks) for h in self.task_hosts)
+        queued = len([h for h in self.task_hosts if h > self.forks])
+        log.info(
+                'Forks: %d.  Tasks: %d, %0.1f hosts per task (max %d).  '
+                'Forks busy %d%% of the time; %d tasks (%d%%) had hosts '
+                'waiting for a fork.'
+                % (self.forks, tasks, float(sum(self.task_hosts)) / tasks,
+                    max(self.task_hosts), 100 * busy / (tasks * self.forks),
+                    queued, 100 * queued / tasks)
+                )
+
+
+class AggregateStats(callbacks.AggregateStats):
+    """
+    Playbook stats that also feed each task's host count to a
+    :class:`ForkUsage`.
+
+    Ansible invokes the runner callbacks from within its worker processes, so
+    the results are counted here instead, where the playbook collects them in
+    the parent process.
+
+    """
+    def __init__(self, usage):
+        callbacks.AggregateStats.__init__(self)
+        self.usage = usage
+
+    def compute(self, runner_results, setup=False, poll=False,
+            ignore_errors=False):
+        if not poll:
+            self.usage.task_done(
+                    len(runner_results.get('contacted', {}))
+                    + len(runner_results.get('dark', {}))
+                    )
+        callbacks.AggregateStats.compute(
+                self,
+                runner_results,
+                setup=setup,
+                poll=poll,
+                ignore_errors=ignore_errors,
+                )
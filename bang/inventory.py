@@ -14,7 +14,9 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
-from .util import deep_merge_dicts
+import os
+
+from .util import expand_host_vars, freeze, merge_frozen, thaw
 import ansible.inventory
 from ansible.inventory.group import Group
 from ansible.inventory.host import Host
@@ -43,13 +45,56 @@ def get_ansible_groups(group_map):
     return groups
 
 
+def vars_files_signature(*basedirs):
+    """
+    Returns a value that changes whenever any file in the ``host_vars`` or
+    ``group_vars`` directories under :attr:`basedirs` is added, removed or
+    modified.
+
+    """
+    sig = []
+    for basedir in basedirs:
+        if not basedir:
+            continue
+        for subdir in ('host_vars', 'group_vars'):
+            for root, dirs, files in os.walk(os.path.join(basedir, subdir)):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    sig.append((path, st.st_mtime, st.st_size))
+    return sorted(sig)
+
+
+class _VarsPerHost(dict):
+    """
+    The base Inventory's per-host vars cache.  The ``group_by`` action plugin
+    deletes a host's entry when it changes the host's groups, which also makes
+    any merged vars for the host stale.
+
+    """
+    def __init__(self, on_delete):
+        super(_VarsPerHost, self).__init__()
+        self.on_delete = on_delete
+
+    def __delitem__(self, hostname):
+        super(_VarsPerHost, self).__delitem__(hostname)
+        self.on_delete(hostname)
+
+
 class BangsibleInventory(ansible.inventory.Inventory):
-    def __init__(self, groups, hostvars, vault_password=None):
+    def __init__(self, groups, hostvars, vault_password=None,
+            class_vars=None):
         super(BangsibleInventory, self).__init__(
                 host_list=None,
                 vault_password=vault_password
                 )
         self.groups = get_ansible_groups(groups)
+        # the base class may already have matched patterns (e.g. ``all``)
+        # against its own, empty, list of groups
+        self.clear_pattern_cache()
 
         # Prepopulate the cache.  The base Inventory only gathers host vars as
         # necessary (to avoid repeated execs of the inventory script), and
@@ -57,15 +102,67 @@ class BangsibleInventory(ansible.inventory.Inventory):
         # BangsibleInventory, it already has all of the hostvars so we just set
         # the cache to be the hostvars dict.
         self._bang_vars_per_host = hostvars
+        # frozen once per server class, so that every host of the class can
+        # share them (see get_variables())
+        self._bang_class_vars = dict(
+                (k, freeze(v)) for k, v in (class_vars or {}).iteritems()
+                )
+
+        # ansible asks for a host's variables several times per task.  The
+        # result of merging the bang hostvars onto ansible's own (group and
+        # host vars files, etc...) is cached per host, and only thrown away
+        # when the vars files or the host's groups change.
+        self._merged_vars = {}
+        self._vars_files_sig = None
+        self._vars_per_host = _VarsPerHost(self._forget_host)
 
     def is_file(self):
         return False
 
-    def get_variables(self, hostname, vault_password=None):
-        hvars = super(BangsibleInventory, self).get_variables(
-                hostname,
-                vault_password,
-                )
-        if hostname not in ['127.0.0.1', 'localhost']:
-            deep_merge_dicts(hvars, self._bang_vars_per_host[hostname])
-        return hvars
+    def _forget_host(self, hostname):
+        self._merged_vars.pop(hostname, None)
+
+    def add_group(self, group):
+        super(BangsibleInventory, self).add_group(group)
+        self._merged_vars.clear()
+
+    def set_playbook_basedir(self, dir):
+        super(BangsibleInventory, self).set_playbook_basedir(dir)
+        # the base class replaces its per-host cache whenever the basedir
+        # changes
+        if not isinstance(self._vars_per_host, _VarsPerHost):
+            self._vars_per_host = _VarsPerHost(self._forget_host)
+        sig = vars_files_signature(self.basedir(), self.playbook_basedir())
+        if sig != self._vars_files_sig:
+            self._vars_files_sig = sig
+            self._merged_vars.clear()
+
+    def get_variables(self, hostname, update_cached=False,
+            vault_password=None):
+        bang_vars = self._bang_vars_per_host.get(hostname)
+        if bang_vars is None or hostname in ['127.0.0.1', 'localhost']:
+            return super(BangsibleInventory, self).get_variables(
+                    hostname,
+                    update_cached,
+                    vault_password,
+                    )
+        if update_cached:
+            self._forget_host(hostname)
+        hvars = self._merged_vars.get(hostname)
+        if hvars is None:
+            hvars = super(BangsibleInventory, self).get_variables(
+                    hostname,
+                    update_cached,
+                    vault_password,
+                    )
+            # the merged vars are frozen, so that they can share the stack's
+            # hostvars (and ansible can never modify them) without copying
+            hvars = merge_frozen(
+                    hvars,
+                    freeze(expand_host_vars(bang_vars, self._bang_class_vars)),
+                    )
+            self._merged_vars[hostname] = hvars
+
+        # each caller gets its own mutable copy, in case it modifies the vars
+        # in place.  the nested vars are only copied if the caller reads them.
+        return thaw(hvars)
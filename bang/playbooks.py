@@ -0,0 +1,152 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Ordering of the ``playbooks`` in a stack config.
+
+Each entry in the list is either the name of a playbook file, or a mapping
+that also declares which inventory groups the playbook targets, and which
+other playbooks it must run after.  E.g.::
+
+    playbooks:
+    - common.yml
+    - playbook: db_tuning.yml
+      groups:
+      - db_servers
+    - playbook: web_frontend.yml
+      groups:
+      - web_servers
+    - playbook: web_app.yml
+      groups:
+      - web_servers
+      after:
+      - db_tuning.yml
+
+A playbook waits for every earlier playbook that shares one of its groups, or
+that it names in ``after``.  Plain playbook names, and mappings without any
+``groups``, may touch any host, so they wait for all of the earlier playbooks
+and all of the later playbooks wait for them.  In the example above,
+``db_tuning.yml`` and ``web_frontend.yml`` run concurrently once
+``common.yml`` is done.
+
+"""
+from . import BangError, attributes as A
+
+
+#: The :class:`ansible.callbacks.AggregateStats` attributes that count
+#: per-host results.
+STATS_COUNTERS = ('processed', 'failures', 'ok', 'dark', 'changed', 'skipped')
+
+
+class Playbook(object):
+    """One entry of the ``playbooks`` list."""
+    def __init__(self, entry):
+        if isinstance(entry, basestring):
+            entry = {A.playbook.PLAYBOOK: entry}
+        try:
+            self.name = entry[A.playbook.PLAYBOOK]
+        except KeyError:
+            raise BangError('Playbook entry has no playbook: %r' % (entry, ))
+        groups = entry.get(A.playbook.GROUPS)
+        self.groups = set(groups) if groups else None
+        self.after = set(entry.get(A.playbook.AFTER, []))
+
+    def overlaps(self, other):
+        """
+        Returns ``True`` if this playbook and :attr:`other` may target the
+        same hosts.
+
+        """
+        if self.groups is None or other.groups is None:
+            return True
+        return bool(self.groups & other.groups)
+
+    def host_count(self, groups, hosts):
+        """
+        Returns how many of the :attr:`hosts` this playbook targets, given the
+        inventory :attr:`groups`.
+
+        """
+        if self.groups is None:
+            return len(hosts)
+        targets = set()
+        for gname in self.groups:
+            targets.update(groups.get(gname, []))
+        return len(targets & set(hosts))
+
+
+def get_playbooks(entries):
+    """
+    Returns a :class:`list` of :class:`Playbook` objects for the
+    ``playbooks`` config :attr:`entries`.
+
+    """
+    return [Playbook(e) for e in entries]
+
+
+def is_parallel(entries):
+    """
+    Returns ``True`` if any of the ``playbooks`` config :attr:`entries`
+    declares its groups or dependencies, i.e. the playbooks need not simply run
+    one after another.
+
+    """
+    return any(not isinstance(e, basestring) for e in entries)
+
+
+def get_dependencies(playbooks):
+    """
+    Returns a :class:`list` holding, for each of the :attr:`playbooks`, the
+    :class:`set` of indexes of the earlier playbooks it must wait for.
+
+    """
+    deps = []
+    for i, pb in enumerate(playbooks):
+        names = set(p.name for p in playbooks[:i])
+        unknown = pb.after - names
+        if unknown:
+            raise BangError(
+                    'Playbook %s must run after playbooks that are not listed '
+                    'before it: %s' % (pb.name, ', '.join(sorted(unknown)))
+                    )
+        deps.append(set(
+                j for j, earlier in enumerate(playbooks[:i])
+                if earlier.name in pb.after or pb.overlaps(earlier)
+                ))
+    return deps
+
+
+def stats_to_dict(stats):
+    """
+    Returns the per-host counters of :attr:`stats` (an
+    :class:`ansible.callbacks.AggregateStats`) as a picklable
+    :class:`dict`.
+
+    """
+    return dict((attr, dict(getattr(stats, attr))) for attr in STATS_COUNTERS)
+
+
+def merge_stats(stats, counters):
+    """
+    Adds the per-host :attr:`counters` from :func:`stats_to_dict` onto
+    :attr:`stats`.
+
+    """
+    for attr, hosts in counters.iteritems():
+        totals = getattr(stats, attr)
+        for host, count in hosts.iteritems():
+            totals[host] = totals.get(host, 0) + count
+    return stats
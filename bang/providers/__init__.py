@@ -14,28 +14,51 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
-from .aws import AWS
+import importlib
+import json
 
+from .. import BangError
+
+#: The provider classes by name, as ``(module, class)``.  Each module is only
+#: imported when a config stanza uses its provider, so that commands which
+#: never talk to a provider (e.g. ``bang --list`` from the inventory cache)
+#: don't pay for importing every provider's client libraries.
 PROVIDER_MAP = {
-        'aws': AWS,
+        'aws': ('bang.providers.aws', 'AWS'),
+        'hpcloud_v12': ('bang.providers.hpcloud.v12', 'HPCloudV12'),
+        'hpcloud_v13': ('bang.providers.hpcloud', 'HPCloud'),
+        'openstack': ('bang.providers.openstack', 'OpenStack'),
+        'rightscale': ('bang.providers.rs', 'RightScale'),
         }
 
-_POSSIBLE_PROVIDERS = (
-        ('hpcloud_v12', 'bang.providers.hpcloud.v12', 'HPCloudV12'),
-        ('hpcloud_v13', 'bang.providers.hpcloud', 'HPCloud'),
-        ('openstack', 'bang.providers.openstack', 'OpenStack'),
-        ('rightscale', 'bang.providers.rs', 'RightScale'),
-        )
 
-for key, mod_name, provider in _POSSIBLE_PROVIDERS:
+def get_provider_class(name):
+    """
+    Imports and returns the :class:`~bang.providers.bases.Provider` subclass
+    for the given provider name.  Returns ``None`` if there is no such
+    provider.
+
+    Raises :class:`~bang.BangError` if the provider's module cannot be
+    imported (e.g. its client libraries are not installed).
+
+    """
+    entry = PROVIDER_MAP.get(name)
+    if not entry:
+        return None
+    mod_name, class_name = entry
     try:
-        _mod = __import__(mod_name, fromlist=[provider], level=0)
-        PROVIDER_MAP[key] = getattr(_mod, provider)
-    except ImportError:
-        pass
+        mod = importlib.import_module(mod_name)
+    except ImportError as e:
+        raise BangError(
+                'Could not import %s for the %s provider: %s'
+                % (mod_name, name, e)
+                )
+    return getattr(mod, class_name)
 
 
-# provider object cache:
+# provider object cache, keyed by provider name and credentials.  a long-lived
+# process (i.e. ``bang --daemon``) may serve stacks with different credentials
+# for the same provider.
 _PROVIDERS = {}
 
 
@@ -54,15 +77,16 @@ def get_provider(name, creds):
     :rtype:  :class:`~bang.providers.provider.Provider`
 
     """
-    p = _PROVIDERS.get(name)
+    key = (name, json.dumps(creds, sort_keys=True, default=str))
+    p = _PROVIDERS.get(key)
     if not p:
-        provider = PROVIDER_MAP.get(name)
+        provider = get_provider_class(name)
         if not provider:
             if name == 'hpcloud':
                 print "## Warning - 'hpcloud' is not currently supported as" \
                     "a provider; use hpcloud_v12 or hpcloud_v13. See " \
                     "release notes."
-            raise Exception("No provider matches %s; check imports" % name)
+            raise Exception("No provider matches %s" % name)
         p = provider(creds)
-        _PROVIDERS[name] = p
+        _PROVIDERS[key] = p
     return p
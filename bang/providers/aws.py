@@ -21,11 +21,22 @@ import time
 
 from .. import BangError, TimeoutError, resources as R, attributes as A
 from ..util import log, poll_with_timeout
-from .bases import Provider, Consul
+from .bases import Provider, Consul, api_request, common_tags, tags_match
 
 
 DEFAULT_TIMEOUT_S = 120
 
+# error codes with which AWS APIs reject requests when the caller is sending
+# too many.  EC2 uses a 503 status for RequestLimitExceeded, so these have to be
+# checked before the generic status code checks.
+THROTTLE_ERROR_CODES = (
+        'RequestLimitExceeded',
+        'Throttling',
+        'ThrottlingException',
+        'RequestThrottled',
+        'SlowDown',
+        )
+
 
 def server_to_dict(server):
     """
@@ -105,8 +116,30 @@ class EC2SecGroup(object):
         self.ec2sg = ec2sg
 
 
-class EC2(Consul):
+class AWSConsul(Consul):
+    """Recognizes throttling error codes returned by any of the AWS APIs."""
+
+    def is_throttle_error(self, exc):
+        if getattr(exc, 'error_code', None) in THROTTLE_ERROR_CODES:
+            return True
+        return super(AWSConsul, self).is_throttle_error(exc)
+
+    def is_transient_error(self, exc):
+        if self.is_throttle_error(exc):
+            return False
+        return super(AWSConsul, self).is_transient_error(exc)
+
+
+class EC2(AWSConsul):
     """The consul for the compute service in AWS (EC2)."""
+
+    API_FAMILY = 'ec2'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 10,
+            A.rate_limit.BURST: 50,
+            A.rate_limit.MAX_CONCURRENCY: 20,
+            }
+
     def __init__(self, *args, **kwargs):
         super(EC2, self).__init__(*args, **kwargs)
         creds = self.provider.creds
@@ -130,6 +163,7 @@ class EC2(Consul):
                 aws_secret_access_key=self.secret_key,
                 )
 
+    @api_request
     def find_servers(self, tags, running=True):
         """
         Returns any servers in the region that have tags that match the
@@ -154,6 +188,29 @@ class EC2(Consul):
         log.debug('instances: %s' % instances)
         return instances
 
+    @api_request
+    def find_servers_by_tags(self, tag_sets, running=True):
+        """
+        Lists the servers in the region that have the tags common to all of
+        :attr:`tag_sets` once, then matches them to each mapping in
+        :attr:`tag_sets`.  See
+        :meth:`~bang.providers.bases.Consul.find_servers_by_tags`.
+
+        """
+        filters = dict(
+                ('tag:%s' % key, val)
+                for key, val in common_tags(tag_sets).items()
+                )
+        if running:
+            filters['instance-state-name'] = 'running'
+
+        res = self.ec2.get_all_instances(filters=filters)
+        instances = [i for r in res for i in r.instances]
+        return [
+                [server_to_dict(i) for i in instances if tags_match(i.tags, t)]
+                for t in tag_sets
+                ]
+
     def find_running(self, server_attrs, timeout_s):
         return server_attrs
 
@@ -214,7 +271,8 @@ class EC2(Consul):
                         % secgroups
                         )
 
-        res = self.ec2.run_instances(
+        res = self.request_once(
+                self.ec2.run_instances,
                 disk_image_id,
                 instance_type=instance_type,
                 key_name=ssh_key_name,
@@ -229,21 +287,26 @@ class EC2(Consul):
         def apply_tags():
             try:
                 for key, val in tags.items():
-                    instance.add_tag(key, val)
+                    self.request(instance.add_tag, key, val)
                 return True
             except EC2ResponseError:
                 pass
-        if not poll_with_timeout(timeout_s, apply_tags, 5):
+        # tagging usually succeeds within a second or two of the launch, so
+        # poll quickly at first.
+        if not poll_with_timeout(timeout_s, apply_tags, 5, policy=R.SERVERS,
+                fast_phase_s=10):
             raise TimeoutError('Could not tag server %s' % instance.id)
 
         def find_running_instance():
-            if instance.update() == 'running':
+            if self.request(instance.update) == 'running':
                 return instance
-        running = poll_with_timeout(timeout_s, find_running_instance, 5)
+        running = poll_with_timeout(timeout_s, find_running_instance, 5,
+                policy=R.SERVERS)
         if not running:
             raise TimeoutError('Could not launch server within allotted time.')
         return server_to_dict(running)
 
+    @api_request
     def find_secgroup(self, name):
         """
         Find a security group by name.
@@ -264,7 +327,11 @@ class EC2(Consul):
         :param str description:  A short description of the group.
 
         """
-        return self.ec2.create_security_group(name, description)
+        return self.request_once(
+                self.ec2.create_security_group,
+                name,
+                description,
+                )
         log.debug("... created group %s" % name)
 
     def create_secgroup_rule(self, protocol, from_port, to_port,
@@ -293,16 +360,24 @@ class EC2(Consul):
             kwargs['cidr_ip'] = source
         else:
             kwargs['src_group'] = self.find_secgroup(source).ec2sg
-        sg.authorize(**kwargs)
+        self.request(sg.authorize, **kwargs)
 
     def delete_secgroup_rule(self, rule_def):
         """Deletes the security group rule identified by :attr:`rule_def`"""
         sg = rule_def.pop('target')
-        sg.revoke(**rule_def)
+        self.request(sg.revoke, **rule_def)
 
 
-class S3(Consul):
+class S3(AWSConsul):
     """The consul for the storage service in AWS (S3)."""
+
+    API_FAMILY = 's3'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 50,
+            A.rate_limit.BURST: 100,
+            A.rate_limit.MAX_CONCURRENCY: 20,
+            }
+
     def __init__(self, *args, **kwargs):
         super(S3, self).__init__(*args, **kwargs)
         creds = self.provider.creds
@@ -332,12 +407,12 @@ class S3(Consul):
         :param str name: E.g. 'mybucket'
         """
         log.info('Creating bucket %s...' % name)
-        self.s3.create_bucket(name)
+        self.request_once(self.s3.create_bucket, name)
 
 
 
-class RDS(Consul):
-    pass
+class RDS(AWSConsul):
+    API_FAMILY = 'rds'
 
 
 class AWS(Provider):
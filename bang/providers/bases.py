@@ -15,7 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
 import random
+import socket
 import string
+import time
+from functools import wraps
+
+from .. import attributes as A
+from ..util import log
 
 # at least RDS appears to force lowercase even if you pass in mixed case
 _AWS_NAME_CHARS = string.lowercase + string.digits
@@ -66,6 +72,45 @@ class Provider(object):
             return consul(self)
 
 
+def common_tags(tag_sets):
+    """
+    Returns the key-value pairs that are present in every one of the
+    :attr:`tag_sets` mappings.
+
+    """
+    if not tag_sets:
+        return {}
+    common = set(tag_sets[0].items())
+    for tags in tag_sets[1:]:
+        common &= set(tags.items())
+    return dict(common)
+
+
+def tags_match(server_tags, wanted):
+    """
+    Returns ``True`` if :attr:`server_tags` has every key-value pair in
+    :attr:`wanted`.
+
+    """
+    return all(server_tags.get(k) == v for k, v in wanted.items())
+
+
+def api_request(f):
+    """
+    Decorator for :class:`Consul` methods that make a single, idempotent
+    provider API request.  The whole method is run with :meth:`Consul.request`,
+    so it is rate limited and retried on throttling and transient errors.
+
+    Methods that make several requests should pass each one to
+    :meth:`Consul.request` (or :meth:`Consul.request_once`) instead.
+
+    """
+    @wraps(f)
+    def wrapper(self, *args, **kwargs):
+        return self.request(f, self, *args, **kwargs)
+    return wrapper
+
+
 class Consul(object):
     """
     The base class for all service consuls.
@@ -76,5 +121,175 @@ class Consul(object):
 
     """
 
+    #: Consuls for the same provider, region and API family share a rate
+    #: limiter.  Subclasses should set this to the name of the provider API
+    #: they talk to (e.g. ``ec2``, ``nova``).
+    API_FAMILY = 'default'
+
+    #: The default request rate limit for :attr:`API_FAMILY`.  This can be
+    #: overridden in the ``rate_limits`` config stanza.
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 5,
+            A.rate_limit.BURST: 10,
+            A.rate_limit.MAX_CONCURRENCY: 10,
+            }
+
+    #: HTTP status codes with which the provider rejects requests because the
+    #: caller is sending too many.
+    THROTTLE_STATUSES = (413, 429)
+
+    #: HTTP status codes that indicate a temporary provider-side failure.
+    TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+    #: How many times :meth:`request` retries a failed request.
+    MAX_RETRIES = 6
+
+    #: The backoff ceiling in seconds for the first retry.  It doubles with
+    #: every subsequent retry, up to :attr:`MAX_RETRY_DELAY_S`.
+    RETRY_DELAY_S = 1
+
+    MAX_RETRY_DELAY_S = 30
+
     def __init__(self, provider):
         self.provider = provider
+
+        # a :class:`~bang.util.TokenBucket` shared with every other consul
+        # (in every deployer process) that talks to the same API.  assigned
+        # by the deployer factory.
+        self.rate_limiter = None
+
+        # a :class:`~bang.util.AdaptiveConcurrency` shared the same way.
+        self.concurrency = None
+
+    def throttle(self):
+        """Blocks until the rate limiter allows another API request."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def error_status(self, exc):
+        """
+        Returns the HTTP status code carried by the provider client exception
+        :attr:`exc`, or ``None``.
+
+        """
+        for attr in ('status', 'code', 'http_status'):
+            status = getattr(exc, attr, None)
+            if isinstance(status, (int, long)):
+                return status
+        response = getattr(exc, 'response', None)
+        return getattr(response, 'status_code', None)
+
+    def is_throttle_error(self, exc):
+        """
+        Returns ``True`` if :attr:`exc` means the provider rejected a request
+        because we are sending too many.  Subclasses should extend this with
+        their provider's throttling error codes.
+
+        """
+        return self.error_status(exc) in self.THROTTLE_STATUSES
+
+    def is_transient_error(self, exc):
+        """
+        Returns ``True`` if :attr:`exc` is a temporary failure that is likely
+        to go away if the request is retried.
+
+        """
+        if isinstance(exc, socket.error):
+            return True
+        return self.error_status(exc) in self.TRANSIENT_STATUSES
+
+    def retry_delay(self, exc, attempt):
+        """
+        Returns the number of seconds to wait before retry number
+        :attr:`attempt` (starting at 0) of a request that failed with
+        :attr:`exc`.
+
+        Uses exponential backoff with full jitter, but never waits less than
+        any ``retry_after`` hint the provider client put on the exception.
+
+        """
+        ceiling = min(self.MAX_RETRY_DELAY_S, self.RETRY_DELAY_S * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        try:
+            return max(delay, float(getattr(exc, 'retry_after', None) or 0))
+        except (TypeError, ValueError):
+            return delay
+
+    def request(self, func, *args, **kwargs):
+        """
+        Calls :attr:`func` with the given arguments as a single provider API
+        request and returns its result.
+
+        The request waits for the rate limiter and for a slot in the
+        concurrency controller.  If it fails with a throttling or transient
+        error (see :meth:`is_throttle_error` and :meth:`is_transient_error`),
+        it is retried with backoff, up to :attr:`MAX_RETRIES` times.
+        Throttling errors also lower the number of requests that all of the
+        deployers sharing the controller may have in flight, and successes
+        raise it again.
+
+        Only use this for requests that are safe to repeat.  See
+        :meth:`request_once`.
+
+        """
+        return self._request(True, func, args, kwargs)
+
+    def request_once(self, func, *args, **kwargs):
+        """
+        Like :meth:`request`, but only retries throttling errors, which the
+        provider raises *before* acting on a request.  Use this for requests
+        that create resources, where repeating a request that failed in some
+        other way could create duplicates.
+
+        """
+        return self._request(False, func, args, kwargs)
+
+    def find_servers_by_tags(self, tag_sets, running=True):
+        """
+        The bulk version of ``find_servers`` used to gather inventory.
+
+        Returns a :class:`list` with one entry per mapping in
+        :attr:`tag_sets`, each of which is the :class:`list` of servers whose
+        tags match that mapping.
+
+        Consuls that can list every server in a region at once should
+        override this to make a single request and match the tags in memory.
+        This fallback makes one ``find_servers`` request per mapping.
+
+        """
+        return [self.find_servers(tags, running) for tags in tag_sets]
+
+    def _request(self, idempotent, func, args, kwargs):
+        concurrency = self.concurrency
+        attempt = 0
+        while True:
+            self.throttle()
+            if concurrency:
+                concurrency.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if concurrency:
+                    concurrency.release()
+                throttled = self.is_throttle_error(e)
+                if throttled and concurrency:
+                    concurrency.throttled()
+                retry = throttled or (
+                        idempotent and self.is_transient_error(e)
+                        )
+                if not retry or attempt >= self.MAX_RETRIES:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                log.warn(
+                        '%s request failed (%s), retrying in %0.1f s'
+                        % (self.API_FAMILY,
+                            'throttled' if throttled else e,
+                            delay)
+                        )
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if concurrency:
+                concurrency.release()
+                concurrency.succeeded()
+            return result
@@ -14,66 +14,60 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import time
+
 import pymysql
 from novaclient.client import Client as NovaClient
 
-from ... import attributes as A, resources as R
+from ... import TimeoutError, attributes as A, resources as R
 from ...util import log, poll_with_timeout
-from ..openstack import (OpenStack, Nova, RedDwarf,
-        DEFAULT_STORAGE_SIZE_GB, DEFAULT_TIMEOUT_S, db_to_dict)
+from ..openstack import (OpenStack, Nova, RedDwarf, DEFAULT_TIMEOUT_S,
+        db_to_dict)
 from .reddwarf import HPDbaas
 from .load_balancer import HPLoadBalancer
 
 
 class HPRedDwarf(RedDwarf):
-    def create_db(self, instance_name, instance_type,
-            admin_username, admin_password, security_groups=None, db_name=None,
-            storage_size_gb=DEFAULT_STORAGE_SIZE_GB,
+    def wait_for_db(self, db, admin_username, admin_password,
             timeout_s=DEFAULT_TIMEOUT_S):
         """
-        Creates a database instance.
-
-        This method blocks until the db instance is active, or until
-        :attr:`timeout_s` has elapsed.
+        Blocks until the db instance launched by
+        :meth:`~bang.providers.openstack.RedDwarf.launch_db` is active and
+        accepting connections, or until :attr:`timeout_s` has elapsed.
 
         By default, hpcloud *assigns* an automatically-generated set of
-        credentials for an admin user.  In addition to launching the db
-        instance, this method uses the autogenerated credentials to login to
-        the server and create the intended admin user based on the credentials
-        supplied as method arguments.
+        credentials for an admin user.  Once the db instance is reachable, this
+        method uses the autogenerated credentials to login to the server and
+        create the intended admin user based on the credentials supplied as
+        method arguments.
 
-        :param str instance_name:  A name to assign to the db instance.
-
-        :param str instance_type:  The server instance type (e.g. ``medium``).
+        :param db:  The handle returned by
+            :meth:`~bang.providers.openstack.RedDwarf.launch_db`.
 
         :param str admin_username:  The admin username.
 
         :param str admin_password:  The admin password.
 
-        :param security_groups:  *Not used in hpcloud*.
-
-        :param str db_name:  The database name.  If this is not specified, the
-            database will be named the same as the :attr:`instance_name`.
-
-        :param int storage_size_gb:  The size of the storage volume in GB.
-
-        :param float timeout_s:  The number of seconds to poll for an active
-            database server before failing.  This value is also used when
-            attempting to connect to the running mysql server.
+        :param float timeout_s:  The number of seconds to wait for an active
+            database server before failing.  Polling for the status, waiting
+            for the port and logging in to the mysql server all share this
+            budget.
 
         :rtype:  :class:`dict`
 
         """
-        db = self._create_db(instance_name, instance_type,
-                storage_size_gb)
-
         # hang on to these... hpcloud only provides a way to generate a new
         # set of username/password - there is no way to retrieve the originals.
         default_creds = db.credential
-        log.debug('Credentials for %s: %s' % (instance_name, default_creds))
+        log.debug('Credentials for %s: %s' % (db.name, default_creds))
 
+        deadline = time.time() + timeout_s
         instance = self._poll_instance_status(db, timeout_s)
 
+        # a cheap TCP probe tells us when mysqld is listening, so by the time
+        # we try to login it should succeed on the first attempt or two.
+        self._wait_for_port(instance, max(0, deadline - time.time()))
+
         # we're taking advantage of a security bug in hpcloud's dbaas security
         # group rules.  the default *security* is to allow connections from
         # everywhere in the world.
@@ -85,15 +79,20 @@ class HPRedDwarf(RedDwarf):
                         # db=self.database,
                         user=default_creds['username'],
                         passwd=default_creds['password'],
-                        connect_timeout=timeout_s,
+                        connect_timeout=max(1, deadline - time.time()),
                         )
             except:
-                log.warn("Could not connect to db, %s" % instance_name)
+                log.warn("Could not connect to db, %s" % db.name)
                 # log.debug("Connection exception", exc_info=True)
 
-        log.info("Connecting to %s..." % instance_name)
-        db = poll_with_timeout(timeout_s, connect, 10)
-        cur = db.cursor()
+        log.info("Connecting to %s..." % db.name)
+        conn = poll_with_timeout(max(0, deadline - time.time()), connect, 2,
+                policy=R.DATABASES)
+        if not conn:
+            raise TimeoutError(
+                    'Could not login to db %s within allotted time.' % db.id
+                    )
+        cur = conn.cursor()
         cur.execute(
                 "grant all privileges on *.* "
                 "to '%s'@'%%' identified by '%s' "
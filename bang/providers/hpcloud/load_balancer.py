@@ -1,8 +1,10 @@
 import requests
 import json
+from ... import attributes as A
 from ...util import log
+from ..bases import Consul
 
-class HPLoadBalancer():
+class HPLoadBalancer(Consul):
     """
     Convenience functions to manage HP cloud LBaaS instances. 
     LBaaS uses its own AZ-independent public URL for management,
@@ -14,17 +16,30 @@ class HPLoadBalancer():
     TODO: The beta api doesn't seem to support tags, which we use elsewhere
     for filtering a stack. Instead this'll use 'name'
     """
+
+    API_FAMILY = 'lbaas'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 2,
+            A.rate_limit.BURST: 5,
+            A.rate_limit.MAX_CONCURRENCY: 4,
+            }
+
     def __init__(self, hpcloud):
         """
         Provide a management URL (from the openstack service catalog)
         and auth token (which can be pinched from novaclient)
         """
+        super(HPLoadBalancer, self).__init__(hpcloud)
         self.auth_token = hpcloud.os_auth_token
         self.catalog = filter(lambda c: c['name'] == 'Load Balancer', 
                               hpcloud.os_catalog['access']['serviceCatalog'])
 
         self.management_url = None
 
+        # an optional :class:`~bang.util.SharedNameIndex` of the load
+        # balancers in this region.  see :meth:`find_lb_by_name`.
+        self.name_index = None
+
     def set_region(self, region_name):
         region_lb = filter(lambda c: c['region'] == region_name,
                                    self.catalog[0]['endpoints'])
@@ -66,7 +81,13 @@ class HPLoadBalancer():
         :rtype :class:`dict`
         """
         log.debug("Finding load balancers matching name '%s'" % name)
-        matching = filter(lambda l: l['name'] == name, self.list_lbs())
+        if self.name_index is not None:
+            matching = self.name_index.get(
+                    name,
+                    lambda: ((l['name'], l) for l in self.list_lbs())
+                    )
+        else:
+            matching = filter(lambda l: l['name'] == name, self.list_lbs())
         if len(matching) > 1:
             raise ValueError("Ambiguous; more than one load balancer matched '%s'" % name)
         if matching:
@@ -112,6 +133,7 @@ class HPLoadBalancer():
         if algorithm:
             data['algorithm'] = algorithm
         resp, body = self._request('post', '/loadbalancers', data=data)
+        self._invalidate_name_index()
         return body
 
     def delete_lb(self, lb_id):
@@ -122,6 +144,7 @@ class HPLoadBalancer():
         """
         log.info("Deleting load balancer %s" % lb_id)
         self._request('delete', '/loadbalancers/%s' % lb_id)
+        self._invalidate_name_index()
 
     def add_lb_nodes(self, lb_id, nodes):
         """
@@ -209,6 +232,15 @@ class HPLoadBalancer():
                 '/loadbalancers/%s/nodes/%s' % (lb_id, node_id),
                 data={'condition': condition})
         
+    def is_transient_error(self, exc):
+        if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+            return True
+        return super(HPLoadBalancer, self).is_transient_error(exc)
+
+    def _invalidate_name_index(self):
+        if self.name_index is not None:
+            self.name_index.invalidate()
+
     def _request(self, method, url, data=None, **kwargs):
         if not self.management_url:
             raise Exception("Call set_region first")
@@ -221,7 +253,17 @@ class HPLoadBalancer():
                 kwargs['data'] = data
 
         url = '%s%s' % (self.management_url, url)
-        resp = requests.request(method, url, **kwargs)
+
+        def send():
+            resp = requests.request(method, url, **kwargs)
+            resp.raise_for_status()
+            return resp
+
+        # a POST creates something, so only retry it if it was throttled
+        if method == 'post':
+            resp = self.request_once(send)
+        else:
+            resp = self.request(send)
         if resp.text:
             try:
                 body = json.loads(resp.text)
@@ -229,6 +271,5 @@ class HPLoadBalancer():
                 body = None
         else:
             body = None
-        resp.raise_for_status()
         return resp, body
 
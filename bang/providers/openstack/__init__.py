@@ -14,14 +14,15 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import time
 from functools import wraps
 from novaclient.client import Client as NovaClient
 from swiftclient.client import Connection as SwiftConn
 from reddwarfclient import Dbaas
 
 from ... import BangError, TimeoutError, resources as R, attributes as A
-from ...util import log, poll_with_timeout
-from ..bases import Provider, Consul
+from ...util import log, poll_with_timeout, wait_for_tcp_port
+from ..bases import Provider, Consul, api_request, tags_match
 
 
 DEFAULT_TIMEOUT_S = 120
@@ -120,6 +121,8 @@ class NovaSecGroup(object):
 class Nova(Consul):
     """The consul for the OpenStack compute service."""
 
+    API_FAMILY = 'nova'
+
     def __init__(self, *args, **kwargs):
         super(Nova, self).__init__(*args, **kwargs)
         self.nova = self.provider.nova_client
@@ -133,6 +136,7 @@ class Nova(Consul):
             )
         client.set_management_url(management_url.rstrip('/'))
 
+    @api_request
     def find_ssh_pub_key(self, name):
         """
         Returns ``True`` if an SSH key named :attr:`name` is found.
@@ -152,8 +156,9 @@ class Nova(Consul):
         instances.
 
         """
-        self.nova.keypairs.create(name, key)
+        self.request_once(self.nova.keypairs.create, name, key)
 
+    @api_request
     def find_servers(self, tags, running=True):
         """
         Returns any servers in the region that have tags that match the
@@ -174,14 +179,28 @@ class Nova(Consul):
         if running:
             search_opts['status'] = 'ACTIVE'
         all_servers = self.nova.servers.list(search_opts=search_opts)
-        servers = []
-        for s in all_servers:
-            md = s.metadata
-            mismatches = [k for k, v in tags.items() if v != md.get(k)]
-            if mismatches:
-                continue
-            servers.append(server_to_dict(s))
-        return servers
+        return [
+                server_to_dict(s) for s in all_servers
+                if tags_match(s.metadata, tags)
+                ]
+
+    @api_request
+    def find_servers_by_tags(self, tag_sets, running=True):
+        """
+        Lists the servers in the region once, then matches them to each
+        mapping in :attr:`tag_sets`.  See
+        :meth:`~bang.providers.bases.Consul.find_servers_by_tags`.
+
+        """
+        search_opts = {}
+        if running:
+            search_opts['status'] = 'ACTIVE'
+        all_servers = self.nova.servers.list(search_opts=search_opts)
+        return [
+                [server_to_dict(s) for s in all_servers
+                    if tags_match(s.metadata, tags)]
+                for tags in tag_sets
+                ]
 
     def find_running(self, server_attrs, timeout_s):
         return server_attrs
@@ -230,8 +249,9 @@ class Nova(Consul):
         nova = self.nova
         name = self.provider.gen_component_name(basename)
         log.info('Launching server %s... this could take a while...' % name)
-        flavor = nova.flavors.find(name=instance_type)
-        server = nova.servers.create(
+        flavor = self.request(nova.flavors.find, name=instance_type)
+        server = self.request_once(
+                nova.servers.create,
                 name,
                 disk_image_id,
                 flavor,
@@ -242,11 +262,12 @@ class Nova(Consul):
                 )
 
         def find_active():
-            s = nova.servers.get(server.id)
+            s = self.request(nova.servers.get, server.id)
             if s and s.status == 'ACTIVE':
                 return s
 
-        instance = poll_with_timeout(timeout_s, find_active, 5)
+        instance = poll_with_timeout(timeout_s, find_active, 5,
+                policy=R.SERVERS)
         if not instance:
             raise TimeoutError(
                     'Server %s failed to launch within allotted time.'
@@ -255,12 +276,13 @@ class Nova(Consul):
 
         if floating_ip:
             log.info('Creating floating ip for %s', name)
-            floating_ip = nova.floating_ips.create()
-            server.add_floating_ip(floating_ip)
+            floating_ip = self.request_once(nova.floating_ips.create)
+            self.request(server.add_floating_ip, floating_ip)
             log.info('Created floating ip %s for %s', floating_ip.ip, name)
 
         return server_to_dict(instance)
 
+    @api_request
     def find_secgroup(self, name):
         """
         Find a security group by name.
@@ -281,7 +303,7 @@ class Nova(Consul):
         :param str desc:  A short description of the group.
 
         """
-        self.nova.security_groups.create(name, desc)
+        self.request_once(self.nova.security_groups.create, name, desc)
 
     def create_secgroup_rule(self, protocol, from_port, to_port,
             source, target):
@@ -298,7 +320,7 @@ class Nova(Consul):
         nova = self.nova
 
         def get_id(gname):
-            sg = nova.security_groups.find(name=gname)
+            sg = self.request(nova.security_groups.find, name=gname)
             if not sg:
                 raise BangError("Security group not found, %s" % gname)
             return str(sg.id)
@@ -316,19 +338,30 @@ class Nova(Consul):
             # not sure if this is an openstack hack or an hpcloud hack, but
             # this is definitely required to get it working on hpcloud:
             kwargs['cidr'] = 'null'
-        nova.security_group_rules.create(**kwargs)
+        self.request_once(nova.security_group_rules.create, **kwargs)
 
+    @api_request
     def delete_secgroup_rule(self, rule_id):
         """Deletes the security group rule identified by :attr:`rule_id`"""
         self.nova.security_group_rules.delete(rule_id)
 
 
 class Swift(Consul):
+
+    API_FAMILY = 'swift'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 10,
+            A.rate_limit.BURST: 20,
+            A.rate_limit.MAX_CONCURRENCY: 10,
+            }
+
+    @api_request
     def find_buckets(self, prefix):
         _, buckets = self.provider.swift_client.get_account(prefix=prefix)
         # TODO: standardize the return value across providers
         return buckets
 
+    @api_request
     def create_bucket(self, name, headers=None):
         """
         Creates a bucket named :attr:`name`.
@@ -340,10 +373,44 @@ class Swift(Consul):
 
 
 class RedDwarf(Consul):
+
+    API_FAMILY = 'reddwarf'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 2,
+            A.rate_limit.BURST: 5,
+            A.rate_limit.MAX_CONCURRENCY: 4,
+            }
+
+    def __init__(self, *args, **kwargs):
+        super(RedDwarf, self).__init__(*args, **kwargs)
+
+        # an optional :class:`~bang.util.SharedNameIndex` of the db instances
+        # in the tenant.  see :meth:`find_db_instance`.
+        self.name_index = None
+
+    def _list_db_instances(self):
+        """
+        Yields ``(name, attrs)`` pairs for every db instance in the tenant,
+        where ``attrs`` is a picklable summary of the instance.
+
+        """
+        instances = self.request(self.provider.reddwarf_client.instances.list)
+        for i in instances:
+            attrs = db_to_dict(i)
+            attrs.update({
+                'id': i.id,
+                'name': i.name,
+                'status': i.status,
+                })
+            yield i.name, attrs
+
     def find_db_instance(self, name, running=True):
         """
         Searches for a db instance named :attr:`name`.
 
+        When :attr:`name_index` is set, the lookup is answered from the shared
+        index instead of listing every db instance in the tenant.
+
         :param str name:  The name of the target db instance
 
         :param bool running:  A flag to only look for instances that are
@@ -352,46 +419,111 @@ class RedDwarf(Consul):
         :rtype:  :class:`dict`
 
         """
+        if self.name_index is not None:
+            candidates = self.name_index.get(name, self._list_db_instances)
+        else:
+            candidates = [
+                    attrs for n, attrs in self._list_db_instances()
+                    if n == name
+                    ]
         found = None
-        for i in self.provider.reddwarf_client.instances.list():
-            if i.name == name:
-                if not running:  # don't care if it's running or not
-                    found = i
-                if i.status == 'running':
-                    found = i
+        for attrs in candidates:
+            if not running:  # don't care if it's running or not
+                found = attrs
+            if attrs['status'] == 'running':
+                found = attrs
         if found:
-            log.info("Found existing db, %s (%s)" % (found.name, found.id))
-            return db_to_dict(found)
+            log.info("Found existing db, %s (%s)" % (found['name'], found['id']))
+            return dict(
+                    (k, found[k]) for k in (A.database.HOST, A.database.PORT)
+                    )
 
     def _create_db(self, instance_name, instance_type,
             storage_size_gb):
         rd = self.provider.reddwarf_client
-        flavor = rd.flavors.find(name=instance_type)
+        flavor = self.request(rd.flavors.find, name=instance_type)
         log.info('Launching db server %s...' % instance_name)
         # TODO:  Upstream RedDwarf has some notion of ``databases`` and
         # ``users``, both of which are optional args to the create() call
         # below.  Figure out what that means in practice.
-        return rd.instances.create(
+        db = self.request_once(
+                rd.instances.create,
                 instance_name,
                 flavor.links[0]['href'],
                 {'size': storage_size_gb}
                 )
+        if self.name_index is not None:
+            self.name_index.invalidate()
+        return db
 
     def _poll_instance_status(self, db, timeout_s):
         log.info('Polling for db status...')
 
         def find_active():
-            i = self.provider.reddwarf_client.instances.get(db.id)
+            i = self.request(
+                    self.provider.reddwarf_client.instances.get,
+                    db.id,
+                    )
             if i and i.status == 'running':
                 return i
 
-        instance = poll_with_timeout(timeout_s, find_active, 20)
+        instance = poll_with_timeout(timeout_s, find_active, 20,
+                policy=R.DATABASES)
         if not instance:
             raise TimeoutError(
                     'DB %s failed to launch within allotted time.' % db.id
                     )
         return instance
 
+    def launch_db(self, instance_name, instance_type, admin_username,
+            admin_password, security_groups=None, db_name=None,
+            storage_size_gb=DEFAULT_STORAGE_SIZE_GB):
+        """
+        Starts launching a database instance and returns immediately.
+
+        The return value is a handle for the launching instance.  Pass it to
+        :meth:`wait_for_db` to block until the instance is ready for use.
+
+        The arguments are the same as for :meth:`create_db`.
+
+        """
+        # TODO: investigate what upstream RedDwarf does for admin users
+        return self._create_db(instance_name, instance_type, storage_size_gb)
+
+    def wait_for_db(self, db, admin_username, admin_password,
+            timeout_s=DEFAULT_TIMEOUT_S):
+        """
+        Blocks until the db instance launched by :meth:`launch_db` is
+        *running* and accepting connections, or until :attr:`timeout_s` has
+        elapsed.
+
+        :param db:  The handle returned by :meth:`launch_db`.
+
+        :param str admin_username:  The admin username.
+
+        :param str admin_password:  The admin password.
+
+        :param float timeout_s:  The number of seconds to wait for an active
+            database server that accepts connections before failing.  Polling
+            for the status and waiting for the port share this budget.
+
+        :rtype:  :class:`dict`
+
+        """
+        deadline = time.time() + timeout_s
+        instance = self._poll_instance_status(db, timeout_s)
+        self._wait_for_port(instance, max(0, deadline - time.time()))
+        return db_to_dict(instance)
+
+    def _wait_for_port(self, instance, timeout_s):
+        log.info('Waiting for %s to accept connections...' % instance.name)
+        if not wait_for_tcp_port(instance.hostname, instance.port, timeout_s,
+                policy=A.polling.DB_PORT_PROBE):
+            raise TimeoutError(
+                    'DB %s not accepting connections within allotted time.'
+                    % instance.id
+                    )
+
     def create_db(self, instance_name, instance_type, admin_username,
             admin_password, security_groups=None, db_name=None,
             storage_size_gb=DEFAULT_STORAGE_SIZE_GB,
@@ -400,7 +532,8 @@ class RedDwarf(Consul):
         Creates a database instance.
 
         This method blocks until the db instance is active, or until
-        :attr:`timeout_s` has elapsed.
+        :attr:`timeout_s` has elapsed.  It is equivalent to calling
+        :meth:`launch_db`, then :meth:`wait_for_db`.
 
         :param str instance_name:  A name to assign to the db instance.
 
@@ -425,14 +558,11 @@ class RedDwarf(Consul):
         :rtype:  :class:`dict`
 
         """
-        # TODO: investigate what upstream RedDwarf does for admin users
-        return db_to_dict(
-                self._poll_instance_status(
-                    self._create_db(instance_name, instance_type,
-                        storage_size_gb),
-                    timeout_s
-                    )
-                )
+        db = self.launch_db(instance_name, instance_type, admin_username,
+                admin_password, security_groups=security_groups,
+                db_name=db_name, storage_size_gb=storage_size_gb)
+        return self.wait_for_db(db, admin_username, admin_password,
+                timeout_s=timeout_s)
 
 
 def authenticated(f):
@@ -1,7 +1,7 @@
 import rightscale
 import time
 
-from requests import HTTPError
+from requests import ConnectionError, HTTPError, Timeout
 from .. import TimeoutError, resources as R, attributes as A
 from ..util import log, poll_with_timeout
 from .bases import Provider, Consul
@@ -86,6 +86,14 @@ def normalize_input_value(value):
 
 class Servers(Consul):
     """The consul for the RightScale servers."""
+
+    API_FAMILY = 'rightscale'
+    RATE_LIMIT = {
+            A.rate_limit.RATE: 2,
+            A.rate_limit.BURST: 5,
+            A.rate_limit.MAX_CONCURRENCY: 4,
+            }
+
     def __init__(self, *args, **kwargs):
         super(Servers, self).__init__(*args, **kwargs)
         creds = self.provider.creds
@@ -97,15 +105,24 @@ class Servers(Consul):
         self._cloud = None
         self.deployment = None
 
+    def is_transient_error(self, exc):
+        if isinstance(exc, (ConnectionError, Timeout)):
+            return True
+        return super(Servers, self).is_transient_error(exc)
+
+    def _find_exact(self, collection, **kwargs):
+        return self.request(find_exact, collection, **kwargs)
+
     def create_stack(self, name):
         """
         Creates stack if necessary.
         """
-        deployment = find_exact(self.api.deployments, name=name)
+        deployment = self._find_exact(self.api.deployments, name=name)
         if not deployment:
             try:
                 # TODO: replace when python-rightscale handles non-json
-                self.api.client.post(
+                self.request_once(
+                        self.api.client.post,
                         '/api/deployments',
                         data={'deployment[name]': name},
                         )
@@ -120,7 +137,29 @@ class Servers(Consul):
         # TODO: make stack and role be explicit args to find_servers instead of
         # {'stack': 'foo', 'role': 'bar'}
         name = tags[A.tags.ROLE]
-        filters = ['name==%s' % name]
+        instances = self._list_instances(tags[A.STACK], running, name)
+        return [server_to_dict(i) for i in instances if i.soul['name'] == name]
+
+    def find_servers_by_tags(self, tag_sets, running=True):
+        """
+        Lists the instances in each stack's deployment once, then matches them
+        to each mapping in :attr:`tag_sets` by role.  See
+        :meth:`~bang.providers.bases.Consul.find_servers_by_tags`.
+
+        """
+        by_stack = {}
+        for tags in tag_sets:
+            stack = tags[A.STACK]
+            if stack not in by_stack:
+                by_stack[stack] = self._list_instances(stack, running)
+        return [
+                [server_to_dict(i) for i in by_stack[tags[A.STACK]]
+                    if i.soul['name'] == tags[A.tags.ROLE]]
+                for tags in tag_sets
+                ]
+
+    def _list_instances(self, stack, running, name=None):
+        filters = ['name==%s' % name] if name else []
         if running:
             filters.extend([
                 'state<>decommisioning',
@@ -129,28 +168,26 @@ class Servers(Consul):
                 'state<>stopping',
                 'state<>inactive',
                 ])
-        self.deployment = find_exact(
-                self.api.deployments,
-                name=tags[A.STACK],
-                )
+        self.deployment = self._find_exact(self.api.deployments, name=stack)
         filters.append('deployment_href==' + self.deployment.href)
         params = {'filter[]': filters, 'view': 'extended'}
-        instances = self.cloud.instances.index(params=params)
-        return [server_to_dict(i) for i in instances if i.soul['name'] == name]
+        return self.request(self.cloud.instances.index, params=params)
 
     def find_running(self, server_attrs, timeout_s):
         href = server_attrs[A.server.ID]
         res_id = href.split('/')[-1]
 
         def find_running_instance():
-            instance = self.cloud.instances.show(
+            instance = self.request(
+                    self.cloud.instances.show,
                     res_id=res_id,
                     params={'view': 'extended'},
                     )
             if instance.soul['state'] == 'operational':
                 return instance
 
-        running = poll_with_timeout(timeout_s, find_running_instance, 20)
+        running = poll_with_timeout(timeout_s, find_running_instance, 20,
+                policy=R.SERVERS)
         if not running:
             raise TimeoutError('Server not operational within allotted time.')
         return server_to_dict(running)
@@ -161,7 +198,7 @@ class Servers(Consul):
     @property
     def cloud(self):
         if not self._cloud:
-            self._cloud = find_exact(
+            self._cloud = self._find_exact(
                     self.api.clouds,
                     name=self.region_name,
                     )
@@ -177,7 +214,10 @@ class Servers(Consul):
         in various non-operational states (e.g. terminating).
         """
         filters = ['name==%s' % basename]
-        fuzzy = self.deployment.servers.index(params={'filter[]': filters})
+        fuzzy = self.request(
+                self.deployment.servers.index,
+                params={'filter[]': filters},
+                )
         matches = []
         for f in fuzzy:
             if basename != f.soul['name']:
@@ -233,14 +273,14 @@ class Servers(Consul):
         self.basename = basename
 
         # required attributes
-        tpl = find_exact(
+        tpl = self._find_exact(
                 self.api.server_templates,
                 name=server_tpl,
                 revision=server_tpl_rev,
                 )
         # ... the rightscale and aws apis allow you to spin up a server without
         #     a key, but let's not. we already assume you need ssh for ansible.
-        sshkey = find_exact(
+        sshkey = self._find_exact(
                 self.cloud.ssh_keys,
                 resource_uid=ssh_key_name,
                 )
@@ -253,14 +293,14 @@ class Servers(Consul):
                 }
 
         # optional attributes (i.e. you can set these to '' in bang configs)
-        itype = find_exact(
+        itype = self._find_exact(
                 self.cloud.instance_types,
                 name=instance_type,
                 )
         if itype:
             data['server[instance][instance_type_href]'] = itype.href
 
-        datacenter = find_exact(
+        datacenter = self._find_exact(
                 self.cloud.datacenters,
                 name=availability_zone,
                 )
@@ -269,7 +309,7 @@ class Servers(Consul):
 
         secgroup_hrefs = []
         for n in security_groups:
-            secgroup = find_exact(self.cloud.security_groups, name=n)
+            secgroup = self._find_exact(self.cloud.security_groups, name=n)
             if secgroup:
                 secgroup_hrefs.append(secgroup.href)
         if secgroup_hrefs:
@@ -290,7 +330,11 @@ class Servers(Consul):
                 data['server[instance][%s]' % k] = v
 
         try:
-            response = self.api.client.post('/api/servers', data=data)
+            response = self.request_once(
+                    self.api.client.post,
+                    '/api/servers',
+                    data=data,
+                    )
             server_href = response.headers['location']
         except HTTPError as e:
             log.error(
@@ -306,7 +350,8 @@ class Servers(Consul):
                 ]
         all_tags.extend(['ec2:%s=%s' % (k, v) for k, v in tags.items()])
         try:
-            self.api.tags.multi_add(
+            self.request(
+                    self.api.tags.multi_add,
                     data={
                         'resource_hrefs[]': [server_href],
                         'tags[]': all_tags,
@@ -337,7 +382,11 @@ class Servers(Consul):
         else:
             data = None
         try:
-            response = self.api.client.post(href + '/launch', data=data)
+            response = self.request_once(
+                    self.api.client.post,
+                    href + '/launch',
+                    data=data,
+                    )
         except HTTPError as e:
             log.error('Creation of %s failed.  RightScale returned %d:\n%s' % (
                     href,
@@ -353,14 +402,16 @@ class Servers(Consul):
 
         # wait for it to be operational
         def find_running_instance():
-            instance = self.cloud.instances.show(
+            instance = self.request(
+                    self.cloud.instances.show,
                     res_id=res_id,
                     params={'view': 'extended'},
                     )
             if instance.soul['state'] == 'operational':
                 return instance
 
-        running = poll_with_timeout(timeout_s, find_running_instance, 20)
+        running = poll_with_timeout(timeout_s, find_running_instance, 20,
+                policy=R.SERVERS)
         if not running:
             raise TimeoutError('Could not launch server within allotted time.')
         return server_to_dict(running)
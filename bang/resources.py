@@ -38,7 +38,8 @@ DYNAMIC_LB_SEC_GROUPS = '_load_balancer_sec_groups'
 # The stack deployer starts deploying resources in the first tuple, waits for
 # all of the resources to be deployed successfully, then moves on to the next
 # tuple of resources, etc...  It always waits for all of the deployers in a
-# stage/tuple to complete before moving to the next stage/tuple.
+# stage/tuple to complete before moving to the next stage/tuple - except for
+# the DEFERRED resources below.
 #
 # If any resource deployment within a stage/tuple is *not* successful, the
 # stack deployer does *not* proceed to the next stage - the deployment is
@@ -69,6 +70,27 @@ STAGES = [
             ),
         ]
 
+# Some resources take much longer to become usable than everything else in
+# their stage (e.g. db instances can take many minutes to accept connections).
+# Deployers for the keys in this mapping are started along with the rest of
+# their stage, but the stack deployer does *not* wait for them at the end of
+# that stage.  Instead, it waits for them just before starting any later stage
+# that contains one of the *dependent* resources listed in the mapping, or at
+# the end of the run, whichever comes first.
+DEFERRED = {
+        DATABASES: (
+            DATABASE_SECURITY_GROUP_RULES,
+            ),
+        }
+
+# resources that several other resources (e.g. every server in a class) may
+# each contribute a record for.  see bang.deployers.unique_resources.
+SHARED = (
+        SSH_KEYS,
+        SERVER_SECURITY_GROUPS,
+        DATABASE_SECURITY_GROUPS,
+        )
+
 CONVENIENCE_KEYS = [
         SERVER_COMMON_ATTRIBUTES,
         DATABASE_CREDS,
@@ -14,24 +14,32 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
-import copy
 import functools
+import hashlib
 import json
 import multiprocessing
 import os.path
+import Queue
+import time
+
+from .deployers import get_stage_deployers, run_inventory
+from .cache import ConfigureState, InventoryCache, hostvars_hash, tree_hash
+from .providers.bases import Consul
+from .util import (log, configure_polling, dump_inventory, expand_host_vars,
+        AdaptiveConcurrency, LocalManager, SharedNameIndex, SharedNamespace,
+        SharedMap, TokenBucket)
+from .playbooks import (get_dependencies, get_playbooks, is_parallel,
+        merge_stats, stats_to_dict)
+from . import BangError, resources as R, attributes as A
 
-# work around circular import in ansible as discussed on ansible-devel:
-#
-#     https://groups.google.com/forum/#!topic/ansible-devel/wE7fNbGyWbo
-#
-import ansible.utils  # noqa
 
-from ansible import callbacks
-from ansible.playbook import PlayBook
-from .deployers import get_stage_deployers
-from .inventory import BangsibleInventory
-from .util import log, SharedNamespace, SharedMap
-from . import BangError, resources as R, attributes as A
+#: How often, in seconds, :meth:`Stack.deploy_and_configure` looks for newly
+#: deployed hosts.
+PIPELINE_POLL_S = 5
+
+#: How often, in seconds, parallel playbook runs are checked for playbooks
+#: that died without reporting their results.
+PLAYBOOK_POLL_S = 1
 
 
 def require_inventory(f):
@@ -59,11 +67,29 @@ class Stack(object):
         self.name = config[A.NAME]
         self.version = config[A.VERSION]
         self.config = config
-        self.manager = multiprocessing.Manager()
+        configure_polling(config)
+
+        # the variables that every host of a server class shares are kept
+        # here, once, instead of in each host's inventory entry.  see
+        # add_host() and expand_host_vars().
+        self.class_vars = dict(
+                (name, server[A.server.VARS])
+                for name, server in config.index.servers.iteritems()
+                if A.server.VARS in server
+                )
+        # the shared state stays in this process until a deployer process is
+        # about to be forked.  see _share_state().
+        self.manager = LocalManager()
         self.shared_namespaces = {}
+        self.name_indexes = {}
+        self.rate_limiters = {}
+        self.concurrency_limiters = {}
 
         self.groups_and_vars = SharedMap(self.manager)
         self.lb_sec_groups = SharedMap(self.manager)
+        self.ready_servers = SharedMap(self.manager)
+        self.created_hosts = SharedMap(self.manager)
+        self.class_hosts = SharedMap(self.manager)
         self.have_inventory = False
 
         """
@@ -110,6 +136,125 @@ class Stack(object):
         self.shared_namespaces[key] = ns
         return ns
 
+    def get_name_index(self, key):
+        """
+        Returns a :class:`~bang.util.SharedNameIndex` for the given
+        :attr:`key`.  Deployers use these to look up existing provider
+        resources by name without each of them listing every resource of that
+        type.  E.g. All of the load balancer deployers in a region share one
+        index, so the load balancers are listed once per run instead of once
+        per deployer.
+
+        Like :meth:`get_namespace`, this must be called *before* the deployers
+        are forked into their own processes (i.e. in the deployer constructor).
+
+        :param key:  Unique, hashable ID for the index.  Typically a tuple of
+            provider name, region name and resource type.
+
+        """
+        index = self.name_indexes.get(key)
+        if index:
+            return index
+        index = SharedNameIndex(self.manager)
+        self.name_indexes[key] = index
+        return index
+
+    def get_rate_limiter(self, provider_name, region_name, consul):
+        """
+        Returns the :class:`~bang.util.TokenBucket` that limits the request
+        rate for :attr:`consul`'s API family in the given provider and region.
+        All of the consuls that talk to the same API share the limiter, even
+        across deployer processes, so like :meth:`get_namespace` this must be
+        called before the deployers are forked.
+
+        The limits default to the consul's
+        :attr:`~bang.providers.bases.Consul.RATE_LIMIT`, and can be overridden
+        per provider and API family in the ``rate_limits`` config stanza.
+        E.g.::
+
+            rate_limits:
+              aws:
+                ec2:
+                  rate_per_s: 2
+                  burst: 5
+
+        :param str provider_name:  The provider name, as given in the config
+            stanza.
+
+        :param str region_name:  The region name, if any.
+
+        :param consul:  The consul whose requests should be limited.
+        :type consul:  :class:`~bang.providers.bases.Consul`
+
+        """
+        key = (provider_name, region_name, consul.API_FAMILY)
+        limiter = self.rate_limiters.get(key)
+        if limiter:
+            return limiter
+        limits = self._api_limits(provider_name, consul)
+        limiter = TokenBucket(
+                limits[A.rate_limit.RATE],
+                limits[A.rate_limit.BURST],
+                )
+        self.rate_limiters[key] = limiter
+        return limiter
+
+    def get_concurrency_limiter(self, provider_name, region_name, consul):
+        """
+        Returns the :class:`~bang.util.AdaptiveConcurrency` controller that
+        limits how many requests to :attr:`consul`'s API family in the given
+        provider and region may be in flight at once.  It is shared the same
+        way as the limiter from :meth:`get_rate_limiter`.
+
+        The limit starts at ``max_concurrency`` from the consul's
+        :attr:`~bang.providers.bases.Consul.RATE_LIMIT` or the ``rate_limits``
+        config stanza, is lowered whenever the provider throttles a request,
+        and creeps back up as requests succeed.
+
+        """
+        key = (provider_name, region_name, consul.API_FAMILY)
+        limiter = self.concurrency_limiters.get(key)
+        if limiter:
+            return limiter
+        limits = self._api_limits(provider_name, consul)
+        limiter = AdaptiveConcurrency(limits[A.rate_limit.MAX_CONCURRENCY])
+        self.concurrency_limiters[key] = limiter
+        return limiter
+
+    def _api_limits(self, provider_name, consul):
+        limits = dict(Consul.RATE_LIMIT)
+        limits.update(consul.RATE_LIMIT)
+        limits.update(
+                self.config.get(A.RATE_LIMITS, {})
+                .get(provider_name, {})
+                .get(consul.API_FAMILY, {})
+                )
+        return limits
+
+    def report_rate_limits(self):
+        """
+        Logs how long API requests spent queued in the rate limiters, and how
+        far throttling pushed down the concurrency limits.
+
+        """
+        for key, limiter in sorted(self.rate_limiters.items()):
+            if not limiter.calls:
+                continue
+            log.info(
+                    'Rate limiter %s: %d requests, %0.1f s queued'
+                    % ('/'.join(str(k) for k in key), limiter.calls,
+                        limiter.waited_s)
+                    )
+        for key, limiter in sorted(self.concurrency_limiters.items()):
+            if not limiter.throttles:
+                continue
+            log.info(
+                    'Concurrency limiter %s: %d throttled requests, '
+                    'limit fell to %d (now %d)'
+                    % ('/'.join(str(k) for k in key), limiter.throttles,
+                        limiter.lowest_limit, limiter.limit)
+                    )
+
     def find_first(self, attr_name, resources, extra_prefix=''):
         """
         Returns the boto object for the first resource in ``resources`` that
@@ -151,7 +296,8 @@ class Stack(object):
         """
         self.lb_sec_groups.merge(lb_name, {'hosts': hosts, 'port': port})
 
-    def add_host(self, host, group_names=None, host_vars=None):
+    def add_host(self, host, group_names=None, host_vars=None,
+            created=False):
         """
         Used by deployers to add hosts to the inventory.
 
@@ -163,14 +309,23 @@ class Stack(object):
 
         :param dict host_vars:  A mapping object of host *variables*.  This can
             be a nested structure, and is used as the source of all the
-            variables provided to the ansible playbooks.  **Note:  Additional
-            key-value pairs (e.g. dynamic ansible values like
-            ``inventory_hostname``) will be inserted into this mapping
-            object.**
+            variables provided to the ansible playbooks.  Any variables that
+            are identical to those of the host's ``server_class`` are left out
+            of the inventory entry, and only filled back in where the hostvars
+            are read (see :meth:`expand_host_vars`).
+
+        :param bool created:  Whether the host was created during this run.
 
         """
         gnames = group_names if group_names else []
-        hvars = host_vars if host_vars else {}
+        hvars = dict(host_vars) if host_vars else {}
+        svars = self.class_vars.get(hvars.get(A.SERVER_CLASS))
+        if svars:
+            hvars = dict(
+                    (k, v) for k, v in hvars.iteritems()
+                    if k == A.SERVER_CLASS or k not in svars
+                    or not (svars[k] is v or svars[k] == v)
+                    )
 
         # Add in ansible's magic variables.  Assign them here because this is
         # just about the earliest point we can calculate them before anything
@@ -185,6 +340,36 @@ class Stack(object):
         for gname in group_names:
             self.groups_and_vars.append(gname, host)
 
+        if created:
+            self.created_hosts.append(R.SERVERS, host)
+        if A.SERVER_CLASS in hvars:
+            self.class_hosts.append(hvars[A.SERVER_CLASS], host)
+
+    def expand_host_vars(self, host_vars):
+        """
+        Returns the complete hostvars for one host's inventory entry, i.e.
+        :attr:`host_vars` plus the variables of its ``server_class``.
+
+        """
+        return expand_host_vars(host_vars, self.class_vars)
+
+    def get_class_hosts(self, server_class):
+        """
+        Returns the :class:`list` of hosts in the inventory whose
+        ``server_class`` is :attr:`server_class`.
+
+        """
+        return self.class_hosts.lists.get(server_class, [])
+
+    def server_ready(self, name):
+        """
+        Used by server deployers to report that one instance of the server
+        stanza named :attr:`name` has been deployed and added to the
+        inventory.
+
+        """
+        self.ready_servers.append(name, True)
+
     def describe(self):
         """Iterates through the deployers but doesn't run anything"""
         for stage, corunners in self.get_deployers():
@@ -194,26 +379,106 @@ class Stack(object):
                         [p[1].__name__ for p in d.phases]
                         )
 
+    def _share_state(self):
+        """
+        Moves the stack's shared state (inventory, namespaces, name indexes,
+        etc...) to a :class:`multiprocessing.Manager`, so that the processes
+        forked afterwards share it.  Until then, the state is kept in this
+        process, and no manager process is started.
+
+        """
+        if not isinstance(self.manager, LocalManager):
+            return
+        self.manager = multiprocessing.Manager()
+        shared = [
+                self.groups_and_vars,
+                self.lb_sec_groups,
+                self.ready_servers,
+                self.created_hosts,
+                self.class_hosts,
+                ]
+        shared.extend(self.shared_namespaces.values())
+        shared.extend(self.name_indexes.values())
+        for s in shared:
+            s.share(self.manager)
+
+    def _start(self, deployers, action):
+        """
+        Runs each of the :attr:`deployers` in its own process.
+
+        Returns the list of started processes.
+
+        """
+        if deployers:
+            self._share_state()
+        children = []
+        for d in deployers:
+            p = multiprocessing.Process(
+                    name=d.__class__.__name__,
+                    target=d.run,
+                    args=(action, ),
+                    )
+            children.append(p)
+            p.start()
+        return children
+
+    def _join(self, children):
+        """Waits for :attr:`children`, and returns the number of failures."""
+        errors = 0
+        for child in children:
+            child.join()
+            if child.exitcode != 0:
+                errors += 1
+        return errors
+
     def _run(self, action):
-        for stage, corunners in self.get_deployers():
-            children = []
-            errors = 0
-            for d in corunners:
-                p = multiprocessing.Process(
-                        name=d.__class__.__name__,
-                        target=d.run,
-                        args=(action, ),
+        # deferred deployers that are still running from earlier stages, as
+        # (stage, res_type, process) tuples.
+        deferred = []
+
+        def join_deferred(should_join):
+            errors = {}
+            for entry in [e for e in deferred if should_join(e[1])]:
+                deferred.remove(entry)
+                stage, _, child = entry
+                errors[stage] = errors.get(stage, 0) + self._join([child])
+            for stage, count in sorted(errors.items()):
+                if count:
+                    msg = "Stage %d had %d errors." % (stage, count)
+                    log.error(msg)
+                    raise BangError(msg)
+
+        try:
+            for stage, keys in enumerate(R.STAGES):
+                join_deferred(
+                        lambda res_type: set(R.DEFERRED[res_type]) & set(keys)
                         )
-                children.append(p)
-                p.start()
-            for child in children:
-                child.join()
-                if child.exitcode != 0:
-                    errors += 1
-            if errors:
-                msg = "Stage %d had %d errors." % (stage, errors)
-                log.error(msg)
-                raise BangError(msg)
+                children = self._start(
+                        get_stage_deployers(
+                            [k for k in keys if k not in R.DEFERRED],
+                            self,
+                            ),
+                        action,
+                        )
+                for res_type in [k for k in keys if k in R.DEFERRED]:
+                    deferred.extend(
+                            (stage, res_type, child)
+                            for child in self._start(
+                                get_stage_deployers([res_type], self),
+                                action,
+                                )
+                            )
+                errors = self._join(children)
+                if errors:
+                    msg = "Stage %d had %d errors." % (stage, errors)
+                    log.error(msg)
+                    raise BangError(msg)
+        except:
+            # never leave deferred deployers (e.g. half-launched db instances)
+            # running unattended, even when a later stage fails.
+            self._join([child for _, _, child in deferred])
+            raise
+        join_deferred(lambda res_type: True)
 
     def deploy(self):
         """
@@ -226,12 +491,128 @@ class Stack(object):
         Any failures in a stage cause the run to terminate before proceeding to
         the next stage.
 
+        The exceptions are the slow resources listed in
+        :data:`bang.resources.DEFERRED` (e.g. databases).  Their deployers
+        start with their stage, but only block the first later stage that
+        depends on them.
+
+        Any cached ``--list`` inventory for the stack is invalidated, even if
+        the deployment fails part way through.
+
         """
-        self._run('deploy')
+        try:
+            self._run('deploy')
+        finally:
+            InventoryCache(self.config).invalidate()
         self.have_inventory = True
+        self.report_rate_limits()
+
+    def deploy_and_configure(self, changed_only=False):
+        """
+        Deploys the stack like :meth:`deploy`, and configures its servers like
+        :meth:`configure`, but starts configuring hosts while the rest of the
+        stack is still being deployed.
+
+        The deployment runs in a child process.  Meanwhile, each batch of hosts
+        that has become ready is configured with all of the playbooks.  A host
+        is ready once every server in each of its groups has been deployed, and
+        every group listed for those groups in the ``group_dependencies`` of
+        the ``ansible`` config stanza has been configured.  E.g.::
+
+            ansible:
+              group_dependencies:
+                app_servers:
+                - db_servers
+
+        Once the deployment completes, any remaining hosts are configured.
+
+        :param bool changed_only:  Skip the hosts that need no configuring, as
+            for :meth:`configure`.
+
+        """
+        self._share_state()
+        deployment = multiprocessing.Process(name='deploy', target=self.deploy)
+        deployment.start()
+        # the deployment fills the shared inventory
+        self.have_inventory = True
+        configured = set()
+        try:
+            while True:
+                deployment.join(PIPELINE_POLL_S)
+                done = not deployment.is_alive()
+                if done and deployment.exitcode != 0:
+                    break
+                batch = self._ready_hosts(configured, done)
+                if batch:
+                    log.info(
+                            'Configuring %d ready hosts: %s'
+                            % (len(batch), ', '.join(sorted(batch)))
+                            )
+                    self.configure(batch, changed_only)
+                    configured.update(batch)
+                elif done:
+                    break
+        finally:
+            # never leave the deployment running unattended
+            deployment.join()
+        if deployment.exitcode != 0:
+            raise BangError('Deployment failed.')
+
+    def _ready_hosts(self, configured, deploy_done):
+        """
+        Returns the :class:`set` of hosts that are not yet in
+        :attr:`configured`, but are ready to be configured.
+
+        """
+        groups, hostvars = self.get_inventory_snapshot()
+        pending = set(hostvars) - configured
+
+        # the server stanzas that have finished deploying every instance
+        deployed = set()
+        index = self.config.index
+        reported = self.ready_servers.lists.copy()
+        for name, server in index.servers.iteritems():
+            if (deploy_done or len(reported.get(name, []))
+                    >= server.get('instance_count', 1)):
+                deployed.add(name)
+        members = index.group_members
+
+        depends = self.config.get(A.ANSIBLE, {}).get(
+                A.ansible.GROUP_DEPENDENCIES,
+                {},
+                )
+
+        def is_deployed(gname):
+            return members.get(gname, set()) <= deployed
+
+        def is_configured(gname):
+            return (
+                    is_deployed(gname)
+                    and set(groups.get(gname, [])) <= configured
+                    )
+
+        def is_ready(gname):
+            return is_deployed(gname) and all(
+                    is_configured(dep) for dep in depends.get(gname, [])
+                    )
+
+        ready = set(
+                h for h in pending
+                if all(
+                    is_ready(g)
+                    for g in hostvars[h].get(A.server.GROUP_NAMES, [])
+                    )
+                )
+        if deploy_done and pending and not ready:
+            log.warn(
+                    'Circular group_dependencies.  Configuring the remaining '
+                    'hosts together.'
+                    )
+            return pending
+        return ready
 
     @require_inventory
-    def configure(self):
+    def configure(self, hosts=None, changed_only=False):
         """
         Executes the ansible playbooks that configure the servers in the stack.
 
@@ -251,7 +632,28 @@ class Stack(object):
 
             $HOME/bang-stacks/common_modules/
 
+        :param hosts:  If given, only these hosts are configured.  The
+            playbooks still see the rest of the inventory.
+        :type hosts:  :class:`~collections.Iterable`
+
+        :param bool changed_only:  Only configure the hosts that were created
+            during this run, or whose hostvars changed since they were last
+            configured.  Every host in any of the ``reconfigure_groups`` from
+            the ``ansible`` config stanza is also configured whenever the
+            group's membership changes.
+
         """
+        # ansible is only imported when there is something to configure, so
+        # that the other commands start quickly.  importing ansible.utils first
+        # works around a circular import in ansible, as discussed on
+        # ansible-devel:
+        #
+        #     https://groups.google.com/forum/#!topic/ansible-devel/wE7fNbGyWbo
+        #
+        import ansible.utils
+        from . import forks
+        from .inventory import BangsibleInventory
+
         cfg = self.config
         bang_config_dir = os.path.abspath(
                 os.path.dirname(cfg.filepath)
@@ -263,8 +665,6 @@ class Stack(object):
                 'transport': 'ssh',
                 'module_path': os.path.join(bang_config_dir, 'common_modules'),
                 'remote_pass': creds.get(A.creds.SSH_PASS),
-                # TODO: determine forks
-                # 'forks': options.forks,
                 }
         # only add the 'remote_user' kwarg if it's in the config, otherwise use
         # ansible's default behaviour.
@@ -275,86 +675,396 @@ class Stack(object):
         ansible_cfg = cfg.get(A.ANSIBLE, {})
         ansible_verbosity = ansible_cfg.get(A.ansible.VERBOSITY, 1)
         ansible.utils.VERBOSITY = ansible_verbosity
-        for playbook in cfg.get(A.PLAYBOOKS, []):
-            playbook_path = os.path.join(playbook_dir, playbook)
+        vault_password = ansible_cfg.get(A.ansible.VAULT_PASS)
+
+        # like ``ansible-playbook`` with several playbooks, every playbook in
+        # the run shares one inventory built from a single snapshot of the
+        # stack's groups and hostvars.
+        groups, hostvars = self.get_inventory_snapshot()
+        inventory = BangsibleInventory(
+                groups,
+                hostvars,
+                vault_password=vault_password,
+                class_vars=self.class_vars,
+                )
+        hosts = set(hostvars if hosts is None else hosts)
+        hashed_vars = self._hashable_host_vars(hostvars)
+        state = ConfigureState(cfg).load()
+        if changed_only:
+            changed = set(self.created_hosts.lists.get(R.SERVERS, []))
+            changed.update(
+                    state.changed_hosts(
+                        groups,
+                        hashed_vars,
+                        ansible_cfg.get(A.ansible.RECONFIGURE_GROUPS, []),
+                        )
+                    )
+            log.info(
+                    '%d of %d hosts are new or changed'
+                    % (len(hosts & changed), len(hosts))
+                    )
+            hosts &= changed
+            if not hosts:
+                return
+
+        result_keys = {}
+        cached = []
+        if ansible_cfg.get(A.ansible.MEMOIZE_RESULTS, False):
+            # playbooks, roles, group_vars and host_vars all live under the
+            # playbook dir.
+            content = tree_hash(playbook_dir, pb_kwargs['module_path'])
+            playbooks = cfg.get(A.PLAYBOOKS, [])
+            for h in hosts:
+                result_keys[h] = hashlib.sha1(json.dumps(
+                        [content, playbooks, hostvars_hash(hashed_vars[h])]
+                        )).hexdigest()
+                if state.results.get(h) == result_keys[h]:
+                    cached.append(h)
+            hosts.difference_update(cached)
+            if not hosts:
+                self._report_result_cache(cached, hosts)
+                return
+        hosts = sorted(hosts)
+        pb_kwargs.update({
+                'forks': forks.choose_forks(len(hosts), ansible_cfg),
+                'inventory': inventory,
+                'vault_password': vault_password,
+                })
+        if len(hosts) < len(hostvars):
+            # like ``ansible-playbook --limit``
+            inventory.subset(':'.join(hosts))
+        unreachable = []
+        if ansible_cfg.get(A.ansible.PREWARM_SSH, True):
+            # pick up connection settings from host_vars and group_vars
+            inventory.set_playbook_basedir(playbook_dir)
+            unreachable = self._prewarm_connections(
+                    hosts,
+                    pb_kwargs,
+                    ansible_cfg.get(A.ansible.PREWARM_RETRIES, 2),
+                    )
+            if unreachable:
+                # like ansible with a dark host, configure the rest and fail
+                # the run at the end
+                hosts = [h for h in hosts if h not in unreachable]
+                if not hosts:
+                    raise BangError(
+                            'Unable to reach hosts: %s' % ', '.join(unreachable)
+                            )
+                inventory.subset(':'.join(hosts))
+        playbooks = cfg.get(A.PLAYBOOKS, [])
+        usage = forks.ForkUsage(pb_kwargs['forks'])
+        try:
+            if is_parallel(playbooks):
+                self._run_playbooks_in_parallel(
+                        get_playbooks(playbooks),
+                        groups,
+                        hosts,
+                        playbook_dir,
+                        pb_kwargs,
+                        usage,
+                        ansible_verbosity,
+                        )
+            else:
+                for playbook in playbooks:
+                    self._run_playbook(
+                            os.path.join(playbook_dir, playbook),
+                            playbook_dir,
+                            pb_kwargs,
+                            usage,
+                            ansible_verbosity,
+                            )
+        finally:
+            usage.report()
+        state.record(hosts, groups, hashed_vars, result_keys)
+        if result_keys:
+            self._report_result_cache(cached, hosts)
+        if unreachable:
+            raise BangError(
+                    'Unable to reach hosts: %s' % ', '.join(unreachable)
+                    )
+
+    def _hashable_host_vars(self, hostvars):
+        """
+        Returns stand-ins for :attr:`hostvars` whose hashes change whenever the
+        expanded hostvars would, without expanding them.  Each host's own
+        variables are paired with a hash of its server class variables, which
+        is calculated only once per class.
+
+        """
+        class_hashes = {}
+        hashed = {}
+        for h, hvars in hostvars.iteritems():
+            sclass = hvars.get(A.SERVER_CLASS)
+            if sclass not in class_hashes:
+                class_hashes[sclass] = hostvars_hash(
+                        self.class_vars.get(sclass, {})
+                        )
+            hashed[h] = [class_hashes[sclass], hvars]
+        return hashed
+
+    def _report_result_cache(self, cached, configured):
+        for h in sorted(cached):
+            print "%-30s : unchanged since its last successful run" % h
+        log.info(
+                'Playbook result cache: %d hosts skipped, %d hosts configured'
+                % (len(cached), len(configured))
+                )
+
+    def _prewarm_connections(self, hosts, pb_kwargs, retries):
+        """
+        Opens SSH connections to all of the :attr:`hosts` in parallel, before
+        any playbook runs.
+
+        Runs a no-op ``raw`` command on every host using the same connection
+        settings and fork pool as the playbooks, so the ControlPersist master
+        connection ansible's first task would otherwise open inside its fork
+        loop is already up.  Unreachable hosts are retried with backoff.
 
-            # gratuitously stolen from main() in ``ansible-playbook``
-            stats = callbacks.AggregateStats()
-            playbook_cb = callbacks.PlaybookCallbacks(
-                    verbose=ansible_verbosity
+        Returns a sorted :class:`list` of the hosts that are still unreachable
+        after :attr:`retries` more attempts, and logs why for each of them.
+
+        """
+        from ansible.runner import Runner
+
+        if not hosts:
+            return []
+        log.info('Opening SSH connections to %d hosts' % len(hosts))
+        runner_kwargs = dict(
+                (k, pb_kwargs[k])
+                for k in ('inventory', 'forks', 'transport', 'module_path',
+                    'remote_user', 'remote_pass')
+                if k in pb_kwargs
+                )
+        unreachable = {}
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+                log.info(
+                        'Retrying SSH connections to %d hosts' % len(hosts)
+                        )
+            runner = Runner(
+                    module_name='raw',
+                    module_args='true',
+                    run_hosts=hosts,
+                    vault_pass=pb_kwargs['vault_password'],
+                    **runner_kwargs
                     )
-            runner_cb = callbacks.PlaybookRunnerCallbacks(
-                    stats,
-                    verbose=ansible_verbosity
+            unreachable = runner.run().get('dark', {})
+            hosts = sorted(unreachable)
+            if not hosts:
+                return []
+        for host in hosts:
+            log.error(
+                    'Unable to reach %s: %s' % (
+                        host,
+                        unreachable[host].get('msg', unreachable[host]),
+                        )
                     )
+        return hosts
 
-            vault_password = ansible_cfg.get(A.ansible.VAULT_PASS)
-            extra_kwargs = {
-                    'playbook': playbook_path,
-
-                    # TODO: do we really need new instances of the following
-                    # for each playbook?
-                    'callbacks': playbook_cb,
-                    'runner_callbacks': runner_cb,
-                    'stats': stats,
-
-                    # ``host_list`` is used to generate the inventory, but
-                    # don't worry, we override the inventory later
-                    'host_list': [],
-                    'vault_password': vault_password,
-                    }
-            pb_kwargs.update(extra_kwargs)
-            pb = PlayBook(**pb_kwargs)
-            inventory = BangsibleInventory(
-                    copy.deepcopy(self.groups_and_vars.lists),
-                    copy.deepcopy(self.groups_and_vars.dicts),
-                    vault_password=vault_password
+    def _run_playbooks_in_parallel(self, playbooks, groups, hosts,
+            playbook_dir, pb_kwargs, usage, verbosity):
+        """
+        Runs each of the :attr:`playbooks` in its own process as soon as the
+        playbooks it depends on (see :mod:`bang.playbooks`) have completed.
+
+        The playbooks that run at the same time share the fork budget in
+        ``pb_kwargs['forks']``.  Each one is granted forks for the hosts it
+        targets, up to whatever the running playbooks have left over.  Once a
+        playbook fails, no more are started.  The stats of all of the
+        playbooks are merged into a single summary.
+
+        """
+        from ansible import callbacks
+
+        deps = get_dependencies(playbooks)
+        budget = pb_kwargs['forks']
+        results = multiprocessing.Queue()
+        pending = range(len(playbooks))
+        running = {}
+        done = set()
+        errors = []
+        stats = callbacks.AggregateStats()
+        while running or (pending and not errors):
+            for i in list(pending):
+                if errors or not deps[i] <= done:
+                    continue
+                available = budget - sum(f for _, f in running.values())
+                if running and available < 1:
+                    break
+                grant = max(1, min(
+                        available,
+                        playbooks[i].host_count(groups, hosts),
+                        ))
+                log.info(
+                        'Starting playbook %s with %d forks'
+                        % (playbooks[i].name, grant)
+                        )
+                child = multiprocessing.Process(
+                        name=playbooks[i].name,
+                        target=self._play_in_child,
+                        args=(
+                            i,
+                            os.path.join(playbook_dir, playbooks[i].name),
+                            playbook_dir,
+                            dict(pb_kwargs, forks=grant),
+                            verbosity,
+                            results,
+                            ),
+                        )
+                child.start()
+                running[i] = (child, grant)
+                pending.remove(i)
+
+            try:
+                i, counters, task_hosts, error = results.get(
+                        timeout=PLAYBOOK_POLL_S
+                        )
+            except Queue.Empty:
+                # a child that died without reporting back
+                for i, (child, _) in running.items():
+                    if child.exitcode not in (None, 0):
+                        del running[i]
+                        errors.append(
+                                'Playbook %s exited with code %d'
+                                % (playbooks[i].name, child.exitcode)
+                                )
+                continue
+            running.pop(i)[0].join()
+            merge_stats(stats, counters)
+            usage.task_hosts.extend(task_hosts)
+            if error:
+                errors.append(
+                        'Playbook %s failed: %s' % (playbooks[i].name, error)
+                        )
+            elif (any(counters['failures'].values())
+                    or any(counters['dark'].values())):
+                errors.append(
+                        'Playbook %s failed on some hosts' % playbooks[i].name
+                        )
+            done.add(i)
+
+        for error in errors:
+            log.error(error)
+        self._report_stats(stats, verbosity)
+        if errors:
+            raise BangError("Server configuration failed!")
+
+    def _play_in_child(self, index, playbook_path, playbook_dir, pb_kwargs,
+            verbosity, results):
+        """
+        The body of a child process started by
+        :meth:`_run_playbooks_in_parallel`.  Sends the playbook's stats back
+        through the :attr:`results` queue.
+
+        """
+        from . import forks
+
+        usage = forks.ForkUsage(pb_kwargs['forks'])
+        try:
+            stats = self._play(
+                    playbook_path,
+                    playbook_dir,
+                    pb_kwargs,
+                    usage,
+                    verbosity,
                     )
-            inventory.set_playbook_basedir(playbook_dir)
-            pb.inventory = inventory
+            results.put((index, stats_to_dict(stats), usage.task_hosts, None))
+        except Exception as e:
+            results.put((index, {}, usage.task_hosts, str(e)))
 
-            pb.run()
+    def _run_playbook(self, playbook_path, playbook_dir, pb_kwargs, usage,
+            verbosity):
+        """
+        Runs a single playbook against the stack's inventory.
 
-            hosts = sorted(pb.stats.processed.keys())
-            playbook_cb.on_stats(pb.stats)
+        Raises a :class:`BangError` if any host failed or was unreachable.
 
-            failed = False
-            for h in hosts:
-                hsum = pb.stats.summarize(h)
-                if hsum['failures'] or hsum['unreachable']:
-                    failed = True
-                print "%-30s : %s" % (h, hsum)
-                # TODO: sort this out
-                # print "%-30s : %s %s %s %s " % (
-                #     hostcolor(h, hsum),
-                #     colorize('ok', hsum['ok'], 'green'),
-                #     colorize('changed', hsum['changed'], 'yellow'),
-                #     colorize('unreachable', hsum['unreachable'], 'red'),
-                #     colorize('failed', hsum['failures'], 'red'))
-
-            if failed:
-                raise BangError("Server configuration failed!")
+        """
+        stats = self._play(
+                playbook_path,
+                playbook_dir,
+                pb_kwargs,
+                usage,
+                verbosity,
+                )
+        self._report_stats(stats, verbosity)
+        if any(stats.failures.values()) or any(stats.dark.values()):
+            raise BangError("Server configuration failed!")
+
+    def _play(self, playbook_path, playbook_dir, pb_kwargs, usage, verbosity):
+        """Runs a single playbook, and returns its stats."""
+        from ansible import callbacks
+        from ansible.playbook import PlayBook
+        from . import forks
+
+        # gratuitously stolen from main() in ``ansible-playbook``
+        stats = forks.AggregateStats(usage)
+        playbook_cb = callbacks.PlaybookCallbacks(verbose=verbosity)
+        runner_cb = callbacks.PlaybookRunnerCallbacks(
+                stats,
+                verbose=verbosity
+                )
+
+        pb = PlayBook(
+                playbook=playbook_path,
+                callbacks=playbook_cb,
+                runner_callbacks=runner_cb,
+                stats=stats,
+                **pb_kwargs
+                )
+        pb.inventory.set_playbook_basedir(playbook_dir)
+
+        pb.run()
+        return pb.stats
+
+    def _report_stats(self, stats, verbosity):
+        """Prints the per-host summary of a playbook run."""
+        from ansible import callbacks
+
+        callbacks.PlaybookCallbacks(verbose=verbosity).on_stats(stats)
+        for h in sorted(stats.processed.keys()):
+            hsum = stats.summarize(h)
+            print "%-30s : %s" % (h, hsum)
+            # TODO: sort this out
+            # print "%-30s : %s %s %s %s " % (
+            #     hostcolor(h, hsum),
+            #     colorize('ok', hsum['ok'], 'green'),
+            #     colorize('changed', hsum['changed'], 'yellow'),
+            #     colorize('unreachable', hsum['unreachable'], 'red'),
+            #     colorize('failed', hsum['failures'], 'red'))
 
     def gather_inventory(self):
         """
         Gathers existing inventory info.
 
-        Does *not* create any new infrastructure.
+        Does *not* create any new infrastructure, and does not fork any
+        deployer processes.  See :func:`bang.deployers.run_inventory`.
+
         """
-        self._run('inventory')
+        run_inventory(self)
         self.have_inventory = True
 
     @require_inventory
-    def show_inventory(self, pretty=False):
+    def get_inventory_snapshot(self):
         """
-        Satisfies the ``--list`` portion of ansible's external inventory API.
+        Returns a ``(groups, hostvars)`` tuple of private copies of the
+        inventory.  The shared maps are each fetched from the manager process
+        in a single round trip.
 
-        Allows ``bang`` to be used as an external inventory script, for example
-        when running ad-hoc ops tasks.  For more details, see:
-        http://ansible.cc/docs/api.html#external-inventory-scripts
+        """
+        return (
+                self.groups_and_vars.lists.copy(),
+                self.groups_and_vars.dicts.copy(),
+                )
+
+    def get_inventory(self):
+        """
+        Returns the inventory in the format of the ``--list`` portion of
+        ansible's external inventory API.
 
         """
-        inv_lists = copy.deepcopy(self.groups_and_vars.lists)
+        inv_lists, hostvars = self.get_inventory_snapshot()
         # sort the host lists to help consumers of the inventory (e.g. ansible
         # playbooks)
         for l in inv_lists.values():
@@ -362,15 +1072,20 @@ class Stack(object):
 
         # new in ansible 1.3: add hostvars directly into ``--list`` output
         inv_lists['_meta'] = {
-                'hostvars': self.groups_and_vars.dicts.copy()
+                'hostvars': dict(
+                    (h, self.expand_host_vars(hvars))
+                    for h, hvars in hostvars.iteritems()
+                    ),
                 }
+        return inv_lists
 
-        if pretty:
-            kwargs = {
-                    'sort_keys': True,
-                    'indent': 2,
-                    'separators': (',', ': '),
-                    }
-        else:
-            kwargs = {}
-        print json.dumps(inv_lists, **kwargs)
+    def show_inventory(self, pretty=False):
+        """
+        Satisfies the ``--list`` portion of ansible's external inventory API.
+
+        Allows ``bang`` to be used as an external inventory script, for example
+        when running ad-hoc ops tasks.  For more details, see:
+        http://ansible.cc/docs/api.html#external-inventory-scripts
+
+        """
+        print dump_inventory(self.get_inventory(), pretty)
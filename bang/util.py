@@ -22,15 +22,16 @@ import copy
 import json
 import logging
 import multiprocessing
+import random
 import time
 import re
+import socket
 import subprocess
 import sys
+import yaml
 from datetime import datetime
 from logging.handlers import BufferingHandler
 
-import boto
-from boto.s3.key import Key
 from logutils.queue import QueueHandler, QueueListener
 from . import attributes as A
 
@@ -91,6 +92,37 @@ class StrictAttrBag(object):
             setattr(self, k, v)
 
 
+class _LocalDict(dict):
+    """
+    A :class:`dict` that stores and hands out copies, like the dict proxies of
+    a :class:`multiprocessing.Manager` do.
+
+    """
+    def __setitem__(self, key, value):
+        super(_LocalDict, self).__setitem__(key, copy.deepcopy(value))
+
+    def copy(self):
+        return copy.deepcopy(dict(self))
+
+
+class LocalManager(object):
+    """
+    An in-process stand-in for a :class:`multiprocessing.Manager`.
+
+    Starting a manager spawns a server process, which is wasted on commands
+    that never fork any deployer processes (e.g. ``bang --list``).  The shared
+    state objects below start out with a :class:`LocalManager`, and are moved
+    to a real manager by their :meth:`share` methods just before any process
+    that needs them is forked.
+
+    """
+    def dict(self):
+        return _LocalDict()
+
+    def list(self):
+        return []
+
+
 class SharedMap(object):
     """
     A multiprocess-safe :class:`Mapping` object that can be used to return
@@ -102,6 +134,15 @@ class SharedMap(object):
         self.dicts = manager.dict()
         self.lock = multiprocessing.Lock()
 
+    def share(self, manager):
+        """
+        Moves the contents into containers from :attr:`manager`, so that the
+        processes forked afterwards share them.
+
+        """
+        self.lists = manager.dict(dict(self.lists))
+        self.dicts = manager.dict(dict(self.dicts))
+
     def append(self, list_name, value):
         """Appends :attr:`value` to the list named :attr:`list_name`."""
         with self.lock:
@@ -117,9 +158,8 @@ class SharedMap(object):
         Performs deep-merge of :attr:`values` onto the :class:`Mapping` object
         named :attr:`dict_name`.
 
-        If :attr:`dict_name` does not yet exist, then a deep copy of
-        :attr:`values` is assigned as the initial mapping object for the given
-        name.
+        If :attr:`dict_name` does not yet exist, then a copy of :attr:`values`
+        is assigned as the initial mapping object for the given name.
 
         :param str dict_name:  The name of the dict onto which the values
             should be merged.
@@ -131,7 +171,8 @@ class SharedMap(object):
             if d:
                 deep_merge_dicts(d, values)
             else:
-                d = copy.deepcopy(values)
+                # storing it in the manager's dict copies it
+                d = values
             self.dicts[dict_name] = d
 
 
@@ -146,6 +187,10 @@ class SharedNamespace(object):
         self.names = manager.list()
         self.lock = multiprocessing.Lock()
 
+    def share(self, manager):
+        """See :meth:`SharedMap.share`."""
+        self.names = manager.list(list(self.names))
+
     def add_if_unique(self, name):
         """
         Returns ``True`` on success.
@@ -159,6 +204,194 @@ class SharedNamespace(object):
         return False
 
 
+class SharedNameIndex(object):
+    """
+    A multiprocess-safe index of provider resources keyed by name.
+
+    The index is populated from a single listing of the resources, and that
+    listing is shared by every process that uses the index.  E.g. when several
+    load balancer deployers run concurrently in the same region, only the first
+    one to perform a lookup actually lists the load balancers - the rest are
+    answered from the index.
+
+    Call :meth:`invalidate` after creating or deleting resources so the next
+    lookup refreshes the index.
+
+    """
+    def __init__(self, manager):
+        self.entries = manager.dict()
+        self.loaded = multiprocessing.Event()
+        self.lock = multiprocessing.Lock()
+
+    def share(self, manager):
+        """See :meth:`SharedMap.share`."""
+        self.entries = manager.dict(dict(self.entries))
+
+    def get(self, name, list_func):
+        """
+        Returns the :class:`list` of resources named :attr:`name`.
+
+        :param str name:  The resource name.
+
+        :param list_func:  A callable that returns an iterable of
+            ``(name, resource)`` pairs for *all* of the resources that belong
+            in this index.  It is only called when the index needs to be
+            (re)built.  The resources must be picklable.
+
+        :rtype:  :class:`list`
+
+        """
+        with self.lock:
+            if not self.loaded.is_set():
+                by_name = {}
+                for res_name, res in list_func():
+                    by_name.setdefault(res_name, []).append(res)
+                self.entries.clear()
+                self.entries.update(by_name)
+                self.loaded.set()
+        return self.entries.get(name, [])
+
+    def invalidate(self):
+        """Forces the next lookup to rebuild the index."""
+        self.loaded.clear()
+
+
+class TokenBucket(object):
+    """
+    A multiprocess-safe token bucket rate limiter.
+
+    Every call to :meth:`acquire` takes a token from the bucket, blocking until
+    one is available.  Tokens are replenished at :attr:`rate` per second, and
+    up to :attr:`burst` tokens can accumulate while the bucket is idle.
+
+    The bucket state lives in shared memory, so a bucket created in the
+    parent process limits the combined request rate of all of the deployer
+    processes forked after it.
+
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+
+        # [available tokens, time of last refill, total seconds spent waiting
+        # for tokens, number of tokens acquired]
+        self.state = multiprocessing.Array(
+                'd',
+                [self.burst, time.time(), 0.0, 0.0],
+                )
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, waiting for one if necessary.
+
+        Returns the number of seconds spent waiting.
+
+        """
+        start = time.time()
+        while True:
+            with self.state.get_lock():
+                state = self.state
+                now = time.time()
+                state[0] = min(
+                        self.burst,
+                        state[0] + (now - state[1]) * self.rate,
+                        )
+                state[1] = now
+                if state[0] >= 1:
+                    state[0] -= 1
+                    state[2] += now - start
+                    state[3] += 1
+                    return now - start
+                wait_s = (1 - state[0]) / self.rate
+            time.sleep(wait_s)
+
+    @property
+    def waited_s(self):
+        """Total seconds that callers have spent waiting for tokens."""
+        return self.state[2]
+
+    @property
+    def calls(self):
+        """Total number of tokens acquired."""
+        return int(self.state[3])
+
+
+class AdaptiveConcurrency(object):
+    """
+    A multiprocess-safe AIMD (additive-increase, multiplicative-decrease)
+    limit on the number of requests in flight at once.
+
+    Callers bracket each request with :meth:`acquire` and :meth:`release`, and
+    report the outcome with :meth:`succeeded` or :meth:`throttled`.  Every
+    throttled request multiplies the limit by :attr:`decrease`.  Every
+    successful one adds ``1/limit`` to it, so the limit grows by roughly one
+    request per full window of successes, up to :attr:`maximum`.
+
+    Like :class:`TokenBucket`, the state lives in shared memory so that a
+    controller created in the parent process governs all of the deployer
+    processes forked after it.
+
+    """
+    def __init__(self, maximum, minimum=1, decrease=0.5):
+        self.maximum = float(maximum)
+        self.minimum = float(minimum)
+        self.decrease = float(decrease)
+
+        # [current limit, requests in flight, lowest limit reached, number of
+        # throttled requests]
+        self.state = multiprocessing.Array(
+                'd',
+                [self.maximum, 0.0, self.maximum, 0.0],
+                )
+        self.cond = multiprocessing.Condition(self.state.get_lock())
+
+    def acquire(self):
+        """Blocks until fewer than :attr:`limit` requests are in flight."""
+        with self.cond:
+            while self.state[1] >= int(self.state[0]):
+                # wake up periodically in case a notification was missed by a
+                # process that died mid-request
+                self.cond.wait(1)
+            self.state[1] += 1
+
+    def release(self):
+        """Marks a request acquired with :meth:`acquire` as finished."""
+        with self.cond:
+            self.state[1] = max(0, self.state[1] - 1)
+            self.cond.notify_all()
+
+    def succeeded(self):
+        """Additively raises the limit after a successful request."""
+        with self.cond:
+            limit = self.state[0]
+            self.state[0] = min(self.maximum, limit + 1 / limit)
+            if int(self.state[0]) > int(limit):
+                self.cond.notify_all()
+
+    def throttled(self):
+        """Multiplicatively lowers the limit after a throttled request."""
+        with self.cond:
+            limit = max(self.minimum, self.state[0] * self.decrease)
+            self.state[0] = limit
+            self.state[2] = min(self.state[2], limit)
+            self.state[3] += 1
+
+    @property
+    def limit(self):
+        """The current number of requests allowed in flight."""
+        return int(self.state[0])
+
+    @property
+    def lowest_limit(self):
+        """The lowest :attr:`limit` reached so far."""
+        return int(self.state[2])
+
+    @property
+    def throttles(self):
+        """Total number of throttled requests reported."""
+        return int(self.state[3])
+
+
 class JSONFormatter(logging.Formatter):
     def __init__(self, config):
         logging.Formatter.__init__(self)
@@ -206,6 +439,8 @@ class S3Handler(BufferingHandler):
             if record.levelno >= self.level:
                 payload += self.format(record)
         if payload:
+            import boto
+            from boto.s3.key import Key
             conn = boto.connect_s3()
             bucket = conn.get_bucket(self.bucket)
             key = Key(bucket)
@@ -289,11 +524,59 @@ def initialize_logging(config):
     log.debug('Logging initialized.')
 
 
-def poll_with_timeout(timeout_s, break_func, wake_every_s=60):
+# Default tuning for :func:`poll_with_timeout`.  Any of these can be overridden
+# per call, or per resource type in the ``polling`` config stanza.  E.g.:
+#
+#     polling:
+#       servers:
+#         wake_every_s: 10
+#         max_wake_s: 60
+#       databases:
+#         fast_phase_s: 0
+#       ssh:
+#         max_wake_s: 5
+#
+# The readiness probes in :func:`wait_for_tcp_port` use their own names (see
+# bang.attributes.polling), so tuning a resource type's API polling never slows
+# them down.
+#
+DEFAULT_POLL_TUNING = {
+        A.polling.BACKOFF: 1.5,
+        A.polling.MAX_WAKE: None,
+        A.polling.JITTER: 0.1,
+        A.polling.FAST_PHASE: 0,
+        A.polling.FAST_WAKE: 1,
+        }
+
+# per-resource-type tuning from the ``polling`` config stanza.  this is set in
+# the parent process before the deployers are forked, so it applies to all of
+# them.
+_poll_tuning = {}
+
+
+def configure_polling(config):
+    """
+    Applies the per-resource-type :func:`poll_with_timeout` tuning from the
+    ``polling`` stanza in :attr:`config`.
+
     """
-    Calls :attr:`break_func` every :attr:`wake_every_s` seconds for a total
-    duration of :attr:`timeout_s` seconds, or until :attr:`break_func` returns
-    something other than ``None``.
+    _poll_tuning.clear()
+    for res_type, tuning in config.get(A.POLLING, {}).iteritems():
+        unknown = set(tuning) - set(A.polling.ALL)
+        if unknown:
+            raise ValueError(
+                    'Unknown polling attributes for %s: %s'
+                    % (res_type, ', '.join(sorted(unknown)))
+                    )
+        _poll_tuning[res_type] = dict(tuning)
+
+
+def poll_with_timeout(timeout_s, break_func, wake_every_s=60, policy=None,
+        **tuning):
+    """
+    Calls :attr:`break_func` repeatedly until it returns something other than
+    ``None``, or until :attr:`timeout_s` seconds of wall-clock time have
+    elapsed.  Time spent inside :attr:`break_func` counts against the timeout.
 
     If :attr:`break_func` returns anything other than ``None``, that value is
     returned immediately.
@@ -301,21 +584,109 @@ def poll_with_timeout(timeout_s, break_func, wake_every_s=60):
     Otherwise, continues polling until the timeout is reached, then returns
     ``None``.
 
+    The first interval between calls is :attr:`wake_every_s` seconds.  Each
+    subsequent interval is multiplied by ``backoff`` up to ``max_wake_s``, and
+    every interval is randomly stretched or shrunk by up to ``jitter`` (a
+    fraction of the interval) so that many concurrent pollers don't hit a
+    provider API in lock-step.  For the first ``fast_phase_s`` seconds, the
+    interval is ``fast_wake_s`` instead, which suits resources that are
+    usually ready almost immediately.
+
+    :param str policy:  The resource type (e.g. ``servers``) being polled.
+        Tuning for this resource type in the ``polling`` config stanza (see
+        :func:`configure_polling`) overrides both the defaults and the values
+        passed to this function.
+
+    :param tuning:  Overrides for any of the keys in
+        :data:`DEFAULT_POLL_TUNING`.
+
     """
-    time_slept = 0
-    if wake_every_s > 60:
-        msg = '... sleeping for %0.2f minutes' % (wake_every_s / 60.0)
-    else:
-        msg = '... sleeping for %d seconds' % wake_every_s
+    settings = dict(DEFAULT_POLL_TUNING)
+    settings[A.polling.WAKE_EVERY] = wake_every_s
+    settings.update(tuning)
+    settings.update(_poll_tuning.get(policy, {}))
+
+    wake_s = settings[A.polling.WAKE_EVERY]
+    max_wake_s = settings[A.polling.MAX_WAKE] or wake_s * 4
+    backoff = settings[A.polling.BACKOFF]
+    jitter = settings[A.polling.JITTER]
+    fast_wake_s = settings[A.polling.FAST_WAKE]
+
+    start = time.time()
+    deadline = start + timeout_s
+    fast_until = start + settings[A.polling.FAST_PHASE]
+
     res = break_func()
-    while res is None and time_slept < timeout_s:
-        log.debug(msg)
-        time.sleep(wake_every_s)
-        time_slept += wake_every_s
+    while res is None:
+        now = time.time()
+        remaining = deadline - now
+        if remaining <= 0:
+            break
+        if now < fast_until:
+            sleep_s = fast_wake_s
+        else:
+            sleep_s = wake_s
+            wake_s = min(wake_s * backoff, max_wake_s)
+        if jitter:
+            sleep_s *= 1 + random.uniform(-jitter, jitter)
+        sleep_s = min(sleep_s, remaining)
+        if sleep_s > 60:
+            log.debug('... sleeping for %0.2f minutes' % (sleep_s / 60.0))
+        else:
+            log.debug('... sleeping for %d seconds' % sleep_s)
+        time.sleep(sleep_s)
         res = break_func()
     return res
 
 
+def wait_for_tcp_port(host, port, timeout_s, wake_every_s=1, max_wake_s=15,
+        connect_timeout_s=3, policy=None, banner=None):
+    """
+    Probes :attr:`host` until it accepts TCP connections on :attr:`port`, or
+    until :attr:`timeout_s` seconds have elapsed.
+
+    This is a much cheaper readiness check than logging in to the service
+    behind the port (e.g. a mysql server), so it can afford to poll often.  The
+    interval between probes starts at :attr:`wake_every_s` seconds and doubles
+    after each failed probe, up to :attr:`max_wake_s` seconds.
+
+    :param str banner:  If set, a connection only counts once the service
+        greets it with a line starting with this string (e.g. ``SSH-``).  Some
+        hosts accept connections well before the service behind the port can
+        handle them.
+
+    Returns ``True`` if the port accepted a connection, otherwise ``False``.
+
+    """
+    def probe():
+        try:
+            sock = socket.create_connection((host, int(port)),
+                    connect_timeout_s)
+            try:
+                if banner:
+                    sock.settimeout(connect_timeout_s)
+                    greeting = sock.recv(255)
+                    if not greeting.startswith(banner):
+                        log.debug(
+                                '... %s:%s not ready yet' % (host, port)
+                                )
+                        return
+            finally:
+                sock.close()
+            return True
+        except (socket.error, socket.timeout):
+            log.debug('... %s:%s not accepting connections yet' % (host, port))
+
+    return bool(poll_with_timeout(
+            timeout_s,
+            probe,
+            wake_every_s,
+            policy=policy,
+            backoff=2,
+            max_wake_s=max_wake_s,
+            ))
+
+
 def get_argparser(arg_config):
     parser = argparse.ArgumentParser(
             prog=arg_config.get('prog'),
@@ -371,6 +742,7 @@ def count_by_tag(stack, descriptor):
     Returns the count of currently running or pending instances
     that match the given stack and deployer combo
     """
+    import boto.ec2.connection
     ec2_conn = boto.ec2.connection.EC2Connection()
     resses = ec2_conn.get_all_instances(
                     filters={
@@ -411,14 +783,252 @@ def deep_merge_dicts(base, incoming):
     :rtype:  None
 
     """
-    for ki, vi in incoming.iteritems():
-        if (ki in base
-                and isinstance(vi, collections.MutableMapping)
-                and isinstance(base[ki], collections.MutableMapping)
-                ):
-            deep_merge_dicts(base[ki], vi)
-        else:
-            base[ki] = vi
+    # iterative, so that deeply nested configs don't hit the recursion limit
+    pending = [(base, incoming)]
+    while pending:
+        base, incoming = pending.pop()
+        for ki, vi in incoming.iteritems():
+            if (ki in base
+                    and isinstance(vi, collections.MutableMapping)
+                    and isinstance(base[ki], collections.MutableMapping)
+                    ):
+                pending.append((base[ki], vi))
+            else:
+                base[ki] = vi
+
+
+class FrozenDict(dict):
+    """
+    A :class:`dict` that cannot be modified in-place.
+
+    Frozen trees are safe to share between their users without copying them.
+    :meth:`copy` returns an ordinary, mutable, shallow copy, so a user that
+    needs to change a frozen tree copies only the mappings it changes (i.e.
+    copy-on-write).  Deep copies and unpickled copies are ordinary, mutable
+    dicts too.
+
+    """
+    def _frozen(self, *args, **kwargs):
+        raise TypeError('%s objects are immutable' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen
+
+    def copy(self):
+        return dict(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+
+# e.g. ansible's ``to_yaml`` filters dump hostvars with the safe dumpers
+for _dumper in ('Dumper', 'SafeDumper', 'CDumper', 'CSafeDumper'):
+    if hasattr(yaml, _dumper):
+        getattr(yaml, _dumper).add_representer(
+                FrozenDict,
+                yaml.representer.SafeRepresenter.represent_dict,
+                )
+
+
+def freeze(value):
+    """
+    Returns a frozen copy of :attr:`value`, in which every mapping is a
+    :class:`FrozenDict`.  Lists are copied, but remain lists.  Subtrees that
+    are already frozen are shared, not copied.
+
+    """
+    if not isinstance(value, (collections.Mapping, list)) \
+            or isinstance(value, FrozenDict):
+        return value
+
+    # a post-order walk, so that each container is built from its already
+    # frozen children.  ``frozen`` maps the ids of the original containers to
+    # their frozen copies, which also preserves any shared references.
+    frozen = {}
+    visiting = set()
+    pending = [(value, False)]
+    while pending:
+        v, children_done = pending.pop()
+        vid = id(v)
+        if vid in frozen:
+            continue
+        if children_done:
+            visiting.discard(vid)
+            if isinstance(v, collections.Mapping):
+                frozen[vid] = FrozenDict(
+                        (k, frozen.get(id(c), c)) for k, c in v.iteritems()
+                        )
+            else:
+                frozen[vid] = [frozen.get(id(c), c) for c in v]
+            continue
+        if vid in visiting:
+            raise ValueError('Cannot freeze a self-referencing structure')
+        visiting.add(vid)
+        pending.append((v, True))
+        children = v.itervalues() if isinstance(v, collections.Mapping) else v
+        for c in children:
+            if isinstance(c, (collections.Mapping, list)) \
+                    and not isinstance(c, FrozenDict):
+                pending.append((c, False))
+    return frozen[id(value)]
+
+
+class ThawedDict(dict):
+    """
+    A mutable, copy-on-read view of a :class:`FrozenDict` (see :func:`thaw`).
+
+    Only the top level is copied up front.  A nested :class:`FrozenDict` is
+    replaced by its own :class:`ThawedDict` the first time it is read through
+    this mapping, so a caller only pays for the subtrees it actually uses, and
+    may then modify them in place.  Nested values that are copied out without
+    being read (e.g. by ``dict.update()``) are still frozen.
+
+    """
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, FrozenDict):
+            value = thaw(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return dict.pop(self, key, *default)
+        value = self[key]
+        dict.__delitem__(self, key)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        return key, thaw(value)
+
+    def itervalues(self):
+        return (self[k] for k in self)
+
+    def iteritems(self):
+        return ((k, self[k]) for k in self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        return ThawedDict(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+
+# e.g. ansible's ``to_yaml`` filters dump hostvars with the safe dumpers
+for _dumper in ('Dumper', 'SafeDumper', 'CDumper', 'CSafeDumper'):
+    if hasattr(yaml, _dumper):
+        getattr(yaml, _dumper).add_representer(
+                ThawedDict,
+                yaml.representer.SafeRepresenter.represent_dict,
+                )
+
+
+def thaw(value):
+    """
+    Returns a mutable copy of :attr:`value`, in which every
+    :class:`FrozenDict` is a :class:`ThawedDict`.  Lists are copied, along
+    with the mappings in them.  Nested mappings are copied lazily, when they
+    are first read, so that thawing a large tree costs about as much as
+    copying its top level.
+
+    """
+    if isinstance(value, FrozenDict):
+        thawed = ThawedDict(value)
+        for k, v in value.iteritems():
+            if isinstance(v, list):
+                dict.__setitem__(thawed, k, thaw(v))
+        return thawed
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    return value
+
+
+def merge_frozen(base, incoming):
+    """
+    Returns the deep-merge of :attr:`incoming` onto :attr:`base` (see
+    :func:`deep_merge_dicts`) as a new :class:`FrozenDict`, leaving both
+    arguments unmodified.
+
+    Only the mappings on the paths where both arguments have a mapping are
+    new.  Every other subtree of the result is shared with :attr:`base` or
+    :attr:`incoming`, not copied.  Pass frozen arguments (see :func:`freeze`)
+    for a result that is immutable all the way down.
+
+    """
+    result = FrozenDict(base)
+    pending = [(result, incoming)]
+    while pending:
+        node, incoming = pending.pop()
+        for ki, vi in incoming.iteritems():
+            if (ki in node
+                    and isinstance(vi, collections.Mapping)
+                    and isinstance(node[ki], collections.Mapping)
+                    ):
+                child = FrozenDict(node[ki])
+                dict.__setitem__(node, ki, child)
+                pending.append((child, vi))
+            else:
+                dict.__setitem__(node, ki, vi)
+    return result
+
+
+def dump_inventory(inventory, pretty=False):
+    """
+    Returns the JSON string for a ``--list`` inventory or ``--host``
+    hostvars.
+
+    :param bool pretty:  Indent and sort the output for human readers.
+
+    """
+    if pretty:
+        kwargs = {
+                'sort_keys': True,
+                'indent': 2,
+                'separators': (',', ': '),
+                }
+    else:
+        kwargs = {}
+    return json.dumps(inventory, **kwargs)
+
+
+def expand_host_vars(host_vars, class_vars):
+    """
+    Returns the complete hostvars for one host.
+
+    The variables shared by every host of a server class (the config scopes,
+    ``bang_server_attributes``, etc...) are kept once per class in
+    :attr:`class_vars`, keyed by server class name, rather than in each host's
+    inventory entry.  :attr:`host_vars` holds only the host's own variables,
+    and they take precedence over the class variables.
+
+    """
+    svars = class_vars.get(host_vars.get(A.SERVER_CLASS))
+    if not svars:
+        return host_vars
+    hvars = dict(svars)
+    hvars.update(host_vars)
+    return hvars
 
 
 def fork_exec(cmd_list, input_data=None):
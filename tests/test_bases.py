@@ -0,0 +1,79 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import nose.tools as T
+from mock import patch
+from boto.exception import EC2ResponseError
+
+from bang.providers import aws, bases
+from bang.util import AdaptiveConcurrency
+
+
+class HTTPFailure(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+def test_consul_request_retries():
+    consul = bases.Consul(None)
+    consul.concurrency = AdaptiveConcurrency(4)
+    outcomes = [HTTPFailure(429), HTTPFailure(503), 'ok']
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with patch.object(bases.time, 'sleep') as sleep:
+        T.eq_('ok', consul.request(flaky))
+    T.eq_(2, sleep.call_count)
+    T.eq_(1, consul.concurrency.throttles)
+    T.eq_(2, consul.concurrency.limit)
+
+    # a create is only retried when it was throttled
+    outcomes[:] = [HTTPFailure(503), 'ok']
+    with patch.object(bases.time, 'sleep'):
+        T.assert_raises(HTTPFailure, consul.request_once, flaky)
+
+    # other errors are not retried at all
+    outcomes[:] = [HTTPFailure(404), 'ok']
+    T.assert_raises(HTTPFailure, consul.request, flaky)
+
+
+def test_aws_throttle_codes():
+    consul = aws.AWSConsul(None)
+    throttled = EC2ResponseError(503, 'Service Unavailable')
+    throttled.error_code = 'RequestLimitExceeded'
+    T.ok_(consul.is_throttle_error(throttled))
+    T.ok_(not consul.is_transient_error(throttled))
+
+    unavailable = EC2ResponseError(503, 'Service Unavailable')
+    unavailable.error_code = 'Unavailable'
+    T.ok_(not consul.is_throttle_error(unavailable))
+    T.ok_(consul.is_transient_error(unavailable))
+
+
+def test_tag_matching():
+    tag_sets = [
+            {'stack': 'st', 'role': 'web'},
+            {'stack': 'st', 'role': 'db', 'Name': 'st-db'},
+            ]
+    T.eq_({'stack': 'st'}, bases.common_tags(tag_sets))
+    T.eq_({}, bases.common_tags([]))
+    server_tags = {'stack': 'st', 'role': 'web', 'Name': 'st-web'}
+    T.ok_(bases.tags_match(server_tags, tag_sets[0]))
+    T.ok_(not bases.tags_match(server_tags, tag_sets[1]))
@@ -0,0 +1,156 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Micro-benchmarks for the hot spots of config loading and per-host variable
+merging.  They are skipped by default; run them with ``./test --benchmarks``
+(add ``-s`` to see the timings).
+
+"""
+import copy
+import os
+import shutil
+import tempfile
+import timeit
+
+import nose.tools as T
+import yaml
+from mock import patch
+from nose.plugins.attrib import attr
+
+import bang.cache as C
+import bang.config as CFG
+import bang.util as U
+from bang.inventory import BangsibleInventory
+
+
+def make_tree(depth, width, leaf='x'):
+    """Returns a tree of dicts, :attr:`depth` deep and :attr:`width` wide."""
+    tree = dict(('leaf%d' % i, leaf) for i in range(width))
+    for _ in range(depth):
+        tree = dict(
+                [('k%d' % i, copy.deepcopy(tree)) for i in range(2)]
+                + [('leaf%d' % i, leaf) for i in range(width)]
+                )
+    return tree
+
+
+def report(name, stmt, number=20):
+    best = min(timeit.repeat(stmt, number=number, repeat=3)) / number
+    print '%-40s %8.3f ms' % (name, best * 1000)
+    return best
+
+
+@attr('bench')
+def test_bench_merge():
+    # shaped like a stack's config scopes: deep and wide, with a few values
+    # overridden per host
+    base = make_tree(8, 20)
+    incoming = {'k0': {'k1': {'k0': {'leaf0': 'y'}}}, 'leaf1': 'y'}
+    frozen = U.freeze(base)
+
+    def deepcopy_merge():
+        U.deep_merge_dicts(copy.deepcopy(base), copy.deepcopy(incoming))
+
+    def frozen_merge():
+        U.merge_frozen(frozen, incoming)
+
+    slow = report('deepcopy + deep_merge_dicts', deepcopy_merge)
+    fast = report('merge_frozen', frozen_merge)
+    report('freeze', lambda: U.freeze(base))
+    T.ok_(fast < slow)
+
+
+@attr('bench')
+def test_bench_config_merge():
+    # shaped like several config files merged onto each other
+    layers = [make_tree(6, 50, leaf=str(i)) for i in range(3)]
+
+    def merge_layers():
+        config = {}
+        for layer in layers:
+            U.deep_merge_dicts(config, layer)
+
+    report('deep_merge_dicts (config layers)', merge_layers)
+
+
+@attr('bench')
+def test_bench_config_cache():
+    # shaped like a large stack config, with many server stanzas
+    doc = {
+            'name': 'bench',
+            'version': '1.0',
+            'servers': dict(
+                ('web%d' % i, {
+                    'provider': 'aws',
+                    'region_name': 'us-east-1',
+                    'instance_type': 'm1.small',
+                    'ssh_key_name': 'deployer',
+                    'groups': ['web', 'app%d' % i],
+                    'config_scopes': ['common'],
+                    })
+                for i in range(200)
+                ),
+            'common': make_tree(5, 20),
+            }
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'bench.yml')
+        with open(path, 'w') as f:
+            yaml.safe_dump(doc, f, default_flow_style=False)
+        with patch.object(C, 'DEFAULT_CACHE_DIR', tmpdir):
+            CFG.load_config_file(path)
+
+            def parse():
+                with open(path) as f:
+                    CFG.load_yaml(f)
+
+            def load_cached():
+                C.ConfigCache(path).load()
+
+            slow = report('load_yaml (%s)' % CFG.YamlLoader.__name__, parse)
+            fast = report('ConfigCache.load', load_cached)
+        T.ok_(fast < slow)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@attr('bench')
+def test_bench_get_variables():
+    # ansible asks for a host's variables several times per task.  the class
+    # vars are shaped like a server class's config scopes.
+    basedir = tempfile.mkdtemp()
+    try:
+        inventory = BangsibleInventory(
+                {'web': ['h1']},
+                {'h1': {'server_class': 'web', 'role': 'web'}},
+                class_vars={'web': make_tree(6, 20)},
+                )
+        inventory.set_playbook_basedir(basedir)
+        merged = inventory.get_variables('h1')
+        T.eq_('x', merged['k0']['k1']['leaf0'])
+
+        def deepcopy_vars():
+            copy.deepcopy(inventory._merged_vars['h1'])
+
+        def get_variables():
+            inventory.get_variables('h1')['k0']['k1']['leaf0']
+
+        slow = report('get_variables (deepcopy)', deepcopy_vars, number=200)
+        fast = report('get_variables', get_variables, number=200)
+        T.ok_(fast < slow)
+    finally:
+        shutil.rmtree(basedir)
@@ -0,0 +1,151 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+
+import nose.tools as T
+from mock import patch
+
+import bang.cache as C
+
+
+def test_inventory_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        config = {
+                'name': 'mystack',
+                'inventory_cache': {'dir': cache_dir, 'ttl_s': 60},
+                }
+        cache = C.InventoryCache(config)
+        T.eq_(None, cache.load())
+        T.eq_(None, cache.load_host('10.0.0.1'))
+        inventory = {
+                'web': ['10.0.0.1'],
+                '_meta': {'hostvars': {'10.0.0.1': {'role': 'web'}}},
+                }
+        cache.save(inventory)
+        T.eq_(inventory, cache.load())
+        T.eq_({'role': 'web'}, cache.load_host('10.0.0.1'))
+        T.eq_({}, cache.load_host('10.0.0.2'))
+
+        # answered from the cache without gathering the inventory
+        T.eq_({'role': 'web'}, C.get_host_vars(config, '10.0.0.1'))
+
+        # a different config is a different cache entry
+        other = dict(config, version='2.0')
+        T.eq_(None, C.InventoryCache(other).load())
+        C.InventoryCache(other).save({})
+
+        # expired
+        now = C.time.time()
+        with patch.object(C.time, 'time', lambda: now + 61):
+            T.eq_(None, cache.load())
+            T.eq_(None, cache.load_host('10.0.0.1'))
+
+        # deploying any version of the stack clears every entry
+        cache.invalidate()
+        T.eq_(None, cache.load())
+        T.eq_(None, C.InventoryCache(other).load())
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_configure_state():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        config = {'name': 'mystack', 'inventory_cache': {'dir': cache_dir}}
+        groups = {'web': ['h1', 'h2'], 'db': ['h3']}
+        hostvars = {'h1': {'a': 1}, 'h2': {'a': 2}, 'h3': {}}
+        state = C.ConfigureState(config).load()
+        T.eq_(set(hostvars), state.changed_hosts(groups, hostvars))
+
+        state.record(['h1', 'h2', 'h3'], groups, hostvars)
+        state = C.ConfigureState(config).load()
+        T.eq_(set(), state.changed_hosts(groups, hostvars))
+
+        hostvars.update({'h2': {'a': 3}, 'h4': {}})
+        groups['web'].append('h4')
+        T.eq_(set(['h2', 'h4']), state.changed_hosts(groups, hostvars))
+        T.eq_(
+                set(['h1', 'h2', 'h4']),
+                state.changed_hosts(groups, hostvars, ['web', 'db']),
+                )
+
+        # configured in batches: h1 and h2 have not seen h4 join web yet
+        state.record(['h2'], groups, hostvars)
+        state.record(['h4'], groups, hostvars)
+        T.eq_(
+                set(['h1', 'h2', 'h4']),
+                state.changed_hosts(groups, hostvars, ['web']),
+                )
+        state.record(['h1', 'h2', 'h4'], groups, hostvars)
+        T.eq_(set(), state.changed_hosts(groups, hostvars, ['web']))
+
+        # a run without memoization forgets the host's earlier result key
+        state.record(['h1', 'h2'], groups, hostvars, {'h1': 'k1', 'h2': 'k2'})
+        state.record(['h1'], groups, hostvars)
+        state.record(['h2'], groups, hostvars, {'h2': 'k3'})
+        state = C.ConfigureState(config).load()
+        T.eq_({'h2': 'k3'}, state.results)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_tree_hash():
+    top = tempfile.mkdtemp()
+    try:
+        empty = C.tree_hash(top)
+        os.makedirs(os.path.join(top, 'roles', 'web'))
+        with open(os.path.join(top, 'roles', 'web', 'main.yml'), 'w') as f:
+            f.write('- ping:\n')
+        first = C.tree_hash(top)
+        T.ok_(first != empty)
+        T.eq_(first, C.tree_hash(top))
+        with open(os.path.join(top, 'roles', 'web', 'main.yml'), 'a') as f:
+            f.write('\n')
+        T.ok_(C.tree_hash(top) != first)
+    finally:
+        shutil.rmtree(top)
+
+
+def test_config_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        spec = os.path.join(cache_dir, 'stack.yml')
+        with open(spec, 'w') as f:
+            f.write('name: stack\n')
+        with patch.object(C, 'DEFAULT_CACHE_DIR', cache_dir):
+            cache = C.ConfigCache(spec)
+            T.eq_(None, cache.load())
+            cache.save({'name': 'stack'})
+            T.eq_({'name': 'stack'}, C.ConfigCache(spec).load())
+            with open(cache.path) as f:
+                T.eq_('{"name": "stack"}', f.read())
+
+            # documents that JSON would change are not cached
+            other = os.path.join(cache_dir, 'other.yml')
+            with open(other, 'w') as f:
+                f.write('ports: {80: 8080}\n')
+            C.ConfigCache(other).save({'ports': {80: 8080}})
+            T.eq_(None, C.ConfigCache(other).load())
+
+            with open(spec, 'a') as f:
+                f.write('version: 1\n')
+            T.eq_(None, C.ConfigCache(spec).load())
+    finally:
+        shutil.rmtree(cache_dir)
@@ -16,6 +16,7 @@
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
 import bang.config as C
 import copy
+import json
 import os
 import os.path
 import shutil
@@ -24,6 +25,7 @@ import textwrap
 import unittest
 import yaml
 
+import nose.tools as T
 from mock import patch
 from bang import attributes as A
 
@@ -297,6 +299,51 @@ class TestConfig(TestWithTmpDir):
         os.chdir(orig_dir)
 
 
+    def test_secrets_not_cached(self):
+        plain_path = self._store_config('a.yml', self.a)
+        secret_path = self._store_config('secrets.yml', {
+                'database_credentials': {
+                    'db': {'admin_password': 'hunter2'},
+                    },
+                })
+        self._get_act_config([plain_path, secret_path])
+        cache_dir = os.path.join(self.tmpdir, '.cache', 'bang', 'configs')
+        cached = []
+        for fname in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, fname)) as f:
+                cached.append(json.load(f))
+        self.assertEqual([self.a], cached)
+
+        # a cached file reads the same as a freshly parsed one, down to the
+        # string types
+        with open(plain_path) as f:
+            parsed = C.load_yaml(f)
+        cached = self._get_act_config([plain_path])
+        self.assertEqual(parsed, cached)
+        self.assertEqual(repr(parsed), repr(dict(cached)))
+
+        self.assertTrue(C.contains_secrets(
+                {'ansible': {'vault_pass': 'hunter2'}}
+                ))
+        self.assertTrue(C.contains_secrets(
+                {'databases': {'db': {'admin_password': 'hunter2'}}}
+                ))
+        self.assertFalse(C.contains_secrets({
+                'servers': {
+                    'web': {'ssh_key_name': 'deployer', 'key': 'k'},
+                    },
+                }))
+
+    def test_examples_are_cacheable(self):
+        examples = os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'examples',
+                )
+        for name in ('aws/minimal_server.yml', 'rightscale/simple_server.yml',
+                'banger/aws_banger.yml'):
+            with open(os.path.join(examples, name)) as f:
+                self.assertFalse(C.contains_secrets(C.load_yaml(f)), name)
+
 @patch('bang.config.ask_passwords')
 def test_prompt_vault_pass(mock_ask_passwords):
     exp_vault_pass = 'vaultpass'
@@ -345,3 +392,38 @@ def test_prompt_vault_pass(mock_ask_passwords):
     config = C.Config()
     config._prepare_ansible()
     assert not mock_ask_passwords.called
+
+
+def test_config_index():
+    server = {
+            'provider': 'aws',
+            'region_name': 'us-east-1',
+            'ssh_key_name': 'deploy',
+            'groups': ['web'],
+            'stack_security_groups': ['web'],
+            }
+    config = C.Config({
+        A.NAME: 'st',
+        A.VERSION: '1.0',
+        A.DEPLOYER_CREDS: {'ssh_pub_keys': {'deploy': 'ssh-rsa AAAA'}},
+        'servers': {
+            'web1': copy.deepcopy(server),
+            'web2': copy.deepcopy(server),
+            },
+        'server_security_groups': {
+            'web': {
+                'provider': 'aws',
+                'region_name': 'us-east-1',
+                'rules': [],
+                },
+            },
+        })
+    config.prepare()
+
+    index = config.index
+    T.eq_(set(['web1', 'web2']), set(index.servers))
+    T.eq_(set(['web1', 'web2']), index.group_members['web'])
+    T.eq_(['st-web'], index.servers['web1']['security_groups'])
+    # the tables refer to the stanzas themselves
+    T.ok_(index.servers['web1'] is config['servers'][0]
+            or index.servers['web1'] is config['servers'][1])
@@ -0,0 +1,166 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import nose.tools as T
+from mock import patch
+
+from bang import BangError, attributes as A
+from bang.cache import InventoryCache
+from bang.config import Config
+from bang.daemon import BangDaemon, send_request
+from bang.stack import Stack
+
+
+def _start(daemon, socket_path):
+    server = threading.Thread(target=daemon.serve_forever)
+    server.start()
+    for _ in range(50):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.1)
+    return server
+
+
+def test_daemon():
+    tmpdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tmpdir, 'bang.sock')
+    T.eq_(None, send_request(socket_path, 'ping'))
+
+    daemon = BangDaemon(socket_path)
+    server = _start(daemon, socket_path)
+    try:
+        T.eq_('pong', send_request(socket_path, 'ping'))
+        T.assert_raises(BangError, send_request, socket_path, 'bogus')
+
+        config = Config({
+                'name': 'st',
+                'version': '1.0',
+                'inventory_cache': {'dir': tmpdir},
+                })
+        inventory = {
+                'web': ['h1'],
+                '_meta': {'hostvars': {'h1': {'role': 'web'}}},
+                }
+        with patch.object(daemon, '_load_config', return_value=config), \
+                patch.object(Stack, 'get_inventory',
+                        return_value=inventory) as get_inventory:
+            T.eq_(inventory, send_request(socket_path, 'list', ['st']))
+            T.eq_(
+                    {'role': 'web'},
+                    send_request(socket_path, 'host', ['st'], host='h1'),
+                    )
+            # the inventory is kept in memory
+            T.eq_(1, get_inventory.call_count)
+            send_request(socket_path, 'list', ['st'], refresh=True)
+            T.eq_(2, get_inventory.call_count)
+
+            # ... until another bang command invalidates the on-disk cache
+            InventoryCache(config).invalidate()
+            send_request(socket_path, 'list', ['st'])
+            T.eq_(3, get_inventory.call_count)
+    finally:
+        daemon.stop()
+        server.join()
+        shutil.rmtree(tmpdir)
+    T.ok_(not os.path.exists(socket_path))
+
+
+def test_daemon_deploy():
+    tmpdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tmpdir, 'bang.sock')
+    daemon = BangDaemon(socket_path)
+    # the deploys run in the daemon's deploy process
+    deploying = multiprocessing.Event()
+    finish = multiprocessing.Event()
+    deployed = multiprocessing.Queue()
+
+    def deploy(stack):
+        if stack.config[A.NAME] == 'broken':
+            raise BangError('broken stack')
+        deployed.put(dict(stack.config))
+        deploying.set()
+        finish.wait(10)
+
+    def load_config(config_specs, cwd):
+        return Config({
+                'name': config_specs[0],
+                'version': '1.0',
+                'inventory_cache': {'dir': tmpdir},
+                })
+
+    inventory = {'web': ['h1'], '_meta': {'hostvars': {'h1': {}}}}
+    with patch.object(daemon, '_load_config', load_config), \
+            patch.object(Stack, 'get_inventory', return_value=inventory), \
+            patch.object(Stack, 'deploy', deploy):
+        # the deploy process is forked with the patches in place
+        server = _start(daemon, socket_path)
+        try:
+            send_request(socket_path, 'list', ['st'])
+            client = threading.Thread(
+                    target=send_request,
+                    args=(socket_path, 'deploy', ['st']),
+                    kwargs={'ssh_user': 'deployer', 'playbooks': ['a.yml']},
+                    )
+            client.start()
+            T.ok_(deploying.wait(10))
+
+            # cached inventories are answered while the deploy runs
+            T.eq_(inventory, send_request(socket_path, 'list', ['st']))
+            T.ok_(client.is_alive())
+            finish.set()
+            client.join()
+            config = deployed.get(timeout=10)
+            T.eq_('deployer', config[A.DEPLOYER_CREDS][A.creds.SSH_USER])
+            T.eq_(['a.yml'], config[A.PLAYBOOKS])
+
+            # failed deploys are reported, and don't stop the deploy process
+            T.assert_raises(
+                    BangError,
+                    send_request,
+                    socket_path,
+                    'deploy',
+                    ['broken'],
+                    )
+            T.ok_(send_request(socket_path, 'deploy', ['st']))
+        finally:
+            finish.set()
+            daemon.stop()
+            server.join()
+            shutil.rmtree(tmpdir)
+    T.ok_(daemon.deployer.process is None)
+
+
+def test_config_specs_resolved_against_client_cwd():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(tmpdir, 'bang-stacks'))
+        with open(os.path.join(tmpdir, 'bang-stacks', 'st.yml'), 'w') as f:
+            f.write('name: st\nversion: "1.0"\n')
+        cwd = os.getcwd()
+        with patch.dict('os.environ', {'HOME': tmpdir}):
+            config = BangDaemon('')._load_config(['st'], tmpdir)
+        T.eq_(os.path.join(tmpdir, 'bang-stacks', 'st.yml'), config.filepath)
+        T.eq_('st', config[A.NAME])
+        T.eq_(cwd, os.getcwd())
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,87 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import nose.tools as T
+
+from bang import BangError
+from bang.config import Config
+from bang.deployers import unique_resources
+
+
+def test_unique_resources():
+    key = {
+            'name': 'deploy',
+            'key': 'ssh-rsa AAAA',
+            'provider': 'aws',
+            'region_name': 'us-east-1',
+            }
+    other_region = dict(key, region_name='us-west-2')
+    keys = [key, dict(key), other_region, dict(key)]
+    T.eq_([key, other_region], unique_resources('ssh_pub_keys', keys))
+
+    # not cloud resources
+    groups = [{'name': 'web'}, {'name': 'web'}]
+    T.eq_(groups, unique_resources('server_security_groups', groups))
+
+    # only shared resource types are deduplicated
+    servers = [
+            {'name': 'web', 'provider': 'aws', 'region_name': 'us-east-1'},
+            {'name': 'web', 'provider': 'aws', 'region_name': 'us-east-1'},
+            ]
+    T.eq_(servers, unique_resources('servers', servers))
+    rules = [
+            {'name': 'web', 'provider': 'aws', 'source': 'lb', 'port': 80},
+            {'name': 'web', 'provider': 'aws', 'source': 'lb', 'port': 443},
+            ]
+    T.eq_(rules, unique_resources('server_security_group_rules', rules))
+
+    T.assert_raises(
+            BangError,
+            unique_resources,
+            'ssh_pub_keys',
+            [key, dict(key, key='ssh-rsa BBBB')],
+            )
+
+
+def test_unique_resources_shared_ssh_key():
+    server = {
+            'provider': 'aws',
+            'region_name': 'us-east-1',
+            'ssh_key_name': 'deploy',
+            }
+    config = Config({
+        'name': 'st',
+        'version': '1.0',
+        'deployer_credentials': {'ssh_pub_keys': {'deploy': 'ssh-rsa AAAA'}},
+        'servers': {
+            'web': dict(server),
+            'db': dict(server),
+            'queue': dict(server, region_name='us-west-2'),
+            },
+        })
+    config.prepare()
+
+    # every server stanza contributes a record for its key...
+    keys = config['ssh_pub_keys']
+    T.eq_(3, len(keys))
+
+    # ... but each key is deployed once per provider and region
+    unique = unique_resources('ssh_pub_keys', keys)
+    T.eq_(
+            set(['us-east-1', 'us-west-2']),
+            set(k['region_name'] for k in unique),
+            )
+    T.eq_(2, len(unique))
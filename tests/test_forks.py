@@ -0,0 +1,42 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import mock
+import nose.tools as T
+
+from bang import forks
+from bang.attributes import ansible as A
+
+
+@mock.patch('bang.forks.available_memory_mb', return_value=1000)
+@mock.patch('multiprocessing.cpu_count', return_value=2)
+def test_choose_forks(cpu_count, memory):
+    T.eq_(3, forks.choose_forks(3, {}))
+    T.eq_(10, forks.choose_forks(50, {}))
+    T.eq_(16, forks.choose_forks(50, {A.MEMORY_PER_FORK_MB: 50}))
+    T.eq_(4, forks.choose_forks(50, {A.MAX_FORKS: 4}))
+    T.eq_(40, forks.choose_forks(50, {A.FORKS: 40}))
+    T.eq_(1, forks.choose_forks(0, {}))
+
+
+def test_fork_usage_counts_results():
+    usage = forks.ForkUsage(2)
+    stats = forks.AggregateStats(usage)
+    stats.compute({'contacted': {'a': {}, 'b': {}, 'c': {}}, 'dark': {}})
+    stats.compute({'contacted': {'a': {}}, 'dark': {'b': {}}})
+    stats.compute({'contacted': {}, 'dark': {}})
+    T.eq_([3, 2], usage.task_hosts)
+    T.eq_({'b': 1}, stats.dark)
@@ -0,0 +1,81 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import json
+import subprocess
+import sys
+import time
+
+import nose.tools as T
+from mock import patch
+from nose.plugins.attrib import attr
+
+from bang import BangError
+from bang.providers import PROVIDER_MAP, get_provider_class
+
+#: Heavy libraries that only configuring a stack, or talking to a provider,
+#: should import.
+LAZY_MODULES = (
+        'ansible',
+        'boto',
+        'novaclient',
+        'swiftclient',
+        'reddwarfclient',
+        'pymysql',
+        'rightscale',
+        )
+
+
+def import_cli():
+    """
+    Imports the ``bang`` command in a fresh interpreter.  Returns the names
+    of the imported modules and how long the import took, in seconds.
+
+    """
+    out = subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import json, sys, time\n'
+            't = time.time()\n'
+            'import bang.cmd_bang\n'
+            'print json.dumps([time.time() - t, sorted(sys.modules)])\n',
+            ])
+    elapsed, modules = json.loads(out)
+    return modules, elapsed
+
+
+def test_cli_imports_lazily():
+    modules, _ = import_cli()
+    loaded = sorted(set(
+            m.split('.')[0] for m in modules
+            if m.split('.')[0] in LAZY_MODULES
+            ))
+    T.eq_([], loaded)
+
+
+def test_provider_import_errors():
+    T.eq_(None, get_provider_class('nosuchcloud'))
+    with patch.dict(PROVIDER_MAP, {'broken': ('bang.providers.nosuch', 'X')}):
+        with T.assert_raises(BangError) as cm:
+            get_provider_class('broken')
+    T.ok_('bang.providers.nosuch' in str(cm.exception))
+
+
+@attr('bench')
+def test_bench_cli_import():
+    best = min(import_cli()[1] for _ in range(3))
+    print '%-40s %8.3f ms' % ('import bang.cmd_bang', best * 1000)
+    T.ok_(best < 0.5)
@@ -0,0 +1,66 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import shutil
+import tempfile
+
+import ansible.inventory
+import nose.tools as T
+from mock import patch
+
+from bang.inventory import BangsibleInventory
+
+
+def test_merged_hostvars_cache():
+    basedir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(basedir, 'group_vars'))
+        inventory = BangsibleInventory(
+                {'web': ['h1']},
+                {'h1': {'role': 'web', 'nested': {'a': 1}}},
+                )
+        inventory.set_playbook_basedir(basedir)
+
+        hvars = inventory.get_variables('h1')
+        T.eq_('web', hvars['role'])
+        T.eq_(['web'], hvars['group_names'])
+
+        # served from the cache, but never aliasing it
+        base = ansible.inventory.Inventory
+        with patch.object(base, 'get_variables') as base_get_variables:
+            hvars['role'] = 'changed'
+            hvars['nested']['a'] = 2
+            hvars['nested']['b'] = 3
+            again = inventory.get_variables('h1')
+            T.eq_('web', again['role'])
+            T.eq_({'a': 1}, again['nested'])
+        T.ok_(not base_get_variables.called)
+
+        # what the group_by action plugin does when it regroups a host
+        inventory._vars_per_host['h1'] = {}
+        del inventory._vars_per_host['h1']
+        T.ok_('h1' not in inventory._merged_vars)
+
+        # group vars files changed
+        inventory.get_variables('h1')
+        with open(os.path.join(basedir, 'group_vars', 'web'), 'w') as f:
+            f.write('color: blue\n')
+        inventory.set_playbook_basedir(os.path.join(basedir, 'x'))
+        inventory.set_playbook_basedir(basedir)
+        T.eq_('blue', inventory.get_variables('h1')['color'])
+    finally:
+        shutil.rmtree(basedir)
@@ -0,0 +1,85 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import nose.tools as T
+from mock import MagicMock, patch
+from nose.plugins.skip import SkipTest
+
+try:
+    from bang.providers.openstack import RedDwarf
+    from bang.providers.hpcloud import HPRedDwarf
+except ImportError:
+    raise SkipTest('The openstack client libraries are not installed')
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def spend(self, seconds, result=None):
+        """
+        Returns a side effect that takes :attr:`seconds` to return
+        :attr:`result`.
+
+        """
+        def side_effect(*args, **kwargs):
+            self.now += seconds
+            return result
+        return side_effect
+
+
+def _reddwarf(cls, clock):
+    # the status poll and the port probe use up 70 seconds of the budget
+    rd = cls.__new__(cls)
+    rd._poll_instance_status = MagicMock(
+            side_effect=clock.spend(40, MagicMock()),
+            )
+    rd._wait_for_port = MagicMock(side_effect=clock.spend(30))
+    return rd
+
+
+def test_wait_for_db_shares_timeout():
+    clock = FakeClock()
+    rd = _reddwarf(RedDwarf, clock)
+    with patch('bang.providers.openstack.time', clock), \
+            patch('bang.providers.openstack.db_to_dict'):
+        rd.wait_for_db(MagicMock(), 'admin', 'secret', timeout_s=100)
+    T.eq_(100, rd._poll_instance_status.call_args[0][1])
+    T.eq_(60, rd._wait_for_port.call_args[0][1])
+
+
+@patch('bang.providers.hpcloud.db_to_dict')
+@patch('bang.providers.hpcloud.poll_with_timeout')
+@patch('bang.providers.hpcloud.pymysql')
+def test_hp_wait_for_db_shares_timeout(mock_pymysql, mock_poll,
+        mock_db_to_dict):
+    clock = FakeClock()
+    rd = _reddwarf(HPRedDwarf, clock)
+
+    def poll(timeout_s, connect, *args, **kwargs):
+        clock.now += 10
+        return connect()
+    mock_poll.side_effect = poll
+
+    with patch('bang.providers.hpcloud.time', clock):
+        rd.wait_for_db(MagicMock(), 'admin', 'secret', timeout_s=100)
+    T.eq_(100, rd._poll_instance_status.call_args[0][1])
+    T.eq_(60, rd._wait_for_port.call_args[0][1])
+    T.eq_(30, mock_poll.call_args[0][0])
+    T.eq_(20, mock_pymysql.connect.call_args[1]['connect_timeout'])
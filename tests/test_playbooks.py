@@ -0,0 +1,59 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import nose.tools as T
+from ansible.callbacks import AggregateStats
+
+from bang import BangError
+from bang.playbooks import (get_dependencies, get_playbooks, is_parallel,
+        merge_stats, stats_to_dict)
+
+
+def test_playbook_dependencies():
+    entries = [
+            'common.yml',
+            {'playbook': 'db.yml', 'groups': ['db']},
+            {'playbook': 'web.yml', 'groups': ['web']},
+            {'playbook': 'app.yml', 'groups': ['app'], 'after': ['db.yml']},
+            {'playbook': 'lb.yml', 'groups': ['web', 'lb']},
+            'monitoring.yml',
+            ]
+    T.ok_(is_parallel(entries))
+    T.ok_(not is_parallel(['a.yml', 'b.yml']))
+    playbooks = get_playbooks(entries)
+    T.eq_(
+            [set(), set([0]), set([0]), set([0, 1]), set([0, 2]),
+                set([0, 1, 2, 3, 4])],
+            get_dependencies(playbooks),
+            )
+    T.eq_(2, playbooks[4].host_count(
+            {'web': ['h1', 'h2'], 'lb': ['h2'], 'db': ['h3']},
+            ['h1', 'h2', 'h3'],
+            ))
+    T.assert_raises(
+            BangError,
+            get_dependencies,
+            get_playbooks([{'playbook': 'a.yml', 'after': ['b.yml']}]),
+            )
+
+
+def test_merge_stats():
+    one = AggregateStats()
+    one.compute({'contacted': {'h1': {}}, 'dark': {'h2': {}}})
+    merged = merge_stats(AggregateStats(), stats_to_dict(one))
+    merge_stats(merged, stats_to_dict(one))
+    T.eq_({'h1': 2}, merged.ok)
+    T.eq_({'h2': 2}, merged.dark)
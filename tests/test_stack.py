@@ -0,0 +1,179 @@
+# Copyright 2012 - John Calixto
+#
+# This file is part of bang.
+#
+# bang is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# bang is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with bang.  If not, see <http://www.gnu.org/licenses/>.
+import multiprocessing
+import shutil
+import tempfile
+
+import nose.tools as T
+from mock import patch
+
+from bang import BangError
+from bang.cache import ConfigureState
+from bang.config import Config
+from bang.stack import Stack
+from bang.util import LocalManager
+
+
+def test_pipeline_ready_hosts():
+    config = Config({
+        'name': 'st',
+        'version': '1.0',
+        'deployer_credentials': {},
+        'ansible': {'group_dependencies': {'app': ['db']}},
+        'servers': {
+            'web': {'hostname': 'h1', 'groups': ['web']},
+            'app': {'hostname': 'h2', 'groups': ['app']},
+            'db': {'hostname': 'h3', 'groups': ['db']},
+            },
+        })
+    config.prepare()
+    stack = Stack(config)
+    stack.have_inventory = True
+
+    for name, host in (('web', 'h1'), ('app', 'h2')):
+        stack.add_host(host, [name])
+        stack.server_ready(name)
+    # app waits for db to be deployed and configured
+    T.eq_(set(['h1']), stack._ready_hosts(set(), False))
+
+    stack.add_host('h3', ['db'])
+    stack.server_ready('db')
+    T.eq_(set(['h3']), stack._ready_hosts(set(['h1']), False))
+    T.eq_(set(['h2']), stack._ready_hosts(set(['h1', 'h3']), False))
+
+
+def test_class_vars_stored_once():
+    config = Config({
+        'name': 'st',
+        'version': '1.0',
+        'deployer_credentials': {},
+        'common': {'ntp_servers': ['ntp1', 'ntp2']},
+        'servers': {
+            'web': {
+                'hostname': 'h1',
+                'groups': ['web'],
+                'config_scopes': ['common'],
+                },
+            },
+        })
+    config.prepare()
+    stack = Stack(config)
+    stack.have_inventory = True
+
+    svars = config['servers'][0]['hostvars']
+    stack.add_host('h1', ['web'], svars)
+    stack.add_host('h2', ['web'], dict(svars, role='primary'))
+    _, hostvars = stack.get_inventory_snapshot()
+    T.ok_('common' not in hostvars['h1'])
+    T.eq_('primary', hostvars['h2']['role'])
+    T.eq_('web', hostvars['h2']['server_class'])
+
+    inventory = stack.get_inventory()
+    for host in ('h1', 'h2'):
+        hvars = inventory['_meta']['hostvars'][host]
+        T.eq_({'ntp_servers': ['ntp1', 'ntp2']}, hvars['common'])
+        T.eq_(host, hvars['inventory_hostname'])
+
+
+def test_shared_state_starts_local():
+    config = Config({
+        'name': 'st',
+        'version': '1.0',
+        'deployer_credentials': {},
+        })
+    config.prepare()
+    stack = Stack(config)
+    stack.have_inventory = True
+    T.ok_(isinstance(stack.manager, LocalManager))
+
+    stack.add_host('h1', ['web'], {'role': 'web'})
+    ns = stack.get_namespace('web')
+    T.ok_(ns.add_if_unique('web-1'))
+
+    # moved to a manager before forking, so children can add to it
+    stack._share_state()
+    T.ok_(not isinstance(stack.manager, LocalManager))
+    child = multiprocessing.Process(
+            target=stack.add_host,
+            args=('h2', ['web'], {'role': 'web'}),
+            )
+    child.start()
+    child.join()
+    groups, hostvars = stack.get_inventory_snapshot()
+    T.eq_(['h1', 'h2'], sorted(groups['web']))
+    T.eq_('web', hostvars['h1']['role'])
+    T.ok_(not ns.add_if_unique('web-1'))
+
+
+@patch('bang.stack.time.sleep')
+@patch('ansible.runner.Runner')
+def test_prewarm_connections(runner, sleep):
+    stack = Stack(Config({'name': 'st', 'version': '1.0'}))
+    pb_kwargs = {'forks': 5, 'transport': 'ssh', 'vault_password': None}
+
+    # h2 answers on the second attempt
+    runner.return_value.run.side_effect = [
+            {'contacted': {'h1': {}}, 'dark': {'h2': {'msg': 'timed out'}}},
+            {'contacted': {'h2': {}}, 'dark': {}},
+            ]
+    T.eq_([], stack._prewarm_connections(['h1', 'h2'], pb_kwargs, 2))
+    T.eq_(['h2'], runner.call_args[1]['run_hosts'])
+    T.eq_(1, sleep.call_count)
+
+    # h2 never answers
+    runner.reset_mock()
+    runner.return_value.run.side_effect = None
+    runner.return_value.run.return_value = {
+            'contacted': {},
+            'dark': {'h2': {'msg': 'timed out'}},
+            }
+    T.eq_(['h2'], stack._prewarm_connections(['h1', 'h2'], pb_kwargs, 2))
+    T.eq_(3, runner.call_count)
+
+
+def test_configure_skips_unreachable_hosts():
+    cache_dir = tempfile.mkdtemp()
+    config = Config({
+        'name': 'st',
+        'version': '1.0',
+        'deployer_credentials': {},
+        'playbooks': ['site.yml'],
+        'inventory_cache': {'dir': cache_dir},
+        })
+    config.prepare()
+    stack = Stack(config)
+    stack.have_inventory = True
+    stack.add_host('h1', ['web'], {'role': 'web'})
+    stack.add_host('h2', ['web'], {'role': 'web'})
+
+    configured = []
+
+    def run_playbook(stack, playbook, playbook_dir, pb_kwargs, usage,
+            verbosity):
+        configured.extend(h.name for h in pb_kwargs['inventory'].get_hosts())
+
+    try:
+        with patch.object(Stack, '_prewarm_connections',
+                    return_value=['h2']), \
+                patch.object(Stack, '_run_playbook', run_playbook):
+            T.assert_raises(BangError, stack.configure)
+        # the reachable host is configured, and recorded as such
+        T.eq_(['h1'], configured)
+        state = ConfigureState(config).load()
+        T.eq_(['h1'], sorted(state.hosts))
+    finally:
+        shutil.rmtree(cache_dir)
@@ -15,7 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with bang.  If not, see <http://www.gnu.org/licenses/>.
 import bang.util as U
+import copy
+import multiprocessing
+import socket
+import threading
 import nose.tools as T
+from mock import patch
+
+from bang import attributes as A
 
 
 def test_deep_merge_dicts():
@@ -86,3 +93,235 @@ def test_deep_merge_dicts():
             }
     U.deep_merge_dicts(a, b)
     T.eq_(exp, a)
+
+
+def test_merge_frozen():
+    shared = {'x': [1, 2]}
+    base = U.freeze({'a': {'b': 1, 'c': shared}, 'd': shared, 'e': {'f': 1}})
+    T.ok_(base['a']['c'] is base['d'])
+    T.assert_raises(TypeError, base['a'].__setitem__, 'b', 2)
+
+    merged = U.merge_frozen(base, {'a': {'b': 2}, 'g': 3})
+    T.eq_({'b': 2, 'c': {'x': [1, 2]}}, merged['a'])
+    T.eq_(1, base['a']['b'])
+    # untouched subtrees are shared
+    T.ok_(merged['e'] is base['e'])
+    T.ok_(merged['a']['c'] is base['a']['c'])
+
+    # copies are mutable
+    top = merged.copy()
+    top['g'] = 4
+    T.eq_(3, merged['g'])
+    deep = copy.deepcopy(merged)
+    deep['a']['c']['x'].append(3)
+    T.eq_([1, 2], merged['a']['c']['x'])
+
+
+def test_thaw():
+    frozen = U.freeze({
+        'a': {'b': {'c': 1}},
+        'l': [{'x': 1}, 2],
+        'd': {'e': 1},
+        })
+    thawed = U.thaw(frozen)
+    T.eq_(frozen, thawed)
+
+    # nested mappings are copied when they are first read
+    thawed['a']['b']['c'] = 2
+    thawed['a']['b']['f'] = 3
+    T.eq_({'c': 2, 'f': 3}, thawed['a']['b'])
+    T.eq_(1, frozen['a']['b']['c'])
+    thawed['l'][0]['x'] = 2
+    thawed['l'].append(3)
+    T.eq_([{'x': 1}, 2], frozen['l'])
+    for k, v in thawed.iteritems():
+        if k == 'd':
+            v['e'] = 2
+    T.eq_(2, thawed.get('d')['e'])
+    T.eq_(1, frozen['d']['e'])
+
+    # copies don't share the parts that are still frozen
+    other = U.thaw(frozen)
+    top = other.copy()
+    top['a']['b']['c'] = 4
+    T.eq_(1, other['a']['b']['c'])
+    T.eq_({'c': 1}, other.pop('a')['b'])
+    T.ok_(type(copy.deepcopy(thawed)['d']) is dict)
+
+
+def test_shared_name_index():
+    listings = []
+
+    def list_func():
+        listings.append(1)
+        return [('a', {'id': 1}), ('b', {'id': 2}), ('a', {'id': 3})]
+
+    index = U.SharedNameIndex(multiprocessing.Manager())
+    T.eq_([{'id': 1}, {'id': 3}], index.get('a', list_func))
+    T.eq_([{'id': 2}], index.get('b', list_func))
+    T.eq_([], index.get('c', list_func))
+    T.eq_(1, len(listings))
+
+    index.invalidate()
+    index.get('a', list_func)
+    T.eq_(2, len(listings))
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _poll(timeout_s, break_func, *args, **kwargs):
+    clock = FakeClock()
+    with patch.object(U.time, 'time', clock.time):
+        with patch.object(U.time, 'sleep', clock.sleep):
+            res = U.poll_with_timeout(timeout_s, break_func(clock), *args,
+                    **kwargs)
+    return res, clock
+
+
+def test_poll_with_timeout_backoff():
+    res, clock = _poll(
+            100,
+            lambda clock: lambda: None,
+            5,
+            jitter=0,
+            backoff=2,
+            max_wake_s=20,
+            )
+    T.eq_(None, res)
+    T.eq_([5, 10, 20, 20, 20, 20, 5], clock.sleeps)
+
+
+def test_poll_with_timeout_counts_break_func_time():
+    def slow(clock):
+        def break_func():
+            clock.now += 30
+        return break_func
+    res, clock = _poll(100, slow, 10, jitter=0, backoff=1)
+    T.eq_(None, res)
+    T.eq_([10, 10], clock.sleeps)
+
+
+def test_poll_with_timeout_fast_phase():
+    def ready_at(when):
+        def factory(clock):
+            start = clock.now
+            return lambda: True if clock.now - start >= when else None
+        return factory
+    res, clock = _poll(100, ready_at(3), 20, jitter=0, fast_phase_s=10,
+            fast_wake_s=1)
+    T.eq_(True, res)
+    T.eq_([1, 1, 1], clock.sleeps)
+
+
+def test_poll_with_timeout_config():
+    U.configure_polling({'polling': {'servers': {'wake_every_s': 1}}})
+    try:
+        res, clock = _poll(3, lambda clock: lambda: None, 20, jitter=0,
+                backoff=1, policy='servers')
+        T.eq_([1, 1, 1], clock.sleeps)
+        T.assert_raises(
+                ValueError,
+                U.configure_polling,
+                {'polling': {'servers': {'wake_evry_s': 1}}},
+                )
+    finally:
+        U.configure_polling({})
+
+
+def test_probes_ignore_resource_tuning():
+    # nothing listens on the port, so the probe polls until the timeout
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+
+    U.configure_polling({'polling': {'servers': {'wake_every_s': 10}}})
+    clock = FakeClock()
+    try:
+        with patch.object(U.time, 'time', clock.time), \
+                patch.object(U.time, 'sleep', clock.sleep), \
+                patch.object(U.random, 'uniform', return_value=0):
+            T.ok_(not U.wait_for_tcp_port('127.0.0.1', port, 7,
+                    policy=A.polling.SSH_PROBE))
+        T.eq_([1, 2, 4], clock.sleeps)
+    finally:
+        U.configure_polling({})
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    with patch.object(U.time, 'time', clock.time):
+        with patch.object(U.time, 'sleep', clock.sleep):
+            bucket = U.TokenBucket(10, 2)
+            waits = [bucket.acquire() for _ in range(4)]
+    T.eq_(4, bucket.calls)
+    T.eq_([0, 0], waits[:2])
+    T.assert_almost_equal(0.1, waits[2])
+    T.assert_almost_equal(0.1, waits[3])
+    T.assert_almost_equal(0.2, bucket.waited_s)
+
+
+def test_adaptive_concurrency():
+    limiter = U.AdaptiveConcurrency(8)
+    T.eq_(8, limiter.limit)
+    limiter.throttled()
+    limiter.throttled()
+    T.eq_(2, limiter.limit)
+    T.eq_(2, limiter.throttles)
+
+    # never drops below the minimum
+    for _ in range(5):
+        limiter.throttled()
+    T.eq_(1, limiter.limit)
+
+    # additive increase: about one more slot per full window of successes
+    limiter.succeeded()
+    T.eq_(2, limiter.limit)
+    limiter.succeeded()
+    limiter.succeeded()
+    T.eq_(2, limiter.limit)
+    limiter.succeeded()
+    T.eq_(3, limiter.limit)
+    for _ in range(100):
+        limiter.succeeded()
+    T.eq_(8, limiter.limit)
+    T.eq_(1, limiter.lowest_limit)
+
+    limiter.acquire()
+    T.eq_(1, int(limiter.state[1]))
+    limiter.release()
+    T.eq_(0, int(limiter.state[1]))
+
+
+def test_wait_for_tcp_port_banner():
+    def serve(greetings):
+        for greeting in greetings:
+            conn, _ = listener.accept()
+            conn.sendall(greeting)
+            conn.close()
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(2)
+    port = listener.getsockname()[1]
+    server = threading.Thread(target=serve, args=(['', 'SSH-2.0-Test\r\n'],))
+    server.start()
+    try:
+        with patch('time.sleep') as sleep:
+            T.ok_(U.wait_for_tcp_port('127.0.0.1', port, 10, banner='SSH-'))
+            # the first connection closed without a greeting
+            T.eq_(1, sleep.call_count)
+    finally:
+        server.join()
+        listener.close()